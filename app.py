@@ -1,157 +1,101 @@
 import atexit
+import hmac
 import json
-import os
 import time
 
 from flask import Flask, Response, jsonify, render_template, request
+from flask import session as cookie_session
 from config import Config
 from services import (
+    inference_scheduler,
+    ollama_backends,
     ollama_service,
     comfyui_service,
-    image_trigger,
     memory_service,
     inner_monologue,
     delivery_service,
     web_search_service,
     ping_service,
+    profiles,
+    sessions,
+    shared_state,
+    leader,
+    load_governor,
+    metrics,
+    profiler,
+    warmup,
 )
-from services.emotion_state import tracker as emotion_tracker
+from services.chat_turn import ChatTurn
 
 app = Flask(__name__)
 app.config.from_object(Config)
 
-# In-memory conversation history (short-term, single-user)
-conversation_history = []
-_pending_memory_exchanges = []  # Buffer for batched memory storage
-_message_counter = 0            # Counts messages for periodic forced-recall
+_IMAGE_TIMEOUT = 120
 
 
-def load_profile():
-    """Load the persona profile JSON. Returns (system_prompt, raw_profile)."""
-    path = Config.PROFILE_PATH
-    if not os.path.exists(path):
-        return "You are a helpful assistant.", {}
-    with open(path, "r") as f:
-        profile = json.load(f)
-
-    parts = [f"You are {profile.get('name', 'an AI assistant')}."]
-
-    if profile.get("backstory"):
-        parts.append(profile["backstory"])
-    if profile.get("personality_traits"):
-        parts.append(
-            f"Personality traits: {', '.join(profile['personality_traits'])}."
-        )
-    if profile.get("speaking_style"):
-        parts.append(f"Speaking style: {profile['speaking_style']}.")
-    if profile.get("tone"):
-        parts.append(f"Tone: {profile['tone']}.")
-    if profile.get("interests"):
-        parts.append(f"Interests: {', '.join(profile['interests'])}.")
-    if profile.get("expertise"):
-        parts.append(f"Areas of expertise: {', '.join(profile['expertise'])}.")
-    if profile.get("quirks"):
-        parts.append(f"Quirks: {', '.join(profile['quirks'])}.")
-    if profile.get("emoji_usage"):
-        parts.append(f"Emoji usage: {profile['emoji_usage']}.")
-    if profile.get("response_length"):
-        parts.append(f"Response length: {profile['response_length']}.")
-    if profile.get("relationship_to_user"):
-        parts.append(f"Relationship to user: {profile['relationship_to_user']}.")
-    if profile.get("boundaries"):
-        parts.append(f"Boundaries: {profile['boundaries']}.")
-    if profile.get("texting_style"):
-        parts.append(f"Texting style: {profile['texting_style']}.")
-    if profile.get("emotional_range"):
-        parts.append(f"Emotional range: {profile['emotional_range']}.")
-    if profile.get("custom_instructions"):
-        parts.append(profile["custom_instructions"])
-
-    return " ".join(parts), profile
-
-
-PERSONA_CONTEXT, _PROFILE = load_profile()
-_IMAGE_SETTINGS = {
-    "negative_prompt": _PROFILE.get("image_negative_prompt", ""),
-    "prompt_prefix": _PROFILE.get("image_prompt_prefix", ""),
-    "prompt_suffix": _PROFILE.get("image_prompt_suffix", ""),
-}
-_IMAGE_FREQUENCY = _PROFILE.get(
-    "image_generation_frequency",
-    "only when a visual would genuinely add value",
+# Current values for /metrics, read at scrape time
+metrics.gauge(
+    "vessel_inference_queued", "Ollama calls waiting for a slot, by priority class.",
+    lambda: [({"priority": name}, c["queued"])
+             for name, c in inference_scheduler.stats()["classes"].items()],
+)
+metrics.gauge(
+    "vessel_inference_running", "Ollama calls holding a slot, by priority class.",
+    lambda: [({"priority": name}, c["running"])
+             for name, c in inference_scheduler.stats()["classes"].items()],
+)
+metrics.gauge(
+    "vessel_inference_slots", "Inference slots across healthy backends.",
+    lambda: [({}, inference_scheduler.stats()["limit"])],
+)
+metrics.gauge(
+    "vessel_backend_inflight", "Calls running on each Ollama backend.",
+    lambda: [({"backend": b["url"]}, b["inflight"]) for b in ollama_backends.status()],
+)
+metrics.gauge(
+    "vessel_backend_healthy", "Whether each Ollama backend passed its last check.",
+    lambda: [({"backend": b["url"]}, b["healthy"]) for b in ollama_backends.status()],
+)
+metrics.gauge(
+    "vessel_sessions_live", "Sessions held in this process's memory.",
+    lambda: [({}, len(sessions.live()))],
+)
+metrics.gauge(
+    "vessel_degradation_level",
+    "Load governor level: 0 full, up to 4 with the monologue replaced.",
+    lambda: [({}, load_governor.status()["level"])],
+)
+metrics.gauge(
+    "vessel_memory_jobs_queued",
+    "Memory batches waiting for consolidation, across all workers.",
+    lambda: [({}, shared_state.memory_jobs_queued())],
+    cluster=True,
 )
-_IMAGE_PROMPT_INSTRUCTIONS = _PROFILE.get("image_prompt_instructions", "")
-
-
-def build_response_system_prompt(thinking, memory_context="", search_context=""):
-    """Build the system prompt for the response generator using
-    the inner monologue's output."""
-    parts = [PERSONA_CONTEXT]
-
-    if search_context:
-        parts.append(
-            f"\nWeb search results (use to inform your response, cite naturally):\n{search_context}"
-        )
-
-    if memory_context:
-        parts.append(f"\nRelevant context from past conversations:\n{memory_context}")
-
-    # Inject the inner monologue's guidance
-    parts.append(f"\nYour inner thoughts about this moment:\n{thinking.get('inner_thoughts', '')}")
-    parts.append(f"\nResponse strategy: {thinking.get('response_strategy', 'be natural')}")
-    parts.append(f"Tone to use: {thinking.get('tone', 'warm and casual')}")
-    parts.append(f"Message style: {thinking.get('message_style', 'single short message')}")
-
-    target_count = thinking.get("message_count", 1)
-    if target_count > 1:
-        parts.append(
-            f"\nIMPORTANT: Structure your reply as {target_count} separate short messages, "
-            f"separated by double newlines. Write like you're texting — short, natural, "
-            f"conversational. Do NOT write a single long block of text."
-        )
-    else:
-        parts.append(
-            "\nKeep your reply concise and natural, like a single text message."
-        )
-
-    key_points = thinking.get("key_points", [])
-    if key_points:
-        parts.append(f"\nKey points to address: {', '.join(key_points)}")
-
-    # Image generation (decided by inner monologue)
-    if thinking.get("should_generate_image") and thinking.get("image_prompt"):
-        parts.append(
-            "\nInclude this image generation tag at the end of your reply:\n"
-            f"[GENERATE_IMAGE: {thinking['image_prompt']}]"
-        )
-
-    return "\n".join(parts)
-
-
-def _should_recall(thinking):
-    """Determine whether to run a long-term memory recall."""
-    history_len = len(conversation_history)
 
-    # Always recall on the very first message of a session
-    if history_len <= 1:
-        return True
 
-    # Periodic forced recall as a safety net
-    if _message_counter % Config.MEMORY_FORCED_RECALL_INTERVAL == 0:
-        return True
+def _current_session():
+    """The caller's conversation session, keyed by a signed cookie."""
+    session_id = cookie_session.get("sid")
+    if not session_id:
+        session_id = cookie_session["sid"] = sessions.new_id()
+        cookie_session.permanent = True
+    return sessions.get(session_id)
 
-    # Short conversation: skip unless monologue explicitly requests it
-    if history_len < Config.MEMORY_SHORT_CONV_THRESHOLD:
-        return False
 
-    # Defer to the inner monologue's judgment
-    return thinking.get("needs_memory_lookup", False)
+def _commit_turn(turn, bot_response):
+    """Record a turn's answered burst in the conversation history."""
+    session = turn.session
+    session.turns.commit(len(turn.burst))
+    session.add_message("user", turn.message)
+    session.add_message("assistant", bot_response)
+    session.save_state()
+    sessions.note_activity(session)
 
 
-def _maybe_remember(user_message, bot_response, thinking):
+def _maybe_remember(session, user_message, bot_response, thinking):
     """Conditionally store the exchange in long-term memory."""
     # Never store if conversation is very short
-    if len(conversation_history) < Config.MEMORY_SHORT_CONV_THRESHOLD:
+    if len(session.history) < Config.MEMORY_SHORT_CONV_THRESHOLD:
         return
 
     # Check if the monologue thinks this is worth storing
@@ -159,127 +103,250 @@ def _maybe_remember(user_message, bot_response, thinking):
         return
 
     # Add to pending buffer
-    _pending_memory_exchanges.append((user_message, bot_response))
+    session.pending_memory.append((user_message, bot_response))
 
     # Flush the buffer when it reaches batch size
-    if len(_pending_memory_exchanges) >= Config.MEMORY_BATCH_SIZE:
-        _flush_memory_buffer()
+    if len(session.pending_memory) >= Config.MEMORY_BATCH_SIZE:
+        _flush_memory_buffer(session)
+    session.save_state()
 
 
-def _flush_memory_buffer():
-    """Store all pending exchanges in long-term memory at once."""
-    if not _pending_memory_exchanges:
+def _flush_memory_buffer(session):
+    """Queue all pending exchanges for long-term memory at once; the leader
+    process stores them (see services/leader.py)."""
+    if not session.pending_memory:
         return
-    try:
-        combined = "\n\n".join(
-            f"User: {um}\nAssistant: {br}"
-            for um, br in _pending_memory_exchanges
-        )
-        memory_service.batch_remember(combined)
-    except Exception:
-        pass
-    finally:
-        _pending_memory_exchanges.clear()
+    combined = "\n\n".join(
+        f"User: {um}\nAssistant: {br}"
+        for um, br in session.pending_memory
+    )
+    shared_state.enqueue_memory(session.id, combined)
+    session.pending_memory.clear()
 
 
-atexit.register(_flush_memory_buffer)
+@atexit.register
+def _flush_all_memory_buffers():
+    for session in sessions.live():
+        if session.pending_memory:
+            _flush_memory_buffer(session)
+            session.save_state()
 
 
 @app.route("/")
 def index():
-    return render_template("index.html", chatbot_name=_PROFILE.get("name", "Vessel"))
-
-
-@app.route("/api/chat", methods=["POST"])
-def chat():
-    global _message_counter
-
-    user_message = request.json.get("message", "")
-    if not user_message:
-        return jsonify({"error": "No message provided"}), 400
+    return render_template("index.html", chatbot_name=profiles.get().name)
 
-    conversation_history.append({"role": "user", "content": user_message})
-    _message_counter += 1
 
-    # Step 1: Inner monologue FIRST — emotion + planning + memory gating (1 Ollama call)
-    emotion_history = emotion_tracker.get_history_string()
-    thinking = inner_monologue.think(
-        conversation_history, PERSONA_CONTEXT, emotion_history,
-        image_frequency=_IMAGE_FREQUENCY,
-        image_prompt_instructions=_IMAGE_PROMPT_INSTRUCTIONS,
-    )
-
-    # Update emotion tracker with results
-    emotion_tracker.update(
-        thinking.get("user_emotion", "neutral"),
-        thinking.get("emotional_shift", "stable"),
-    )
+def _sse(payload):
+    """Encode one server-sent event frame."""
+    return f"data: {json.dumps(payload)}\n\n"
 
-    # Step 2: Conditionally run web search
-    search_context = ""
-    if thinking.get("needs_web_search") and thinking.get("search_query"):
-        search_context = web_search_service.search(thinking["search_query"])
 
-    # Step 3: Conditionally retrieve memory context
-    memory_context = ""
-    if _should_recall(thinking):
-        memory_context = memory_service.recall(user_message)
+# Written while a turn is in flight so a vanished client surfaces as a
+# failed write (and thus GeneratorExit) instead of going unnoticed.
+_KEEPALIVE = ": keepalive\n\n"
+_KEEPALIVE_INTERVAL = 1.0
 
-    # Step 4: Build the guided system prompt
-    system_prompt = build_response_system_prompt(thinking, memory_context, search_context)
-    target_message_count = thinking.get("message_count", 1)
-
-    def generate():
-        # Step 4: Generate response (streamed from Ollama — 2nd Ollama call)
-        full_response = ""
-        try:
-            for chunk in ollama_service.stream_chat(
-                conversation_history, system_prompt=system_prompt
-            ):
-                full_response += chunk
-        except Exception as e:
-            yield f"data: {json.dumps({'type': 'error', 'message': str(e)})}\n\n"
-            yield 'data: {"type": "done"}\n\n'
-            return
+def _wait_alive(cancelled, seconds):
+    """cancelled.wait(seconds) for a streaming generator: waits in
+    _KEEPALIVE_INTERVAL slices and yields a keepalive between them, so a
+    client that left mid-wait raises GeneratorExit within a second. Use
+    with `yield from`; returns True if the turn was cancelled."""
+    deadline = time.time() + seconds
+    while True:
+        remaining = deadline - time.time()
+        if remaining <= 0:
+            return False
+        if cancelled.wait(min(remaining, _KEEPALIVE_INTERVAL)):
+            return True
+        if deadline - time.time() > 0:
+            yield _KEEPALIVE
 
-        # Step 5: Clean up and check for image tags
-        image_prompt = image_trigger.check_response(full_response)
-        cleaned = image_trigger.clean_response(full_response)
 
-        # Step 6: Split into messages and deliver with realistic timing
-        messages = delivery_service.split_response(cleaned, target_message_count)
+# Ping push channel: heartbeat comments keep proxies from timing out idle
+# streams; the retry hint tells EventSource how soon to reconnect.
+_PING_HEARTBEAT_INTERVAL = 20
+_PING_RETRY_MS = 5000
 
-        for i, msg in enumerate(messages):
-            if i > 0:
-                delay = delivery_service.inter_message_delay()
-                yield f"data: {json.dumps({'type': 'typing', 'delay': delay})}\n\n"
-                time.sleep(delay / 1000.0)
 
-            typing_delay = delivery_service.calculate_delay(msg)
-            yield f"data: {json.dumps({'type': 'typing', 'delay': typing_delay})}\n\n"
-            time.sleep(typing_delay / 1000.0)
+@app.route("/api/chat", methods=["POST"])
+def chat():
+    user_message = request.json.get("message", "")
+    if not user_message:
+        return jsonify({"error": "No message provided"}), 400
 
-            yield f"data: {json.dumps({'type': 'message', 'content': msg})}\n\n"
+    session = _current_session()
+    session.message_counter += 1
+    sessions.note_activity(session)
 
-        # Store cleaned full response in conversation history
-        conversation_history.append({"role": "assistant", "content": cleaned})
+    # A new message supersedes whatever turn is still in flight; that
+    # turn's unanswered messages are merged into this one
+    cancelled = session.turns.submit(user_message)
+    profile = profiles.get()
+    instant = delivery_service.mode(
+        request.json.get("delivery"), profile.delivery
+    ) == "instant"
 
-        # Step 7: Handle image generation if triggered
-        if image_prompt:
-            yield f"data: {json.dumps({'type': 'image_generating', 'prompt': image_prompt})}\n\n"
+    def generate():
+        stream = None
+        pending_prompt_id = None
+        try:
+            # Step 0: Debounce — a follow-up inside the window takes over
+            if cancelled.wait(Config.CHAT_DEBOUNCE_MS / 1000.0):
+                metrics.set_outcome("superseded")
+                yield _sse({"type": "superseded"})
+                yield 'data: {"type": "done"}\n\n'
+                return
+            turn = ChatTurn(session, profile, cancelled, instant)
+
+            # Step 1: Inner monologue FIRST — emotion + planning + memory gating (1 Ollama call)
+            thinking = None
+            if turn.runs("monologue"):
+                with metrics.stage("monologue"):
+                    thinking = inner_monologue.think(
+                        turn.history,
+                        emotion_history=session.emotion.get_history_string(),
+                        system_prompt=profile.monologue_prompt,
+                        cancel_event=cancelled,
+                        session_key=session.id,
+                    )
+                if cancelled.is_set():
+                    yield 'data: {"type": "done"}\n\n'
+                    return
+                yield _KEEPALIVE
+            turn.plan(thinking)
+
+            # Step 2: Conditionally run web search
+            search_context = ""
+            query = turn.search_query()
+            if query:
+                with metrics.stage("web_search"):
+                    search_context = web_search_service.search(query)
+                yield _KEEPALIVE
+
+            # Step 3: Conditionally retrieve memory context
+            memory_context = ""
+            if turn.wants_recall():
+                with metrics.stage("recall"):
+                    memory_context = memory_service.recall(
+                        turn.message, session.id, cancelled
+                    )
+                yield _KEEPALIVE
+
+            if cancelled.is_set():
+                yield 'data: {"type": "done"}\n\n'
+                return
+
+            # Step 4-5: Guided system prompt, streamed reply (2nd Ollama
+            # call). In instant mode the visible text goes out as it arrives
+            last_write = time.time()
             try:
-                image_url = comfyui_service.generate_image(image_prompt, **_IMAGE_SETTINGS)
-                yield f"data: {json.dumps({'type': 'image', 'url': image_url})}\n\n"
+                stream = ollama_service.stream_chat(
+                    turn.history,
+                    system_prompt=turn.system_prompt(memory_context, search_context),
+                    cancel_event=cancelled, session_key=session.id,
+                )
+                with metrics.stage("reply"):
+                    for chunk in stream:
+                        delta = turn.feed(chunk)
+                        if delta:
+                            last_write = time.time()
+                            yield _sse(delta)
+                        elif time.time() - last_write >= _KEEPALIVE_INTERVAL:
+                            last_write = time.time()
+                            yield _KEEPALIVE
+                delta = turn.end_stream()
+                if delta:
+                    yield _sse(delta)
             except Exception as e:
-                yield f"data: {json.dumps({'type': 'error', 'message': f'Image generation failed: {e}'})}\n\n"
-
-        yield 'data: {"type": "done"}\n\n'
+                metrics.set_outcome("error")
+                yield _sse({"type": "error", "message": str(e)})
+                yield 'data: {"type": "done"}\n\n'
+                return
+            if cancelled.is_set():
+                reply = turn.partial_reply()
+                if reply:
+                    _commit_turn(turn, reply)
+                yield 'data: {"type": "done"}\n\n'
+                return
+
+            # Step 6-7: Clean up, split and deliver with realistic timing (in
+            # instant mode the text is already out; the split replaces it)
+            turn.finish_reply()
+            if instant:
+                event, reply = turn.instant_reply()
+                yield _sse(event)
+                _commit_turn(turn, reply)
+            else:
+                delivery_started = time.perf_counter()
+                try:
+                    for event, wait in turn.delivery():
+                        yield _sse(event)
+                        if wait and (yield from _wait_alive(cancelled, wait)):
+                            break
+                finally:
+                    metrics.observe_stage(
+                        "delivery", time.perf_counter() - delivery_started
+                    )
+                    reply = turn.delivered_reply()
+                    if reply:
+                        _commit_turn(turn, reply)
+
+            if cancelled.is_set():
+                yield 'data: {"type": "done"}\n\n'
+                return
+
+            # Step 8: Handle image generation if triggered
+            if turn.image_prompt:
+                yield _sse({"type": "image_generating", "prompt": turn.image_prompt})
+                image_started = time.perf_counter()
+                try:
+                    pending_prompt_id = comfyui_service.submit_image(
+                        turn.image_prompt, **profile.image_settings
+                    )
+                    history = None
+                    deadline = time.time() + _IMAGE_TIMEOUT
+                    while history is None:
+                        if time.time() > deadline:
+                            raise TimeoutError(
+                                f"ComfyUI did not complete prompt "
+                                f"{pending_prompt_id} within {_IMAGE_TIMEOUT}s"
+                            )
+                        if cancelled.wait(1.0):
+                            break
+                        yield _KEEPALIVE
+                        history = comfyui_service.get_history(pending_prompt_id)
+                    if history is not None:
+                        image_url = comfyui_service.save_output(
+                            pending_prompt_id, history
+                        )
+                        pending_prompt_id = None
+                        metrics.observe_stage(
+                            "image", time.perf_counter() - image_started
+                        )
+                        yield _sse({"type": "image", "url": image_url})
+                except Exception as e:
+                    yield _sse({"type": "error", "message": f"Image generation failed: {e}"})
+
+            metrics.set_outcome("done")
+            yield 'data: {"type": "done"}\n\n'
 
-        # Step 8: Conditionally store in long-term memory
-        _maybe_remember(user_message, cleaned, thinking)
+            # Step 9: Conditionally store in long-term memory
+            if not cancelled.is_set():
+                _maybe_remember(session, turn.message, turn.cleaned, turn.thinking)
+        finally:
+            # Reached on normal completion, supersession, and client
+            # disconnect (GeneratorExit) alike: release everything upstream.
+            if cancelled.is_set():
+                metrics.set_outcome("cancelled")
+            cancelled.set()
+            if stream is not None:
+                stream.close()
+            if pending_prompt_id is not None:
+                comfyui_service.cancel_prompt(pending_prompt_id)
 
     return Response(
-        generate(),
+        metrics.traced("chat", generate(), session=session.id),
         mimetype="text/event-stream",
         headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
     )
@@ -291,52 +358,156 @@ def imagine():
     if not prompt:
         return jsonify({"error": "No prompt provided"}), 400
 
-    try:
-        image_url = comfyui_service.generate_image(prompt, **_IMAGE_SETTINGS)
-        conversation_history.append(
-            {"role": "user", "content": f"/imagine {prompt}"}
-        )
-        conversation_history.append(
-            {"role": "assistant", "content": f"[Generated image: {prompt}]"}
-        )
-        return jsonify({"url": image_url, "prompt": prompt})
-    except Exception as e:
-        return jsonify({"error": str(e)}), 500
+    session = _current_session()
+    sessions.note_activity(session)
+    with metrics.trace("imagine", session=session.id):
+        try:
+            with metrics.stage("image"):
+                image_url = comfyui_service.generate_image(
+                    prompt, **profiles.get().image_settings
+                )
+            session.add_message("user", f"/imagine {prompt}")
+            session.add_message("assistant", f"[Generated image: {prompt}]")
+            return jsonify({"url": image_url, "prompt": prompt})
+        except Exception as e:
+            metrics.set_outcome("error")
+            return jsonify({"error": str(e)}), 500
 
 
 @app.route("/api/pings")
 def pings():
-    msg = ping_service.get_pending()
+    session = _current_session()
+    msg = ping_service.get_pending(session.id)
     if msg:
-        conversation_history.append({"role": "assistant", "content": msg})
+        session.add_message("assistant", msg)
         return jsonify({"message": msg})
     return jsonify({"message": None})
 
 
+@app.route("/api/pings/stream")
+def ping_stream():
+    """Push proactive pings over SSE the moment they are queued."""
+    session = _current_session()
+
+    def generate():
+        yield f"retry: {_PING_RETRY_MS}\n\n"
+        with sessions.listening(session):
+            while True:
+                msg = ping_service.wait_for_pending(
+                    timeout=_PING_HEARTBEAT_INTERVAL, session_key=session.id
+                )
+                if not msg:
+                    yield ": heartbeat\n\n"
+                    continue
+                delivered = False
+                try:
+                    yield _sse({"type": "ping", "message": msg})
+                    delivered = True
+                finally:
+                    if delivered:
+                        session.add_message("assistant", msg)
+                    else:
+                        # Client went away mid-write; keep it for the next listener
+                        ping_service.requeue(msg, session.id)
+
+    return Response(
+        generate(),
+        mimetype="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
+
+@app.route("/api/status")
+def status():
+    """Inference queue, wait times, Ollama backend health, the load
+    governor's level and which process runs the background jobs."""
+    return jsonify({
+        "inference": inference_scheduler.stats(),
+        "load": load_governor.status(),
+        "backends": ollama_backends.status(),
+        "leader": leader.status(),
+    })
+
+
+@app.route("/metrics")
+def prometheus_metrics():
+    """Stage latencies, Ollama token stats, cache hit counts and queue
+    depths for every worker process, in Prometheus text format."""
+    return Response(metrics.render(), mimetype="text/plain; version=0.0.4")
+
+
+def _admin_authorized():
+    """Whether the request carries ADMIN_TOKEN as its bearer token."""
+    supplied = request.headers.get("Authorization", "").encode("utf-8")
+    expected = f"Bearer {Config.ADMIN_TOKEN}".encode("utf-8")
+    return hmac.compare_digest(supplied, expected)
+
+
+@app.route("/api/admin/profile", methods=["POST"])
+def admin_profile():
+    """Sample this process's stacks for a while and return them as
+    collapsed stacks, or as JSON with a per-request breakdown."""
+    if not Config.ADMIN_TOKEN:
+        return jsonify({"error": "Not found"}), 404
+    if not _admin_authorized():
+        return jsonify({"error": "Unauthorized"}), 401
+
+    options = request.get_json(silent=True) or {}
+    try:
+        result = profiler.profile(
+            float(options.get("seconds", 10)),
+            kind=options.get("kind"),
+            min_seconds=float(options.get("min_seconds", 0)),
+            include_idle=bool(options.get("idle", False)),
+        )
+    except (TypeError, ValueError):
+        return jsonify({"error": "seconds and min_seconds must be numbers"}), 400
+    except profiler.ProfilerBusy as e:
+        return jsonify({"error": str(e)}), 409
+
+    if options.get("format") == "json":
+        return jsonify(result)
+    return Response(profiler.collapsed(result["stacks"]), mimetype="text/plain")
+
+
+@app.route("/api/ready")
+def ready():
+    """Readiness probe: 200 once startup warmup has finished, 503 before."""
+    body = {"ready": warmup.is_ready(), "steps": warmup.status()}
+    return jsonify(body), 200 if body["ready"] else 503
+
+
 @app.route("/api/forget", methods=["POST"])
 def forget():
-    global _message_counter
-    conversation_history.clear()
-    _pending_memory_exchanges.clear()
-    _message_counter = 0
-    ping_service.reset()
+    """Erase the caller's conversation and long-term memory; other
+    sessions' memories are untouched."""
+    session = _current_session()
+    sessions.forget(session)
     try:
-        memory_service.forget()
+        shared_state.clear_memory_jobs(session.id)
+        memory_service.forget(session.id)
     except Exception:
         pass
     return jsonify({"status": "memory cleared"})
 
 
 atexit.register(ping_service.stop)
+atexit.register(leader.stop)
 
 
-if __name__ == "__main__":
+def start_background():
+    """Start this process's background work: warmup, metrics publishing
+    and the election for the ping/consolidation leader. Called once per
+    process (see gunicorn.conf.py)."""
     memory_service.init_memory()
-    ping_service.start(
-        _PROFILE.get("proactive_messaging", {}),
-        PERSONA_CONTEXT,
-        conversation_history,
-    )
+    warmup.start(extra_steps=[("profile", profiles.get)])
+    ping_service.start(profiles.get)
+    metrics.start_publishing()
+    leader.start()
+
+
+if __name__ == "__main__":
+    start_background()
     app.run(
         host=Config.HOST,
         port=Config.PORT,
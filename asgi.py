@@ -0,0 +1,387 @@
+"""ASGI entry point: the chat pipeline and the ping push channel run as
+coroutines on one event loop, so idle or slow SSE connections cost memory
+rather than threads. Every other route is the Flask app, served through
+a2wsgi's thread pool.
+
+    pip install -r requirements-server.txt
+    uvicorn asgi:app --host 0.0.0.0 --port 5000
+
+The turn's decisions are shared with app.chat() through
+services/chat_turn.py; only the waiting and I/O differ. Session and
+mailbox reads and writes go to SQLite, so they run in worker threads
+(asyncio.to_thread) rather than on the event loop.
+"""
+
+import asyncio
+import json
+import time
+from datetime import datetime, timezone
+from http.cookies import SimpleCookie
+
+from a2wsgi import WSGIMiddleware
+from itsdangerous import BadSignature
+from werkzeug.http import dump_cookie
+
+import app as vessel
+from config import Config
+from services import (
+    async_http,
+    comfyui_service,
+    delivery_service,
+    inner_monologue,
+    memory_service,
+    metrics,
+    ollama_service,
+    ping_service,
+    profiles,
+    sessions,
+    web_search_service,
+)
+from services.chat_turn import ChatTurn
+
+_flask = vessel.app
+_wsgi = WSGIMiddleware(_flask)
+
+# How often a coroutine waiting on a turn's cancel event checks it
+_CANCEL_POLL_SECONDS = 0.1
+
+_SSE_HEADERS = [
+    (b"content-type", b"text/event-stream"),
+    (b"cache-control", b"no-cache"),
+    (b"x-accel-buffering", b"no"),
+]
+
+
+def _session_for(scope):
+    """Load the caller's session from Flask's signed session cookie.
+    Returns (session, Set-Cookie value or None)."""
+    serializer = _flask.session_interface.get_signing_serializer(_flask)
+    name = _flask.config["SESSION_COOKIE_NAME"]
+    lifetime = _flask.permanent_session_lifetime
+
+    cookies = SimpleCookie()
+    for key, value in scope["headers"]:
+        if key == b"cookie":
+            cookies.load(value.decode("latin-1"))
+    data = {}
+    if name in cookies:
+        try:
+            data = serializer.loads(
+                cookies[name].value, max_age=int(lifetime.total_seconds())
+            )
+        except BadSignature:
+            data = {}
+
+    session_id = data.get("sid")
+    set_cookie = None
+    if not session_id:
+        session_id = sessions.new_id()
+        set_cookie = dump_cookie(
+            name,
+            serializer.dumps({"_permanent": True, "sid": session_id}),
+            expires=datetime.now(timezone.utc) + lifetime,
+            path="/",
+            httponly=True,
+            secure=_flask.config["SESSION_COOKIE_SECURE"],
+            samesite=_flask.config["SESSION_COOKIE_SAMESITE"],
+        )
+    return sessions.get(session_id), set_cookie
+
+
+async def _read_body(receive):
+    body = b""
+    while True:
+        message = await receive()
+        body += message.get("body", b"")
+        if not message.get("more_body"):
+            return body
+
+
+async def _send_json(send, status, payload):
+    await send({
+        "type": "http.response.start",
+        "status": status,
+        "headers": [(b"content-type", b"application/json")],
+    })
+    await send({"type": "http.response.body", "body": json.dumps(payload).encode()})
+
+
+async def _start_sse(send, set_cookie):
+    headers = list(_SSE_HEADERS)
+    if set_cookie:
+        headers.append((b"set-cookie", set_cookie.encode("latin-1")))
+    await send({"type": "http.response.start", "status": 200, "headers": headers})
+
+
+async def _emit(send, frame):
+    await send({"type": "http.response.body", "body": frame.encode(), "more_body": True})
+
+
+async def _end(send):
+    await send({"type": "http.response.body", "body": b"", "more_body": False})
+
+
+async def _on_disconnect(receive, callback):
+    """Run `callback` once the client goes away."""
+    while True:
+        message = await receive()
+        if message["type"] == "http.disconnect":
+            callback()
+            return
+
+
+async def _wait(event, seconds):
+    """Async Event.wait() for the threading.Event a turn is cancelled by.
+    Returns True if it was set within `seconds`."""
+    deadline = time.time() + seconds
+    while not event.is_set():
+        remaining = deadline - time.time()
+        if remaining <= 0:
+            return False
+        await asyncio.sleep(min(remaining, _CANCEL_POLL_SECONDS))
+    return True
+
+
+async def _chat(scope, receive, send):
+    try:
+        body = json.loads(await _read_body(receive) or b"{}")
+        user_message = body.get("message", "")
+    except (ValueError, AttributeError):
+        body, user_message = {}, ""
+    if not user_message:
+        await _send_json(send, 400, {"error": "No message provided"})
+        return
+
+    session, set_cookie = await asyncio.to_thread(_session_for, scope)
+    session.message_counter += 1
+    await asyncio.to_thread(sessions.note_activity, session)
+    # A new message supersedes whatever turn is still in flight; that
+    # turn's unanswered messages are merged into this one
+    cancelled = session.turns.submit(user_message)
+    profile = profiles.get()
+    instant = delivery_service.mode(body.get("delivery"), profile.delivery) == "instant"
+
+    watcher = asyncio.create_task(_on_disconnect(receive, cancelled.set))
+    await _start_sse(send, set_cookie)
+    turn = _turn(session, profile, cancelled, instant)
+    with metrics.trace("chat", session=session.id):
+        try:
+            async for frame in turn:
+                await _emit(send, frame)
+        finally:
+            await turn.aclose()
+            cancelled.set()
+            watcher.cancel()
+    await _end(send)
+
+
+async def _turn(session, profile, cancelled, instant):
+    """One chat turn as an async generator of SSE frames (see app.chat)."""
+    sse = vessel._sse
+    done = 'data: {"type": "done"}\n\n'
+    stream = None
+    pending_prompt_id = None
+    try:
+        # Step 0: Debounce — a follow-up inside the window takes over
+        if await _wait(cancelled, Config.CHAT_DEBOUNCE_MS / 1000.0):
+            metrics.set_outcome("superseded")
+            yield sse({"type": "superseded"})
+            yield done
+            return
+        turn = ChatTurn(session, profile, cancelled, instant)
+
+        # Step 1: Inner monologue (a fixed plan under the heaviest load)
+        thinking = None
+        if turn.runs("monologue"):
+            with metrics.stage("monologue"):
+                thinking = await inner_monologue.athink(
+                    turn.history, emotion_history=session.emotion.get_history_string(),
+                    system_prompt=profile.monologue_prompt,
+                    cancel_event=cancelled, session_key=session.id,
+                )
+            if cancelled.is_set():
+                yield done
+                return
+        turn.plan(thinking)
+
+        # Step 2: Web search (the client library is sync; it gets a thread)
+        search_context = ""
+        query = turn.search_query()
+        if query:
+            with metrics.stage("web_search"):
+                search_context = await asyncio.to_thread(web_search_service.search, query)
+
+        # Step 3: Memory recall
+        memory_context = ""
+        if turn.wants_recall():
+            with metrics.stage("recall"):
+                memory_context = await memory_service.arecall(
+                    turn.message, session.id, cancelled
+                )
+        if cancelled.is_set():
+            yield done
+            return
+
+        # Step 4-5: Guided system prompt, streamed reply
+        try:
+            stream = ollama_service.astream_chat(
+                turn.history,
+                system_prompt=turn.system_prompt(memory_context, search_context),
+                cancel_event=cancelled, session_key=session.id,
+            )
+            with metrics.stage("reply"):
+                async for chunk in stream:
+                    delta = turn.feed(chunk)
+                    if delta:
+                        yield sse(delta)
+            delta = turn.end_stream()
+            if delta:
+                yield sse(delta)
+        except Exception as e:
+            metrics.set_outcome("error")
+            yield sse({"type": "error", "message": str(e)})
+            yield done
+            return
+        if cancelled.is_set():
+            reply = turn.partial_reply()
+            if reply:
+                await asyncio.to_thread(vessel._commit_turn, turn, reply)
+            yield done
+            return
+
+        # Step 6-7: Clean up, split and deliver with realistic timing (or,
+        # in instant mode, replace the streamed text with the split)
+        turn.finish_reply()
+        if instant:
+            event, reply = turn.instant_reply()
+            yield sse(event)
+            await asyncio.to_thread(vessel._commit_turn, turn, reply)
+        else:
+            delivery_started = time.perf_counter()
+            try:
+                for event, wait in turn.delivery():
+                    yield sse(event)
+                    if wait and await _wait(cancelled, wait):
+                        break
+            finally:
+                metrics.observe_stage("delivery", time.perf_counter() - delivery_started)
+                reply = turn.delivered_reply()
+                if reply:
+                    await asyncio.to_thread(vessel._commit_turn, turn, reply)
+        if cancelled.is_set():
+            yield done
+            return
+
+        # Step 8: Image generation
+        if turn.image_prompt:
+            yield sse({"type": "image_generating", "prompt": turn.image_prompt})
+            image_started = time.perf_counter()
+            try:
+                pending_prompt_id = await comfyui_service.asubmit_image(
+                    turn.image_prompt, **profile.image_settings
+                )
+                history = None
+                deadline = time.time() + vessel._IMAGE_TIMEOUT
+                while history is None:
+                    if time.time() > deadline:
+                        raise TimeoutError(
+                            f"ComfyUI did not complete prompt "
+                            f"{pending_prompt_id} within {vessel._IMAGE_TIMEOUT}s"
+                        )
+                    if await _wait(cancelled, 1.0):
+                        break
+                    history = await comfyui_service.aget_history(pending_prompt_id)
+                if history is not None:
+                    image_url = await comfyui_service.asave_output(
+                        pending_prompt_id, history
+                    )
+                    pending_prompt_id = None
+                    metrics.observe_stage("image", time.perf_counter() - image_started)
+                    yield sse({"type": "image", "url": image_url})
+            except Exception as e:
+                yield sse({"type": "error", "message": f"Image generation failed: {e}"})
+
+        metrics.set_outcome("done")
+        yield done
+
+        # Step 9: Long-term memory
+        if not cancelled.is_set():
+            await asyncio.to_thread(
+                vessel._maybe_remember, session, turn.message, turn.cleaned,
+                turn.thinking,
+            )
+    finally:
+        if cancelled.is_set():
+            metrics.set_outcome("cancelled")
+        cancelled.set()
+        if stream is not None:
+            await stream.aclose()
+        if pending_prompt_id is not None:
+            await comfyui_service.acancel_prompt(pending_prompt_id)
+
+
+async def _ping_stream(scope, receive, send):
+    """Push proactive pings over SSE (see app.ping_stream)."""
+    session, set_cookie = await asyncio.to_thread(_session_for, scope)
+    closed = asyncio.Event()
+    watcher = asyncio.create_task(_on_disconnect(receive, closed.set))
+    await _start_sse(send, set_cookie)
+    await _emit(send, f"retry: {vessel._PING_RETRY_MS}\n\n")
+    try:
+        with sessions.listening(session):
+            while not closed.is_set():
+                waiting = asyncio.create_task(ping_service.await_pending(
+                    vessel._PING_HEARTBEAT_INTERVAL, session.id
+                ))
+                closing = asyncio.create_task(closed.wait())
+                await asyncio.wait(
+                    {waiting, closing}, return_when=asyncio.FIRST_COMPLETED
+                )
+                closing.cancel()
+                if not waiting.done():
+                    waiting.cancel()
+                    break
+                msg = waiting.result()
+                if closed.is_set():
+                    if msg:
+                        # Client went away; keep it for the next listener
+                        await asyncio.to_thread(ping_service.requeue, msg, session.id)
+                    break
+                if not msg:
+                    await _emit(send, ": heartbeat\n\n")
+                    continue
+                await _emit(send, vessel._sse({"type": "ping", "message": msg}))
+                await asyncio.to_thread(session.add_message, "assistant", msg)
+    finally:
+        watcher.cancel()
+    await _end(send)
+
+
+async def _lifespan(receive, send):
+    while True:
+        message = await receive()
+        if message["type"] == "lifespan.startup":
+            vessel.start_background()
+            await send({"type": "lifespan.startup.complete"})
+        elif message["type"] == "lifespan.shutdown":
+            await async_http.close()
+            await send({"type": "lifespan.shutdown.complete"})
+            return
+
+
+_ROUTES = {
+    ("POST", "/api/chat"): _chat,
+    ("GET", "/api/pings/stream"): _ping_stream,
+}
+
+
+async def app(scope, receive, send):
+    if scope["type"] == "lifespan":
+        await _lifespan(receive, send)
+        return
+    if scope["type"] == "http":
+        handler = _ROUTES.get((scope["method"], scope["path"]))
+        if handler is not None:
+            await handler(scope, receive, send)
+            return
+    await _wsgi(scope, receive, send)
@@ -0,0 +1,297 @@
+"""Load generator for a running Vessel server.
+
+    python -m bench.load --url http://localhost:5000 --users 20 --duration 60
+
+Each virtual user has its own session cookie and loops: pick an action by
+--mix weight, run it, pause for the think time. Chat turns are read as
+SSE, so time to first message (TTFM) is measured as the user sees it (the
+first streamed text, with --delivery instant). Whole-turn latency includes
+the simulated typing delays.
+
+Reports p50/p95/p99 latency and throughput per action, and errors. With
+--server-pid, also the server's resident memory (the process and its
+children, for gunicorn). With --metrics, also the server's mean time per
+pipeline stage over the run, read from /metrics.
+"""
+
+import argparse
+import json
+import os
+import random
+import re
+import threading
+import time
+
+import requests
+
+_MESSAGES = [
+    "hey, how's your day going?",
+    "I finally finished that project at work",
+    "what do you think about learning to cook?",
+    "can you look up the weather for tomorrow?",
+    "remember what I told you about my sister?",
+    "send me a picture of where you'd want to be right now",
+    "lol that's fair",
+    "I can't sleep again",
+]
+
+# vessel_stage_seconds_sum{worker="…",stage="…"} 1.5
+_STAGE_SAMPLE = re.compile(
+    r'vessel_stage_seconds(_sum|_count)\{.*?\bstage="([^"]*)".*\} (\S+)$'
+)
+
+
+class _Results:
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.latency = {}    # action -> [seconds]
+        self.ttfm = []       # chat: seconds to the first message event
+        self.errors = {}     # action -> count
+        self.events = {}     # chat SSE event type -> count
+
+    def add(self, action, seconds):
+        with self.lock:
+            self.latency.setdefault(action, []).append(seconds)
+
+    def error(self, action):
+        with self.lock:
+            self.errors[action] = self.errors.get(action, 0) + 1
+
+
+def _chat(http, url, results, delivery=None):
+    started = time.perf_counter()
+    first_message = None
+    failed = False
+    body = {"message": random.choice(_MESSAGES)}
+    if delivery:
+        body["delivery"] = delivery
+    with http.post(f"{url}/api/chat", json=body, stream=True, timeout=300) as resp:
+        resp.raise_for_status()
+        for line in resp.iter_lines(decode_unicode=True):
+            if not line or not line.startswith("data: "):
+                continue
+            kind = json.loads(line[6:]).get("type")
+            with results.lock:
+                results.events[kind] = results.events.get(kind, 0) + 1
+            if kind in ("message", "delta") and first_message is None:
+                first_message = time.perf_counter() - started
+            elif kind == "error":
+                failed = True
+            elif kind == "done":
+                break
+    if failed:
+        results.error("chat")
+        return
+    results.add("chat", time.perf_counter() - started)
+    if first_message is not None:
+        with results.lock:
+            results.ttfm.append(first_message)
+
+
+def _imagine(http, url, results, delivery=None):
+    started = time.perf_counter()
+    resp = http.post(f"{url}/api/imagine", json={"prompt": "a quiet beach at dusk"},
+                     timeout=300)
+    resp.raise_for_status()
+    results.add("imagine", time.perf_counter() - started)
+
+
+def _pings(http, url, results, delivery=None):
+    started = time.perf_counter()
+    http.get(f"{url}/api/pings", timeout=30).raise_for_status()
+    results.add("pings", time.perf_counter() - started)
+
+
+_ACTIONS = {"chat": _chat, "imagine": _imagine, "pings": _pings}
+
+
+def _user(url, mix, think_ms, deadline, turns, results, delivery):
+    http = requests.Session()
+    actions, weights = zip(*mix.items())
+    done = 0
+    while time.time() < deadline and (turns is None or done < turns):
+        action = random.choices(actions, weights)[0]
+        try:
+            _ACTIONS[action](http, url, results, delivery)
+        except requests.RequestException:
+            results.error(action)
+        done += 1
+        if think_ms:
+            time.sleep(random.expovariate(1000.0 / think_ms))
+
+
+def _rss_kb(root_pid):
+    """Resident memory of a process and all its descendants (Linux)."""
+    children = {}
+    for entry in os.listdir("/proc"):
+        if not entry.isdigit():
+            continue
+        try:
+            with open(f"/proc/{entry}/stat") as f:
+                parent = int(f.read().rsplit(")", 1)[1].split()[1])
+        except (OSError, IndexError, ValueError):
+            continue
+        children.setdefault(parent, []).append(int(entry))
+
+    total, stack = 0, [root_pid]
+    while stack:
+        pid = stack.pop()
+        stack.extend(children.get(pid, []))
+        try:
+            with open(f"/proc/{pid}/status") as f:
+                for line in f:
+                    if line.startswith("VmRSS:"):
+                        total += int(line.split()[1])
+        except OSError:
+            pass
+    return total
+
+
+def _watch_memory(pid, stop, samples):
+    while not stop.is_set():
+        samples.append(_rss_kb(pid))
+        stop.wait(0.5)
+
+
+def _stage_means(url):
+    """(sum, count) per stage from the server's /metrics, over all workers."""
+    stages = {}
+    text = requests.get(f"{url}/metrics", timeout=10).text
+    for line in text.splitlines():
+        match = _STAGE_SAMPLE.match(line)
+        if match:
+            index = 0 if match.group(1) == "_sum" else 1
+            totals = stages.setdefault(match.group(2), [0.0, 0])
+            totals[index] += float(match.group(3))
+    return stages
+
+
+def _percentile(values, pct):
+    ordered = sorted(values)
+    index = min(int(round(pct / 100.0 * (len(ordered) - 1))), len(ordered) - 1)
+    return ordered[index]
+
+
+def _summary(values):
+    if not values:
+        return None
+    return {
+        "count": len(values),
+        "p50": _percentile(values, 50),
+        "p95": _percentile(values, 95),
+        "p99": _percentile(values, 99),
+        "max": max(values),
+    }
+
+
+def _parse_mix(text):
+    mix = {}
+    for part in text.split(","):
+        name, _, weight = part.partition("=")
+        if name.strip() not in _ACTIONS:
+            raise argparse.ArgumentTypeError(f"unknown action: {name}")
+        mix[name.strip()] = float(weight or 1)
+    return mix
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--url", default="http://localhost:5000")
+    parser.add_argument("--users", type=int, default=10)
+    parser.add_argument("--duration", type=float, default=60.0,
+                        help="seconds to keep starting new requests")
+    parser.add_argument("--turns", type=int, default=None,
+                        help="stop each user after this many requests")
+    parser.add_argument("--mix", type=_parse_mix, default=_parse_mix("chat=8,pings=2"),
+                        help="action weights, e.g. chat=8,imagine=1,pings=2")
+    parser.add_argument("--think-ms", type=float, default=2000.0,
+                        help="mean pause between a user's requests")
+    parser.add_argument("--delivery", choices=("typed", "instant"), default=None,
+                        help="ask for this delivery mode instead of the profile's")
+    parser.add_argument("--server-pid", type=int, default=None)
+    parser.add_argument("--metrics", action="store_true",
+                        help="report per-stage means from /metrics")
+    parser.add_argument("--json", dest="json_path", default=None,
+                        help="also write the report here")
+    opts = parser.parse_args(argv)
+    url = opts.url.rstrip("/")
+
+    results = _Results()
+    before = _stage_means(url) if opts.metrics else None
+    memory, stop = [], threading.Event()
+    if opts.server_pid:
+        threading.Thread(
+            target=_watch_memory, args=(opts.server_pid, stop, memory), daemon=True
+        ).start()
+
+    started = time.time()
+    deadline = started + opts.duration
+    users = [
+        threading.Thread(target=_user, args=(
+            url, opts.mix, opts.think_ms, deadline, opts.turns, results, opts.delivery
+        ))
+        for _ in range(opts.users)
+    ]
+    for t in users:
+        t.start()
+        time.sleep(random.uniform(0, 0.05))  # don't fire every first request at once
+    for t in users:
+        t.join()
+    elapsed = time.time() - started
+    stop.set()
+
+    report = {
+        "users": opts.users,
+        "seconds": elapsed,
+        "actions": {
+            action: dict(_summary(values) or {}, per_second=len(values) / elapsed)
+            for action, values in results.latency.items()
+        },
+        "ttfm": _summary(results.ttfm),
+        "errors": results.errors,
+        "chat_events": results.events,
+    }
+    if memory:
+        report["memory_mb"] = {
+            "start": memory[0] / 1024, "peak": max(memory) / 1024, "end": memory[-1] / 1024,
+        }
+    if before is not None:
+        after = _stage_means(url)
+        report["stages"] = {}
+        for name, (total, count) in after.items():
+            prev_total, prev_count = before.get(name, (0.0, 0))
+            if count > prev_count:
+                report["stages"][name] = (total - prev_total) / (count - prev_count)
+
+    _print(report)
+    if opts.json_path:
+        with open(opts.json_path, "w") as f:
+            json.dump(report, f, indent=2)
+
+
+def _print(report):
+    print(f"\n{report['users']} users, {report['seconds']:.1f}s\n")
+    print(f"{'action':<10}{'count':>7}{'req/s':>8}{'p50':>9}{'p95':>9}{'p99':>9}{'max':>9}")
+    rows = [(a, s) for a, s in report["actions"].items()]
+    if report["ttfm"]:
+        rows.append(("chat ttfm", dict(report["ttfm"], per_second=None)))
+    for name, s in rows:
+        rate = "" if s["per_second"] is None else f"{s['per_second']:.2f}"
+        print(f"{name:<10}{s['count']:>7}{rate:>8}"
+              f"{s['p50']:>8.2f}s{s['p95']:>8.2f}s{s['p99']:>8.2f}s{s['max']:>8.2f}s")
+    if report["errors"]:
+        print(f"\nerrors: {report['errors']}")
+    if report["chat_events"]:
+        print(f"chat events: {report['chat_events']}")
+    if "memory_mb" in report:
+        m = report["memory_mb"]
+        print(f"server RSS: {m['start']:.0f} MB at start, {m['peak']:.0f} MB peak, "
+              f"{m['end']:.0f} MB at end")
+    if report.get("stages"):
+        print("\nmean stage time:")
+        for name, seconds in report["stages"].items():
+            print(f"  {name:<12}{seconds:>8.3f}s")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,314 @@
+"""Local stand-ins for Ollama, ComfyUI and the search backend, for load
+tests without GPUs.
+
+    python -m bench.mocks --tokens-per-second 40 --first-token-ms 300
+
+Point the app at them with the environment it prints on startup. The mock
+Ollama speaks the /api/chat NDJSON streaming protocol and answers the
+inner monologue with a JSON plan, ping drafts with a JSON array and
+replies with filler text, at the configured token rate. Only
+--ollama-parallel calls generate at once, like Ollama's own
+OLLAMA_NUM_PARALLEL; the rest wait for a slot. The mock ComfyUI renders
+one image at a time.
+
+Cognee's own LLM calls are not mocked. Its embeddings are, so recall works
+against an empty knowledge graph.
+"""
+
+import argparse
+import json
+import os
+import random
+import struct
+import threading
+import time
+import urllib.parse
+import uuid
+import zlib
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from config import Config
+
+# Cognee reads these from the environment (see .env.example)
+_EMBEDDING_MODEL = os.getenv("EMBEDDING_MODEL", "nomic-embed-text")
+_EMBEDDING_DIMENSIONS = int(os.getenv("EMBEDDING_DIMENSIONS", "768"))
+
+_WORDS = (
+    "honestly that sounds like a lot but I think you handled it well "
+    "I was just thinking about the same thing earlier today and it made "
+    "me smile a little what are you up to later anyway"
+).split()
+
+
+def _png_1x1():
+    """A valid 1x1 grey PNG, so image downloads look real."""
+    def chunk(kind, data):
+        body = kind + data
+        return struct.pack(">I", len(data)) + body + struct.pack(">I", zlib.crc32(body))
+    header = struct.pack(">IIBBBBB", 1, 1, 8, 0, 0, 0, 0)
+    pixels = zlib.compress(b"\x00\x80")
+    return (b"\x89PNG\r\n\x1a\n" + chunk(b"IHDR", header)
+            + chunk(b"IDAT", pixels) + chunk(b"IEND", b""))
+
+
+_PNG = _png_1x1()
+
+
+class _Handler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    opts = None
+
+    def log_message(self, *args):
+        pass
+
+    def _body(self):
+        length = int(self.headers.get("Content-Length", 0))
+        return json.loads(self.rfile.read(length) or b"{}")
+
+    def _json(self, payload, status=200):
+        data = json.dumps(payload).encode()
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def _sleep_ms(self, ms):
+        if ms > 0:
+            time.sleep(ms / 1000.0 * random.uniform(0.8, 1.2))
+
+
+# Ollama
+
+class _OllamaHandler(_Handler):
+    slots = None   # threading.Semaphore, one permit per parallel slot
+
+    def do_GET(self):
+        if self.path.startswith("/api/tags"):
+            models = {
+                Config.OLLAMA_MODEL, Config.OLLAMA_MONOLOGUE_MODEL,
+                Config.OLLAMA_PING_MODEL, Config.OLLAMA_MEMORY_MODEL,
+                _EMBEDDING_MODEL,
+            }
+            return self._json({"models": [{"name": m} for m in sorted(models) if m]})
+        self._json({"error": "not found"}, 404)
+
+    def do_POST(self):
+        body = self._body()
+        if self.path == "/api/chat":
+            return self._chat(body)
+        if self.path == "/api/generate":
+            return self._json({"model": body.get("model"), "response": "", "done": True})
+        if self.path in ("/api/embed", "/api/embeddings"):
+            vector = [random.uniform(-1, 1) for _ in range(_EMBEDDING_DIMENSIONS)]
+            if self.path == "/api/embeddings":
+                return self._json({"embedding": vector})
+            inputs = body.get("input", "")
+            count = len(inputs) if isinstance(inputs, list) else 1
+            return self._json({"embeddings": [vector] * count})
+        self._json({"error": "not found"}, 404)
+
+    def _chat(self, body):
+        messages = body.get("messages", [])
+        system = messages[0]["content"] if messages and messages[0]["role"] == "system" else ""
+        text = self._answer(system)
+        prompt_tokens = sum(len(m.get("content", "")) for m in messages) // 4
+
+        queued_at = time.time()
+        with self.slots:
+            self.send_response(200)
+            self.send_header("Content-Type", "application/x-ndjson")
+            self.send_header("Transfer-Encoding", "chunked")
+            self.end_headers()
+            self._sleep_ms(self.opts.first_token_ms)
+            started = time.time()
+            tokens = _tokens(text)
+            interval = 1.0 / self.opts.tokens_per_second
+            try:
+                for token in tokens:
+                    self._line({"model": body.get("model"),
+                                "message": {"role": "assistant", "content": token},
+                                "done": False})
+                    time.sleep(interval)
+                elapsed = time.time() - started
+                self._line({
+                    "model": body.get("model"),
+                    "message": {"role": "assistant", "content": ""},
+                    "done": True,
+                    "total_duration": int((time.time() - queued_at) * 1e9),
+                    "load_duration": 0,
+                    "prompt_eval_count": prompt_tokens,
+                    "prompt_eval_duration": int(self.opts.first_token_ms * 1e6),
+                    "eval_count": len(tokens),
+                    "eval_duration": int(elapsed * 1e9),
+                })
+                self.wfile.write(b"0\r\n\r\n")
+            except (BrokenPipeError, ConnectionResetError):
+                pass  # the app cancelled the stream
+
+    def _line(self, payload):
+        line = (json.dumps(payload) + "\n").encode()
+        self.wfile.write(b"%x\r\n%s\r\n" % (len(line), line))
+        self.wfile.flush()
+
+    def _answer(self, system):
+        opts = self.opts
+        if '"user_emotion"' in system:
+            image = random.random() < opts.image_rate
+            search = random.random() < opts.search_rate
+            return json.dumps({
+                "user_emotion": "neutral",
+                "emotional_shift": "stable",
+                "response_strategy": "match energy",
+                "message_style": "two casual messages",
+                "message_count": random.randint(1, 3),
+                "tone": "warm and casual",
+                "key_points": ["answer the question"],
+                "should_generate_image": image,
+                "image_prompt": "a cat on a windowsill" if image else None,
+                "needs_memory_lookup": random.random() < opts.recall_rate,
+                "should_store_memory": False,
+                "needs_web_search": search,
+                "search_query": "weather tomorrow" if search else None,
+                "inner_thoughts": " ".join(random.choices(_WORDS, k=30)),
+            })
+        if "JSON array" in system:
+            return json.dumps([" ".join(random.choices(_WORDS, k=10)) for _ in range(3)])
+
+        sentences = []
+        for _ in range(max(opts.reply_tokens // 10, 1)):
+            sentences.append(" ".join(random.choices(_WORDS, k=10)).capitalize() + ".")
+        text = " ".join(sentences)
+        start = system.find("[GENERATE_IMAGE:")
+        if start != -1:
+            text += " " + system[start:system.index("]", start) + 1]
+        return text
+
+
+def _tokens(text):
+    """Split text into word-sized stream chunks."""
+    words = text.split(" ")
+    return [w + " " for w in words[:-1]] + words[-1:]
+
+
+# ComfyUI
+
+class _ComfyHandler(_Handler):
+    lock = threading.Lock()
+    jobs = {}           # prompt id -> finish time
+    busy_until = 0.0    # the mock renders one image at a time
+
+    def do_POST(self):
+        body = self._body()
+        if self.path == "/prompt":
+            prompt_id = str(uuid.uuid4())
+            seconds = self.opts.image_seconds * random.uniform(0.8, 1.2)
+            with self.lock:
+                start = max(time.time(), _ComfyHandler.busy_until)
+                _ComfyHandler.busy_until = start + seconds
+                self.jobs[prompt_id] = start + seconds
+            return self._json({"prompt_id": prompt_id, "number": len(self.jobs)})
+        if self.path == "/queue":
+            with self.lock:
+                for prompt_id in body.get("delete", []):
+                    self.jobs.pop(prompt_id, None)
+            return self._json({})
+        if self.path == "/interrupt":
+            with self.lock:
+                self.jobs.pop(body.get("prompt_id"), None)
+            return self._json({})
+        self._json({"error": "not found"}, 404)
+
+    def do_GET(self):
+        path = urllib.parse.urlparse(self.path).path
+        now = time.time()
+        if path.startswith("/history/"):
+            prompt_id = path.rsplit("/", 1)[-1]
+            with self.lock:
+                finish = self.jobs.get(prompt_id)
+            if finish is None or finish > now:
+                return self._json({})
+            return self._json({prompt_id: {"outputs": {"9": {"images": [
+                {"filename": "bench.png", "subfolder": "", "type": "output"}
+            ]}}}})
+        if path == "/queue":
+            with self.lock:
+                pending = sorted(self.jobs.items(), key=lambda item: item[1])
+            running = [[0, pid, {}, {}, []] for pid, f in pending[:1] if f > now]
+            waiting = [[i, pid, {}, {}, []] for i, (pid, f) in enumerate(pending[1:], 1)
+                       if f > now]
+            return self._json({"queue_running": running, "queue_pending": waiting})
+        if path == "/view":
+            self.send_response(200)
+            self.send_header("Content-Type", "image/png")
+            self.send_header("Content-Length", str(len(_PNG)))
+            self.end_headers()
+            self.wfile.write(_PNG)
+            return
+        self._json({"error": "not found"}, 404)
+
+
+# Search (SearxNG JSON API)
+
+class _SearchHandler(_Handler):
+    def do_GET(self):
+        url = urllib.parse.urlparse(self.path)
+        if url.path != "/search":
+            return self._json({"error": "not found"}, 404)
+        query = urllib.parse.parse_qs(url.query).get("q", [""])[0]
+        self._sleep_ms(self.opts.search_ms)
+        self._json({"query": query, "results": [
+            {"title": f"Result {i} for {query}",
+             "content": " ".join(random.choices(_WORDS, k=25)),
+             "url": f"https://example.com/{i}"}
+            for i in range(1, 6)
+        ]})
+
+
+def _serve(handler, host, port):
+    server = ThreadingHTTPServer((host, port), handler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.split("\n\n")[0])
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--ollama-port", type=int, default=11434)
+    parser.add_argument("--comfyui-port", type=int, default=8188)
+    parser.add_argument("--search-port", type=int, default=8888)
+    parser.add_argument("--tokens-per-second", type=float, default=40.0)
+    parser.add_argument("--first-token-ms", type=float, default=300.0,
+                        help="prompt processing time before the first token")
+    parser.add_argument("--reply-tokens", type=int, default=60)
+    parser.add_argument("--ollama-parallel", type=int, default=1,
+                        help="calls that generate at once; the rest queue")
+    parser.add_argument("--image-seconds", type=float, default=8.0)
+    parser.add_argument("--search-ms", type=float, default=600.0)
+    parser.add_argument("--image-rate", type=float, default=0.1,
+                        help="share of monologue plans that ask for an image")
+    parser.add_argument("--search-rate", type=float, default=0.2)
+    parser.add_argument("--recall-rate", type=float, default=0.3)
+    opts = parser.parse_args(argv)
+
+    _Handler.opts = opts
+    _OllamaHandler.slots = threading.Semaphore(max(opts.ollama_parallel, 1))
+    _serve(_OllamaHandler, opts.host, opts.ollama_port)
+    _serve(_ComfyHandler, opts.host, opts.comfyui_port)
+    _serve(_SearchHandler, opts.host, opts.search_port)
+
+    print("Mock servers running. Start the app with:")
+    print(f"  OLLAMA_BACKENDS=http://{opts.host}:{opts.ollama_port} "
+          f"COMFYUI_HOST={opts.host} COMFYUI_PORT={opts.comfyui_port} "
+          f"WEB_SEARCH_URL=http://{opts.host}:{opts.search_port} "
+          f"EMBEDDING_ENDPOINT=http://{opts.host}:{opts.ollama_port}/api/embeddings")
+    try:
+        while True:
+            time.sleep(3600)
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == "__main__":
+    main()
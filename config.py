@@ -4,27 +4,50 @@ from dotenv import load_dotenv
 load_dotenv(override=True)
 
 
-def _parse_ollama_base_url():
-    """Build Ollama base URL, handling OLLAMA_HOST with or without port/scheme."""
-    raw_host = os.getenv("OLLAMA_HOST", "localhost")
-    port = os.getenv("OLLAMA_PORT", "11434")
-
+def _split_host_port(raw_host, default_port):
+    """Split "host", "host:port" or "http://host:port" into (host, port)."""
     # Strip scheme if present (e.g. "http://192.168.1.14:11434")
     if "://" in raw_host:
         raw_host = raw_host.split("://", 1)[1]
+    raw_host = raw_host.rstrip("/")
 
     # Strip port if already included in host (e.g. "192.168.1.14:11434")
     if ":" in raw_host:
-        host = raw_host.rsplit(":", 1)[0]
-    else:
-        host = raw_host
+        host, port = raw_host.rsplit(":", 1)
+        return host, port
+    return raw_host, default_port
+
+
+def _parse_ollama_base_url():
+    """Build Ollama base URL, handling OLLAMA_HOST with or without port/scheme."""
+    raw_host = os.getenv("OLLAMA_HOST", "localhost")
+    port = os.getenv("OLLAMA_PORT", "11434")
+
+    # An explicit OLLAMA_PORT wins over one embedded in OLLAMA_HOST
+    host, _ = _split_host_port(raw_host, port)
 
     return host, int(port), f"http://{host}:{port}"
 
 
+def _parse_ollama_backends(default_url):
+    """Parse OLLAMA_BACKENDS ("host1:11434,host2,http://host3:11435") into a
+    list of base URLs. Falls back to the single OLLAMA_HOST backend."""
+    raw = os.getenv("OLLAMA_BACKENDS", "")
+    port = os.getenv("OLLAMA_PORT", "11434")
+    urls = []
+    for entry in raw.split(","):
+        entry = entry.strip()
+        if entry:
+            host, entry_port = _split_host_port(entry, port)
+            urls.append(f"http://{host}:{entry_port}")
+    return urls or [default_url]
+
+
 class Config:
     # Flask
     SECRET_KEY = os.getenv("SECRET_KEY", "dev-secret-key")
+    # Keep the session cookie byte-stable so a proxy can route on it
+    SESSION_REFRESH_EACH_REQUEST = False
     DEBUG = os.getenv("FLASK_DEBUG", "true").lower() == "true"
     HOST = os.getenv("FLASK_HOST", "0.0.0.0")
     PORT = int(os.getenv("FLASK_PORT", "5000"))
@@ -32,6 +55,30 @@ class Config:
     # Ollama
     OLLAMA_HOST, OLLAMA_PORT, OLLAMA_BASE_URL = _parse_ollama_base_url()
     OLLAMA_MODEL = os.getenv("OLLAMA_MODEL", "huihui_ai/qwen3-abliterated:14b-v2-q8_0")
+    OLLAMA_BACKENDS = _parse_ollama_backends(OLLAMA_BASE_URL)
+    OLLAMA_HEALTH_INTERVAL = int(os.getenv("OLLAMA_HEALTH_INTERVAL", "30"))
+
+    # Per-role models (default to OLLAMA_MODEL); a small fast model suits
+    # the monologue and pings, the large one the visible reply
+    OLLAMA_MONOLOGUE_MODEL = os.getenv("OLLAMA_MONOLOGUE_MODEL") or OLLAMA_MODEL
+    OLLAMA_PING_MODEL = os.getenv("OLLAMA_PING_MODEL") or OLLAMA_MONOLOGUE_MODEL
+    OLLAMA_MEMORY_MODEL = os.getenv("OLLAMA_MEMORY_MODEL") or OLLAMA_MODEL
+    # How long Ollama keeps a model loaded after a request
+    OLLAMA_KEEP_ALIVE = os.getenv("OLLAMA_KEEP_ALIVE", "30m")
+
+    # Inference scheduling: concurrent calls per backend (match the
+    # server's OLLAMA_NUM_PARALLEL), slots kept free of background work, and the
+    # queue depth beyond which non-interactive calls are refused
+    OLLAMA_NUM_PARALLEL = int(os.getenv("OLLAMA_NUM_PARALLEL", "1"))
+    OLLAMA_RESERVED_SLOTS = int(os.getenv("OLLAMA_RESERVED_SLOTS", "1"))
+    OLLAMA_MAX_QUEUE = int(os.getenv("OLLAMA_MAX_QUEUE", "32"))
+
+    # Load governor: time from a turn's start to its finished reply to aim
+    # for (0 = never degrade), queued user-facing calls per slot that count
+    # as overload whatever the latency, and how long each level holds
+    LOAD_TARGET_SECONDS = float(os.getenv("LOAD_TARGET_SECONDS", "0"))
+    LOAD_MAX_QUEUE = float(os.getenv("LOAD_MAX_QUEUE", "2"))
+    LOAD_HOLD_SECONDS = float(os.getenv("LOAD_HOLD_SECONDS", "15"))
 
     # ComfyUI
     COMFYUI_HOST = os.getenv("COMFYUI_HOST", "localhost")
@@ -46,6 +93,49 @@ class Config:
     # Profile
     PROFILE_PATH = os.getenv("PROFILE_PATH", "profiles/default.json")
 
+    # Chat turns: messages sent within this window are merged into one turn
+    # (later ones still supersede a turn in flight and are merged into it),
+    # and how long a burst left unanswered by a vanished client is kept
+    CHAT_DEBOUNCE_MS = int(os.getenv("CHAT_DEBOUNCE_MS", "300"))
+    CHAT_PENDING_TTL_SECONDS = int(os.getenv("CHAT_PENDING_TTL_SECONDS", "300"))
+    # Instant delivery: streamed reply text is sent in batches of this many
+    # characters, or at least this often while tokens arrive
+    INSTANT_FLUSH_CHARS = int(os.getenv("INSTANT_FLUSH_CHARS", "64"))
+    INSTANT_FLUSH_MS = int(os.getenv("INSTANT_FLUSH_MS", "50"))
+
+    # Conversation log: SQLite file, messages restored on a session's
+    # first request, log events between snapshots, and how long an idle
+    # session (no requests, no open ping stream) stays in memory
+    CONVERSATION_DB_PATH = os.getenv(
+        "CONVERSATION_DB_PATH",
+        os.path.join(os.path.dirname(__file__), "data", "conversations.db"),
+    )
+    CONVERSATION_RESTORE_MESSAGES = int(os.getenv("CONVERSATION_RESTORE_MESSAGES", "200"))
+    CONVERSATION_SNAPSHOT_EVERY = int(os.getenv("CONVERSATION_SNAPSHOT_EVERY", "50"))
+    CONVERSATION_IDLE_SECONDS = int(os.getenv("CONVERSATION_IDLE_SECONDS", "1800"))
+
+    # Multi-process: how long the ping/consolidation leader's lease lasts
+    # without renewal before another process takes over
+    LEADER_LEASE_SECONDS = int(os.getenv("LEADER_LEASE_SECONDS", "15"))
+
+    # Per-request trace log: one JSON line per chat turn with its stage
+    # timings and Ollama stats (empty = off; /metrics is always on)
+    TRACE_LOG_PATH = os.getenv("TRACE_LOG_PATH", "")
+
+    # Record external calls to REPLAY_PATH ("record"), or serve them from
+    # it ("replay") at REPLAY_SPEED times the recorded pace (0 = instant)
+    REPLAY_MODE = os.getenv("REPLAY_MODE", "").lower()
+    REPLAY_PATH = os.getenv(
+        "REPLAY_PATH",
+        os.path.join(os.path.dirname(__file__), "data", "replay.jsonl"),
+    )
+    REPLAY_SPEED = float(os.getenv("REPLAY_SPEED", "1.0"))
+
+    # Bearer token for the /api/admin endpoints (empty = they are disabled),
+    # and the sampling profiler's interval
+    ADMIN_TOKEN = os.getenv("ADMIN_TOKEN", "")
+    PROFILE_INTERVAL_MS = float(os.getenv("PROFILE_INTERVAL_MS", "10"))
+
     # Memory gating
     MEMORY_SHORT_CONV_THRESHOLD = int(os.getenv("MEMORY_SHORT_CONV_THRESHOLD", "6"))
     MEMORY_FORCED_RECALL_INTERVAL = int(os.getenv("MEMORY_FORCED_RECALL_INTERVAL", "8"))
@@ -53,6 +143,8 @@ class Config:
 
     # Web search
     WEB_SEARCH_MAX_RESULTS = int(os.getenv("WEB_SEARCH_MAX_RESULTS", "5"))
+    # SearxNG-compatible JSON search API to use instead of DuckDuckGo
+    WEB_SEARCH_URL = os.getenv("WEB_SEARCH_URL", "").rstrip("/")
 
     # Image generation
     IMAGE_OUTPUT_DIR = os.path.join(os.path.dirname(__file__), "static", "images")
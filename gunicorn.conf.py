@@ -0,0 +1,28 @@
+"""Gunicorn settings for running Vessel with several worker processes.
+
+    pip install -r requirements-server.txt
+    gunicorn -c gunicorn.conf.py app:app
+
+Each worker is a full copy of the app. Sessions, pending pings and the
+memory queue live in the shared SQLite database, and one elected worker
+runs the ping scheduler and memory consolidation (services/leader.py).
+"""
+
+import multiprocessing
+import os
+
+bind = f"{os.getenv('FLASK_HOST', '0.0.0.0')}:{os.getenv('FLASK_PORT', '5000')}"
+workers = int(os.getenv("WEB_CONCURRENCY", multiprocessing.cpu_count()))
+
+# SSE streams hold a thread for their whole life, so use plenty of threads
+worker_class = "gthread"
+threads = int(os.getenv("GUNICORN_THREADS", "32"))
+# Turns and ping streams are long-lived; don't kill them as hung requests
+timeout = 0
+graceful_timeout = 30
+
+
+def post_worker_init(worker):
+    from app import start_background
+
+    start_background()
@@ -0,0 +1,33 @@
+"""Shared httpx.AsyncClient for the ASGI server's outbound calls.
+
+httpx is only needed in async mode, so it is imported on first use."""
+
+_client = None
+
+
+def client():
+    """The process-wide async client (created on first use)."""
+    global _client
+    if _client is None:
+        import httpx
+
+        _client = httpx.AsyncClient(
+            timeout=httpx.Timeout(120, connect=10),
+            limits=httpx.Limits(max_connections=None, max_keepalive_connections=64),
+        )
+    return _client
+
+
+def transport_errors():
+    """Exception types meaning the server couldn't be reached or stopped
+    answering: refused or dropped connections and timeouts."""
+    import httpx
+
+    return (httpx.TransportError,)
+
+
+async def close():
+    global _client
+    if _client is not None:
+        await _client.aclose()
+        _client = None
@@ -0,0 +1,232 @@
+"""The decisions of one chat turn, shared by its two drivers: the threaded
+one in app.chat() and the asyncio one in asgi._turn().
+
+A ChatTurn takes over once the debounce is over. It takes the pending
+burst and the load level and settles the plan. It builds the reply's
+system prompt and decides which streamed text goes out in instant mode.
+It splits and paces the reply, and chooses what is stored in the
+history. Nothing here waits or does I/O. The drivers call the model,
+search, Cognee and ComfyUI, wait out delays, write frames and store the
+session, each in its own way.
+"""
+
+import time
+
+from config import Config
+from services import (
+    delivery_service,
+    image_trigger,
+    inner_monologue,
+    load_governor,
+    metrics,
+)
+from services.turn_state import merge_messages
+
+
+class ChatTurn:
+    def __init__(self, session, profile, cancelled, instant):
+        self.session = session
+        self.profile = profile
+        self.cancelled = cancelled
+        self.instant = instant
+        self.burst = session.turns.pending()
+        self.message = merge_messages(self.burst)
+        self.history = session.history + [{"role": "user", "content": self.message}]
+        # Under load, optional stages are switched off (see load_governor)
+        self.level = _serving_level()
+        self.started = time.perf_counter()
+        self.thinking = None
+        self.full_response = ""
+        self.streamed = ""       # reply text already sent in instant mode
+        self.cleaned = ""
+        self.messages = []
+        self.image_prompt = None
+        self.delivered = 0       # messages shown in typed delivery
+        self._tags = image_trigger.TagFilter()
+        self._batcher = delivery_service.StreamBatcher(
+            Config.INSTANT_FLUSH_MS, Config.INSTANT_FLUSH_CHARS
+        )
+
+    def runs(self, stage):
+        """Whether an optional stage runs at this turn's level."""
+        return load_governor.allows(self.level, stage)
+
+    def plan(self, thinking=None):
+        """Settle the plan: the monologue's (None if it didn't run), minus
+        the stages this level switches off."""
+        if thinking is None:
+            thinking = inner_monologue.default_plan()
+        else:
+            self.session.emotion.update(
+                thinking.get("user_emotion", "neutral"),
+                thinking.get("emotional_shift", "stable"),
+            )
+        self.thinking = _degrade_plan(thinking, self.level)
+
+    def search_query(self):
+        """The web search the plan asks for, or None."""
+        if self.thinking.get("needs_web_search"):
+            return self.thinking.get("search_query") or None
+        return None
+
+    def wants_recall(self):
+        return (not self.cancelled.is_set() and self.runs("recall")
+                and _should_recall(self.session, self.thinking, self.history))
+
+    def system_prompt(self, memory_context, search_context):
+        return build_response_system_prompt(
+            self.profile, self.thinking, memory_context, search_context
+        )
+
+    def feed(self, chunk):
+        """Take one streamed chunk. Returns the delta event to send now in
+        instant mode, or None."""
+        self.full_response += chunk
+        if not self.instant:
+            return None
+        return self._delta(self._batcher.add(self._tags.feed(chunk)))
+
+    def end_stream(self):
+        """The last delta event once the stream is over, or None."""
+        if not self.instant:
+            return None
+        text = self._batcher.add(self._tags.flush()) + self._batcher.flush()
+        if self.cancelled.is_set():
+            return None
+        return self._delta(text)
+
+    def _delta(self, text):
+        if not text:
+            return None
+        self.streamed += text
+        return {"type": "delta", "content": text}
+
+    def partial_reply(self):
+        """What to store for a turn cut short after its reply streamed: the
+        part of an instant reply the user already saw, or None."""
+        return self.streamed.strip() or None
+
+    def finish_reply(self):
+        """Count the reply's latency, take out its image tag and split it
+        into messages."""
+        load_governor.observe(self.level, time.perf_counter() - self.started)
+        if self.runs("image"):
+            self.image_prompt = image_trigger.check_response(self.full_response)
+        self.cleaned = image_trigger.clean_response(self.full_response)
+        self.messages = delivery_service.split_response(
+            self.cleaned, self.thinking.get("message_count", 1)
+        )
+
+    def instant_reply(self):
+        """The event replacing the streamed text with the split messages,
+        and what to store for them: the whole cleaned reply, as after a
+        completed typed delivery."""
+        return {"type": "messages", "messages": self.messages}, self.cleaned
+
+    def delivery(self):
+        """Typed delivery as (event, seconds to wait after sending it)
+        steps. Stop at a wait that is cut short."""
+        for i, msg in enumerate(self.messages):
+            if i > 0:
+                delay = delivery_service.inter_message_delay()
+                yield {"type": "typing", "delay": delay}, delay / 1000.0
+            typing_delay = delivery_service.calculate_delay(msg)
+            yield {"type": "typing", "delay": typing_delay}, typing_delay / 1000.0
+            yield {"type": "message", "content": msg}, 0
+            self.delivered += 1
+
+    def delivered_reply(self):
+        """What to store once typed delivery ends: only what the user
+        actually saw, or None if nothing. An undelivered burst stays
+        pending for the turn that superseded this one."""
+        if not self.delivered:
+            return None
+        if self.delivered == len(self.messages):
+            return self.cleaned
+        return "\n\n".join(self.messages[:self.delivered])
+
+
+def build_response_system_prompt(profile, thinking, memory_context="",
+                                 search_context=""):
+    """Build the system prompt for the response generator using
+    the inner monologue's output."""
+    parts = [profile.persona_context]
+
+    if search_context:
+        parts.append(
+            f"\nWeb search results (use to inform your response, cite naturally):\n{search_context}"
+        )
+
+    if memory_context:
+        parts.append(f"\nRelevant context from past conversations:\n{memory_context}")
+
+    # Inject the inner monologue's guidance
+    parts.append(f"\nYour inner thoughts about this moment:\n{thinking.get('inner_thoughts', '')}")
+    parts.append(f"\nResponse strategy: {thinking.get('response_strategy', 'be natural')}")
+    parts.append(f"Tone to use: {thinking.get('tone', 'warm and casual')}")
+    parts.append(f"Message style: {thinking.get('message_style', 'single short message')}")
+
+    target_count = thinking.get("message_count", 1)
+    if target_count > 1:
+        parts.append(
+            f"\nIMPORTANT: Structure your reply as {target_count} separate short messages, "
+            f"separated by double newlines. Write like you're texting — short, natural, "
+            f"conversational. Do NOT write a single long block of text."
+        )
+    else:
+        parts.append(
+            "\nKeep your reply concise and natural, like a single text message."
+        )
+
+    key_points = thinking.get("key_points", [])
+    if key_points:
+        parts.append(f"\nKey points to address: {', '.join(key_points)}")
+
+    # Image generation (decided by inner monologue)
+    if thinking.get("should_generate_image") and thinking.get("image_prompt"):
+        parts.append(
+            "\nInclude this image generation tag at the end of your reply:\n"
+            f"[GENERATE_IMAGE: {thinking['image_prompt']}]"
+        )
+
+    return "\n".join(parts)
+
+
+def _should_recall(session, thinking, history):
+    """Determine whether to run a long-term memory recall."""
+    history_len = len(history)
+
+    # Always recall on the very first message of a session
+    if history_len <= 1:
+        return True
+
+    # Periodic forced recall as a safety net
+    if session.message_counter % Config.MEMORY_FORCED_RECALL_INTERVAL == 0:
+        return True
+
+    # Short conversation: skip unless monologue explicitly requests it
+    if history_len < Config.MEMORY_SHORT_CONV_THRESHOLD:
+        return False
+
+    # Defer to the inner monologue's judgment
+    return thinking.get("needs_memory_lookup", False)
+
+
+def _serving_level():
+    """The load governor's level for a turn starting now, counted and noted
+    in the turn's trace."""
+    level = load_governor.level()
+    name = load_governor.LEVEL_NAMES[level]
+    metrics.TURNS.inc(level=name)
+    metrics.annotate(level=name)
+    return level
+
+
+def _degrade_plan(thinking, level):
+    """Drop the optional stages the monologue asked for that this level
+    switches off."""
+    if not load_governor.allows(level, "image"):
+        thinking["should_generate_image"] = False
+    if not load_governor.allows(level, "web_search"):
+        thinking["needs_web_search"] = False
+    return thinking
@@ -1,3 +1,4 @@
+import copy
 import json
 import os
 import time
@@ -6,13 +7,29 @@ import uuid
 
 import requests
 from config import Config
+from services import async_http, metrics, replay
+
+# Parsed workflows keyed by path, reloaded when the file's mtime changes
+_workflow_cache = {}
+# When each prompt was submitted, while recording or replaying (see replay.poll)
+_submitted = {}
 
 
 def load_workflow(workflow_path=None):
-    """Load a ComfyUI workflow JSON file (API format)."""
+    """Load a ComfyUI workflow JSON file (API format).
+
+    Returns a fresh copy each call, since inject_prompt mutates it.
+    """
     path = workflow_path or Config.WORKFLOW_PATH
-    with open(path, "r") as f:
-        return json.load(f)
+    mtime = os.path.getmtime(path)
+    cached = _workflow_cache.get(path)
+    hit = cached is not None and cached[0] == mtime
+    metrics.cache("workflow", hit)
+    if not hit:
+        with open(path, "r") as f:
+            cached = (mtime, json.load(f))
+        _workflow_cache[path] = cached
+    return copy.deepcopy(cached[1])
 
 
 def _apply_template(prompt_text, prefix="", suffix=""):
@@ -61,10 +78,17 @@ def inject_prompt(workflow, prompt_text, negative_prompt="", prefix="", suffix="
     return workflow
 
 
+class GenerationCancelled(Exception):
+    """Raised when an image job is abandoned before ComfyUI finished it."""
+
+
+def _prompt_payload(workflow):
+    return {"prompt": workflow, "client_id": str(uuid.uuid4())}
+
+
 def queue_prompt(workflow):
     """Submit workflow to ComfyUI. Returns prompt_id."""
-    client_id = str(uuid.uuid4())
-    payload = {"prompt": workflow, "client_id": client_id}
+    payload = _prompt_payload(workflow)
     resp = requests.post(
         f"{Config.COMFYUI_BASE_URL}/prompt", json=payload, timeout=30
     )
@@ -72,58 +96,225 @@ def queue_prompt(workflow):
     return resp.json()["prompt_id"]
 
 
-def poll_history(prompt_id, timeout=120, interval=1.0):
-    """Poll /history/{prompt_id} until the result appears."""
-    url = f"{Config.COMFYUI_BASE_URL}/history/{prompt_id}"
+def cancel_prompt(prompt_id):
+    """Stop a submitted prompt: drop it from the pending queue, or interrupt
+    it if it is already running. Best effort — errors are swallowed."""
+    if replay.replaying():
+        return
+    try:
+        resp = requests.get(f"{Config.COMFYUI_BASE_URL}/queue", timeout=10)
+        resp.raise_for_status()
+        path, body = _cancel_request(resp.json(), prompt_id)
+        requests.post(f"{Config.COMFYUI_BASE_URL}{path}", json=body, timeout=10)
+    except Exception:
+        pass
+
+
+def _cancel_request(queue, prompt_id):
+    """(path, body) that stops the prompt, given the /queue listing."""
+    # Queue entries are [number, prompt_id, prompt, extra_data, outputs]
+    running = any(
+        len(item) > 1 and item[1] == prompt_id
+        for item in queue.get("queue_running", [])
+    )
+    if running:
+        return "/interrupt", {"prompt_id": prompt_id}
+    return "/queue", {"delete": [prompt_id]}
+
+
+def get_history(prompt_id):
+    """Fetch the /history entry for a prompt, or None if it hasn't finished."""
+    def fetch():
+        resp = requests.get(
+            f"{Config.COMFYUI_BASE_URL}/history/{prompt_id}", timeout=10
+        )
+        resp.raise_for_status()
+        return resp.json().get(prompt_id)
+
+    return replay.poll(
+        "comfyui", "history", {"prompt_id": prompt_id}, fetch,
+        _submitted.get(prompt_id, 0.0),
+    )
+
+
+def poll_history(prompt_id, timeout=120, interval=1.0, cancel_event=None):
+    """Poll /history/{prompt_id} until the result appears.
+
+    If cancel_event is set while waiting, the prompt is cancelled in
+    ComfyUI and GenerationCancelled is raised.
+    """
     start = time.time()
     while time.time() - start < timeout:
-        resp = requests.get(url, timeout=10)
-        resp.raise_for_status()
-        history = resp.json()
-        if prompt_id in history:
-            return history[prompt_id]
-        time.sleep(interval)
+        history = get_history(prompt_id)
+        if history is not None:
+            return history
+        if cancel_event is None:
+            time.sleep(interval)
+        elif cancel_event.wait(interval):
+            cancel_prompt(prompt_id)
+            raise GenerationCancelled(prompt_id)
     raise TimeoutError(
         f"ComfyUI did not complete prompt {prompt_id} within {timeout}s"
     )
 
 
-def retrieve_image(filename, subfolder="", folder_type="output"):
-    """Download image bytes from ComfyUI /view endpoint."""
+def _view_url(filename, subfolder="", folder_type="output"):
     params = urllib.parse.urlencode(
         {"filename": filename, "subfolder": subfolder, "type": folder_type}
     )
-    url = f"{Config.COMFYUI_BASE_URL}/view?{params}"
-    resp = requests.get(url, timeout=30)
-    resp.raise_for_status()
-    return resp.content
+    return f"{Config.COMFYUI_BASE_URL}/view?{params}"
+
+
+def retrieve_image(filename, subfolder="", folder_type="output"):
+    """Download image bytes from ComfyUI /view endpoint."""
+    def fetch():
+        resp = requests.get(_view_url(filename, subfolder, folder_type), timeout=30)
+        resp.raise_for_status()
+        return resp.content
+
+    return replay.call(
+        "comfyui", "view", _view_request(filename, subfolder, folder_type), fetch
+    )
+
+
+def _view_request(filename, subfolder, folder_type):
+    return {"filename": filename, "subfolder": subfolder, "type": folder_type}
+
+
+def submit_image(prompt_text, workflow_path=None, negative_prompt="",
+                 prompt_prefix="", prompt_suffix=""):
+    """Load the workflow, inject the prompt and queue it. Returns prompt_id."""
+    workflow = load_workflow(workflow_path)
+    workflow = inject_prompt(workflow, prompt_text, negative_prompt,
+                             prompt_prefix, prompt_suffix)
+    prompt_id = replay.call(
+        "comfyui", "prompt", _prompt_request(prompt_text, negative_prompt),
+        lambda: queue_prompt(workflow),
+    )
+    _note_submitted(prompt_id)
+    return prompt_id
+
+
+def _prompt_request(prompt_text, negative_prompt):
+    return {"prompt": prompt_text, "negative_prompt": negative_prompt}
+
+
+def _note_submitted(prompt_id):
+    if replay.recording() or replay.replaying():
+        _submitted[prompt_id] = time.time()
+
+
+def save_output(prompt_id, history):
+    """Download the first image in a finished prompt's outputs and save it.
+
+    Returns the URL path to the saved image (relative to static root).
+    """
+    image_info = _first_image(history)
+    image_data = retrieve_image(
+        image_info["filename"],
+        image_info.get("subfolder", ""),
+        image_info.get("type", "output"),
+    )
+    return _write_image(prompt_id, image_info, image_data)
+
+
+def _first_image(history):
+    for node_output in history["outputs"].values():
+        if node_output.get("images"):
+            return node_output["images"][0]
+    raise RuntimeError("No images found in ComfyUI output")
+
+
+def _write_image(prompt_id, image_info, image_data):
+    """Save image bytes under static/images; returns the URL path."""
+    local_filename = f"{prompt_id}_{image_info['filename']}"
+    os.makedirs(Config.IMAGE_OUTPUT_DIR, exist_ok=True)
+    local_path = os.path.join(Config.IMAGE_OUTPUT_DIR, local_filename)
+    with open(local_path, "wb") as f:
+        f.write(image_data)
+    return f"/static/images/{local_filename}"
 
 
 def generate_image(prompt_text, workflow_path=None, negative_prompt="",
-                    prompt_prefix="", prompt_suffix=""):
+                    prompt_prefix="", prompt_suffix="", cancel_event=None):
     """Full pipeline: load → inject → submit → poll → retrieve → save.
 
     Returns the URL path to the saved image (relative to static root).
     """
+    prompt_id = submit_image(prompt_text, workflow_path, negative_prompt,
+                             prompt_prefix, prompt_suffix)
+    history = poll_history(prompt_id, cancel_event=cancel_event)
+    return save_output(prompt_id, history)
+
+
+# Async twins of the request helpers, used by the ASGI server
+
+async def asubmit_image(prompt_text, workflow_path=None, negative_prompt="",
+                        prompt_prefix="", prompt_suffix=""):
+    """Async submit_image(). Returns prompt_id."""
     workflow = load_workflow(workflow_path)
     workflow = inject_prompt(workflow, prompt_text, negative_prompt,
                              prompt_prefix, prompt_suffix)
-    prompt_id = queue_prompt(workflow)
-    history = poll_history(prompt_id)
 
-    for node_output in history["outputs"].values():
-        if "images" in node_output:
-            for image_info in node_output["images"]:
-                image_data = retrieve_image(
-                    image_info["filename"],
-                    image_info.get("subfolder", ""),
-                    image_info.get("type", "output"),
-                )
-                local_filename = f"{prompt_id}_{image_info['filename']}"
-                os.makedirs(Config.IMAGE_OUTPUT_DIR, exist_ok=True)
-                local_path = os.path.join(Config.IMAGE_OUTPUT_DIR, local_filename)
-                with open(local_path, "wb") as f:
-                    f.write(image_data)
-                return f"/static/images/{local_filename}"
+    async def queue():
+        resp = await async_http.client().post(
+            f"{Config.COMFYUI_BASE_URL}/prompt", json=_prompt_payload(workflow),
+            timeout=30,
+        )
+        resp.raise_for_status()
+        return resp.json()["prompt_id"]
 
-    raise RuntimeError("No images found in ComfyUI output")
+    prompt_id = await replay.acall(
+        "comfyui", "prompt", _prompt_request(prompt_text, negative_prompt), queue
+    )
+    _note_submitted(prompt_id)
+    return prompt_id
+
+
+async def aget_history(prompt_id):
+    """Async get_history()."""
+    async def fetch():
+        resp = await async_http.client().get(
+            f"{Config.COMFYUI_BASE_URL}/history/{prompt_id}", timeout=10
+        )
+        resp.raise_for_status()
+        return resp.json().get(prompt_id)
+
+    return await replay.apoll(
+        "comfyui", "history", {"prompt_id": prompt_id}, fetch,
+        _submitted.get(prompt_id, 0.0),
+    )
+
+
+async def acancel_prompt(prompt_id):
+    """Async cancel_prompt(). Best effort — errors are swallowed."""
+    if replay.replaying():
+        return
+    client = async_http.client()
+    try:
+        resp = await client.get(f"{Config.COMFYUI_BASE_URL}/queue", timeout=10)
+        resp.raise_for_status()
+        path, body = _cancel_request(resp.json(), prompt_id)
+        await client.post(f"{Config.COMFYUI_BASE_URL}{path}", json=body, timeout=10)
+    except Exception:
+        pass
+
+
+async def asave_output(prompt_id, history):
+    """Async save_output()."""
+    image_info = _first_image(history)
+    location = (
+        image_info["filename"],
+        image_info.get("subfolder", ""),
+        image_info.get("type", "output"),
+    )
+
+    async def fetch():
+        resp = await async_http.client().get(_view_url(*location), timeout=30)
+        resp.raise_for_status()
+        return resp.content
+
+    image_data = await replay.acall(
+        "comfyui", "view", _view_request(*location), fetch
+    )
+    return _write_image(prompt_id, image_info, image_data)
@@ -0,0 +1,134 @@
+"""Append-only, per-session conversation log in SQLite (WAL mode).
+
+Every message and every change to a session's small mutable state
+(emotion trajectory, unflushed memory batch, recall counter) is appended
+as an event. Every CONVERSATION_SNAPSHOT_EVERY events a compact snapshot
+is written: the folded state plus only the last CONVERSATION_RESTORE_MESSAGES
+messages. Restoring a session reads its latest snapshot and the few events
+after it, never the whole history. Older events stay in the log as an
+archive until the session is forgotten.
+"""
+
+import json
+import time
+
+from config import Config
+from services import db
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS events (
+    session_id TEXT NOT NULL,
+    seq INTEGER NOT NULL,
+    kind TEXT NOT NULL,           -- "message" or "state"
+    data TEXT NOT NULL,           -- JSON
+    created_at REAL NOT NULL,
+    PRIMARY KEY (session_id, seq)
+);
+CREATE TABLE IF NOT EXISTS snapshots (
+    session_id TEXT PRIMARY KEY,
+    upto_seq INTEGER NOT NULL,    -- last event folded into the snapshot
+    data TEXT NOT NULL,           -- JSON: {"messages": [...], "state": {...}}
+    created_at REAL NOT NULL
+);
+"""
+
+
+def append(session_id, kind, data):
+    """Append one event and return its sequence number."""
+    with db.write(_SCHEMA) as conn:
+        seq = last_seq(session_id) + 1
+        conn.execute(
+            "INSERT INTO events (session_id, seq, kind, data, created_at) "
+            "VALUES (?, ?, ?, ?, ?)",
+            (session_id, seq, kind, json.dumps(data), time.time()),
+        )
+    return seq
+
+
+def save_snapshot(session_id, upto_seq):
+    """Replace the session's snapshot with one covering events up to
+    `upto_seq`, folded from the log itself so that events written by other
+    processes are included. Only the restore window of messages is kept."""
+    with db.write(_SCHEMA) as conn:
+        messages, state, _, _ = _fold(conn, session_id, upto_seq)
+        data = {"messages": messages, "state": state}
+        conn.execute(
+            "INSERT OR REPLACE INTO snapshots (session_id, upto_seq, data, created_at) "
+            "VALUES (?, ?, ?, ?)",
+            (session_id, upto_seq, json.dumps(data), time.time()),
+        )
+        # State events before the snapshot are folded into it
+        conn.execute(
+            "DELETE FROM events WHERE session_id = ? AND kind = 'state' AND seq <= ?",
+            (session_id, upto_seq),
+        )
+
+
+def load(session_id):
+    """Rebuild a session from its snapshot and the events after it.
+
+    Returns (messages, state, last_seq, snapshot_seq); messages holds at
+    most the restore window plus whatever was appended since the snapshot,
+    and state is the latest saved state dict ({} if none).
+    """
+    return _fold(db.connect(_SCHEMA), session_id)
+
+
+def _fold(conn, session_id, upto_seq=None):
+    """load() on the given connection, up to `upto_seq` if given."""
+    row = conn.execute(
+        "SELECT upto_seq, data FROM snapshots WHERE session_id = ?",
+        (session_id,),
+    ).fetchone()
+    snapshot_seq, messages, state = 0, [], {}
+    if row is not None:
+        snapshot_seq = row[0]
+        data = json.loads(row[1])
+        messages, state = data.get("messages", []), data.get("state", {})
+
+    latest = snapshot_seq
+    query = "SELECT seq, kind, data FROM events WHERE session_id = ? AND seq > ?"
+    params = [session_id, snapshot_seq]
+    if upto_seq is not None:
+        query += " AND seq <= ?"
+        params.append(upto_seq)
+    events = conn.execute(query + " ORDER BY seq", params)
+    for seq, kind, data in events:
+        latest = seq
+        if kind == "message":
+            messages.append(json.loads(data))
+        elif kind == "state":
+            state = json.loads(data)
+
+    window = Config.CONVERSATION_RESTORE_MESSAGES
+    return messages[-window:] if window else [], state, latest, snapshot_seq
+
+
+def last_seq(session_id):
+    """Sequence number of the session's newest event (0 if none). Folded
+    state events are deleted, so the snapshot may be newer than every
+    remaining event."""
+    row = db.connect(_SCHEMA).execute(
+        "SELECT MAX("
+        " (SELECT COALESCE(MAX(seq), 0) FROM events WHERE session_id = ?),"
+        " (SELECT COALESCE(MAX(upto_seq), 0) FROM snapshots WHERE session_id = ?))",
+        (session_id, session_id),
+    ).fetchone()
+    return row[0]
+
+
+def messages_after(session_id, seq):
+    """Messages logged after `seq`, as (seq, message) pairs, oldest first."""
+    rows = db.connect(_SCHEMA).execute(
+        "SELECT seq, data FROM events "
+        "WHERE session_id = ? AND kind = 'message' AND seq > ? ORDER BY seq",
+        (session_id, seq),
+    )
+    return [(seq, json.loads(data)) for seq, data in rows]
+
+
+def forget(session_id):
+    """Delete every event and snapshot for the session."""
+    with db.write(_SCHEMA) as conn:
+        conn.execute("DELETE FROM events WHERE session_id = ?", (session_id,))
+        conn.execute("DELETE FROM snapshots WHERE session_id = ?", (session_id,))
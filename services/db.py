@@ -0,0 +1,52 @@
+"""Shared SQLite database (WAL mode) for state that outlives the process
+or must be visible to every worker process: the conversation log, leader
+leases, the ping mailbox and the memory consolidation queue.
+
+Each thread gets its own connection. Modules pass their CREATE TABLE
+script to connect()/write(); it is applied once per process."""
+
+import os
+import sqlite3
+import threading
+from contextlib import contextmanager
+
+from config import Config
+
+_local = threading.local()
+_schema_lock = threading.Lock()
+_applied = set()
+
+
+def connect(schema=None):
+    """This thread's connection, with `schema` applied."""
+    conn = getattr(_local, "conn", None)
+    if conn is None:
+        path = Config.CONVERSATION_DB_PATH
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        conn = sqlite3.connect(path, timeout=10, isolation_level=None)
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("PRAGMA synchronous=NORMAL")
+        _local.conn = conn
+
+    if schema is not None and schema not in _applied:
+        with _schema_lock:
+            if schema not in _applied:
+                conn.executescript(schema)
+                _applied.add(schema)
+    return conn
+
+
+@contextmanager
+def write(schema=None):
+    """A write transaction that takes the database lock up front, so a
+    read-then-write inside it can't race another thread or process."""
+    conn = connect(schema)
+    conn.execute("BEGIN IMMEDIATE")
+    try:
+        yield conn
+    except BaseException:
+        conn.execute("ROLLBACK")
+        raise
+    conn.execute("COMMIT")
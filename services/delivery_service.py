@@ -2,10 +2,16 @@
 
 Splits a single LLM response into multiple short messages and
 calculates per-message typing delays to simulate natural texting.
+In "instant" mode the reply is instead streamed as it is generated,
+in batches (see StreamBatcher), and only split once it is complete.
 """
 
 import random
 import re
+import time
+
+# "typed" simulates texting; "instant" streams the reply as it arrives
+MODES = ("typed", "instant")
 
 
 # Milliseconds per character for simulated typing speed
@@ -56,6 +62,47 @@ def split_response(text, target_count=None):
     return [m.strip() for m in messages if m.strip()]
 
 
+def mode(requested, default):
+    """The delivery mode for a turn: the request's choice if it names one,
+    else the profile's."""
+    if requested in MODES:
+        return requested
+    return default if default in MODES else "typed"
+
+
+class StreamBatcher:
+    """Merges streamed text into fewer, larger SSE frames. A batch is
+    released once it holds `max_chars` characters or `max_ms` have passed
+    since the previous one, checked as text arrives."""
+
+    def __init__(self, max_ms, max_chars):
+        self.max_seconds = max_ms / 1000.0
+        self.max_chars = max_chars
+        self._parts = []
+        self._size = 0
+        self._last = time.perf_counter()
+
+    def add(self, text):
+        """Buffer text; returns a batch when one is due, else ""."""
+        if text:
+            self._parts.append(text)
+            self._size += len(text)
+        if not self._size:
+            return ""
+        if (self._size >= self.max_chars
+                or time.perf_counter() - self._last >= self.max_seconds):
+            return self.flush()
+        return ""
+
+    def flush(self):
+        """Release whatever is buffered."""
+        text = "".join(self._parts)
+        self._parts = []
+        self._size = 0
+        self._last = time.perf_counter()
+        return text
+
+
 def calculate_delay(message_text):
     """Calculate a realistic typing delay in milliseconds for a message."""
     length = len(message_text)
@@ -24,6 +24,10 @@ class EmotionTracker:
         parts = [f"{e['emotion']} ({e['shift']})" for e in recent]
         return "User emotional trajectory (oldest→newest): " + " → ".join(parts)
 
+    def to_dict(self):
+        return {"current": self.current, "history": list(self._history)}
 
-# Module-level singleton (single-user app)
-tracker = EmotionTracker()
+    def restore(self, data):
+        """Load state saved with to_dict()."""
+        self.current = data.get("current", "neutral")
+        self._history = list(data.get("history", []))[-self._max :]
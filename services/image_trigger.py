@@ -1,6 +1,7 @@
 import re
 
 IMAGE_TAG_PATTERN = re.compile(r"\[GENERATE_IMAGE:\s*(.+?)\]", re.DOTALL)
+_TAG_OPEN = "[GENERATE_IMAGE:"
 
 
 def check_response(response_text):
@@ -14,3 +15,47 @@ def check_response(response_text):
 def clean_response(response_text):
     """Remove [GENERATE_IMAGE:] tags from text."""
     return IMAGE_TAG_PATTERN.sub("", response_text).strip()
+
+
+class TagFilter:
+    """Removes [GENERATE_IMAGE:] tags from a reply that arrives in pieces.
+    Text that may be the start of a tag is held back until it is known not
+    to be one."""
+
+    def __init__(self):
+        self._pending = ""
+        self._in_tag = False
+
+    def feed(self, text):
+        """Add the next piece; returns the text now safe to show."""
+        self._pending += text
+        out = []
+        while self._pending:
+            if self._in_tag:
+                end = self._pending.find("]")
+                if end == -1:
+                    break
+                self._pending = self._pending[end + 1:]
+                self._in_tag = False
+                continue
+            start = self._pending.find("[")
+            if start == -1:
+                out.append(self._pending)
+                self._pending = ""
+                break
+            out.append(self._pending[:start])
+            self._pending = self._pending[start:]
+            if self._pending.startswith(_TAG_OPEN):
+                self._in_tag = True
+            elif _TAG_OPEN.startswith(self._pending):
+                break  # could still become a tag
+            else:
+                out.append("[")
+                self._pending = self._pending[1:]
+        return "".join(out)
+
+    def flush(self):
+        """What is still held back once the reply has ended. An unclosed
+        tag is returned as text, as clean_response() leaves it."""
+        text, self._pending, self._in_tag = self._pending, "", False
+        return text
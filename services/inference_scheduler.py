@@ -0,0 +1,279 @@
+"""Priority-aware admission in front of Ollama.
+
+Every inference call — replies, the inner monologue, memory recall, ping
+pregeneration and Cognee consolidation — takes a slot here first. At most
+OLLAMA_NUM_PARALLEL calls per healthy backend run at once (match the
+servers' parallel slots);
+the rest wait in priority order, so a background job can never sit in
+front of a user's reply. Calls hold their slot for their whole duration;
+there is no preemption. Async callers (the ASGI server) wait in the same
+queue through acquire_async().
+"""
+
+import asyncio
+import heapq
+import itertools
+import threading
+import time
+from contextlib import contextmanager
+
+from config import Config
+from services import metrics, ollama_backends
+
+# Priority classes, most urgent first
+INTERACTIVE = 0
+MONOLOGUE = 1
+RECALL = 2
+PING = 3
+CONSOLIDATION = 4
+
+PRIORITY_NAMES = {
+    INTERACTIVE: "interactive",
+    MONOLOGUE: "monologue",
+    RECALL: "recall",
+    PING: "ping",
+    CONSOLIDATION: "consolidation",
+}
+
+# Classes at or below this priority can't take the reserved slots
+_BACKGROUND = PING
+
+# How often a waiting caller re-checks its cancel event
+_CANCEL_POLL_SECONDS = 0.25
+
+# With too few slots to reserve any, background work only starts once no
+# user-facing call has run or waited for this long: a call can't be
+# preempted, so a cognify started mid-conversation would hold up the reply
+_SOLE_SLOT_QUIET_SECONDS = 10
+
+
+class SchedulerBusy(Exception):
+    """Raised when admission control refuses a request."""
+
+
+class _Waiter:
+    def __init__(self, priority, on_grant=None):
+        self.priority = priority
+        self.enqueued_at = time.time()
+        self.granted = threading.Event()
+        self.on_grant = on_grant  # called under _lock when the slot is granted
+        self.abandoned = False
+
+
+_lock = threading.Lock()
+_queue = []                      # (priority, seq, _Waiter)
+_seq = itertools.count()
+_running = {p: 0 for p in PRIORITY_NAMES}
+_last_active = 0.0
+_user_active = 0.0               # last grant or release of a user-facing call
+_stats = {
+    p: {"admitted": 0, "rejected": 0, "cancelled": 0,
+        "wait_seconds_total": 0.0, "wait_seconds_max": 0.0}
+    for p in PRIORITY_NAMES
+}
+
+
+def _limit():
+    backends = max(ollama_backends.healthy_count(), 1)
+    return max(Config.OLLAMA_NUM_PARALLEL, 1) * backends
+
+
+def _reserved():
+    # Keep at least one slot usable by background work
+    return min(max(Config.OLLAMA_RESERVED_SLOTS, 0), _limit() - 1)
+
+
+def _can_run_locked(priority):
+    """Whether a call of this priority may start now. Caller holds _lock."""
+    in_flight = sum(_running.values())
+    if in_flight >= _limit():
+        return False
+    if priority >= _BACKGROUND:
+        if _reserved() < Config.OLLAMA_RESERVED_SLOTS and not _user_quiet_locked():
+            return False
+        background = sum(n for p, n in _running.items() if p >= _BACKGROUND)
+        return background < _limit() - _reserved()
+    return True
+
+
+def _user_quiet_locked():
+    """Whether no user-facing call is running or queued, nor has been for
+    _SOLE_SLOT_QUIET_SECONDS. Caller holds _lock."""
+    if any(_running[p] for p in _running if p < _BACKGROUND):
+        return False
+    if any(w.priority < _BACKGROUND for _, _, w in _queue if not w.abandoned):
+        return False
+    return time.time() - _user_active >= _SOLE_SLOT_QUIET_SECONDS
+
+
+def _queued_locked():
+    return sum(1 for _, _, w in _queue if not w.abandoned)
+
+
+def _grant_locked(waiter):
+    """Mark a waiter as running and record its wait. Caller holds _lock."""
+    global _last_active, _user_active
+    waited = time.time() - waiter.enqueued_at
+    stats = _stats[waiter.priority]
+    stats["admitted"] += 1
+    stats["wait_seconds_total"] += waited
+    stats["wait_seconds_max"] = max(stats["wait_seconds_max"], waited)
+    metrics.INFERENCE_WAIT_SECONDS.observe(
+        waited, priority=PRIORITY_NAMES[waiter.priority]
+    )
+    _running[waiter.priority] += 1
+    _last_active = time.time()
+    if waiter.priority < _BACKGROUND:
+        _user_active = _last_active
+    waiter.granted.set()
+    if waiter.on_grant is not None:
+        waiter.on_grant()
+
+
+def _dispatch_locked():
+    """Hand free slots to queued waiters in priority order. Caller holds
+    _lock. Background classes sort last, so once the head of the queue
+    can't run, nothing behind it can either."""
+    while _queue:
+        priority, _, waiter = _queue[0]
+        if waiter.abandoned:
+            heapq.heappop(_queue)
+            continue
+        if not _can_run_locked(priority):
+            break
+        heapq.heappop(_queue)
+        _grant_locked(waiter)
+
+
+def acquire(priority=INTERACTIVE, cancel_event=None, timeout=None):
+    """Wait for an inference slot.
+
+    Returns True once the slot is held (pair with release()), or False if
+    cancel_event was set or `timeout` seconds passed first. Raises
+    SchedulerBusy if the queue is full; interactive calls are never
+    refused.
+    """
+    waiter = _enqueue(priority)
+    deadline = None if timeout is None else time.time() + timeout
+    while not waiter.granted.wait(_CANCEL_POLL_SECONDS):
+        if _should_give_up(cancel_event, deadline):
+            return _give_up(waiter)
+        _redispatch(waiter)
+    return True
+
+
+async def acquire_async(priority=INTERACTIVE, cancel_event=None, timeout=None):
+    """acquire() for coroutines: waits without holding a thread."""
+    loop = asyncio.get_running_loop()
+    granted = loop.create_future()
+
+    def on_grant():
+        loop.call_soon_threadsafe(
+            lambda: granted.done() or granted.set_result(True)
+        )
+
+    waiter = _enqueue(priority, on_grant)
+    deadline = None if timeout is None else time.time() + timeout
+    try:
+        while not waiter.granted.is_set():
+            try:
+                await asyncio.wait_for(asyncio.shield(granted), _CANCEL_POLL_SECONDS)
+            except asyncio.TimeoutError:
+                if _should_give_up(cancel_event, deadline):
+                    return _give_up(waiter)
+                _redispatch(waiter)
+    except asyncio.CancelledError:
+        if _give_up(waiter):
+            release(priority)
+        raise
+    return True
+
+
+def _enqueue(priority, on_grant=None):
+    """Queue a waiter (granting it at once if a slot is free)."""
+    waiter = _Waiter(priority, on_grant)
+    with _lock:
+        if priority != INTERACTIVE and _queued_locked() >= Config.OLLAMA_MAX_QUEUE:
+            _stats[priority]["rejected"] += 1
+            raise SchedulerBusy(
+                f"Inference queue full; refused {PRIORITY_NAMES[priority]} request"
+            )
+        heapq.heappush(_queue, (priority, next(_seq), waiter))
+        _dispatch_locked()
+    return waiter
+
+
+def _should_give_up(cancel_event, deadline):
+    cancelled = cancel_event is not None and cancel_event.is_set()
+    expired = deadline is not None and time.time() >= deadline
+    return cancelled or expired
+
+
+def _redispatch(waiter):
+    """Let a waiting background call start once the user-facing queue has
+    been quiet long enough: nothing else wakes the queue when that happens."""
+    if waiter.priority >= _BACKGROUND:
+        with _lock:
+            _dispatch_locked()
+
+
+def _give_up(waiter):
+    """Withdraw a waiter. Returns True if it was granted at the last
+    moment, in which case the caller owns the slot after all."""
+    with _lock:
+        if waiter.granted.is_set():
+            return True
+        waiter.abandoned = True
+        _stats[waiter.priority]["cancelled"] += 1
+        _dispatch_locked()
+    return False
+
+
+def release(priority=INTERACTIVE):
+    """Give back a slot taken with acquire()."""
+    global _last_active, _user_active
+    with _lock:
+        _running[priority] -= 1
+        _last_active = time.time()
+        if priority < _BACKGROUND:
+            _user_active = _last_active
+        _dispatch_locked()
+
+
+@contextmanager
+def slot(priority=INTERACTIVE, cancel_event=None):
+    """Context manager around acquire()/release(). Yields False (and holds
+    nothing) if the wait was cancelled."""
+    acquired = acquire(priority, cancel_event)
+    try:
+        yield acquired
+    finally:
+        if acquired:
+            release(priority)
+
+
+def idle_for():
+    """Seconds since the last inference call finished (0 while any call is
+    running or waiting)."""
+    with _lock:
+        if sum(_running.values()) or _queued_locked():
+            return 0.0
+        return time.time() - _last_active
+
+
+def stats():
+    """Snapshot of per-class queue depth, in-flight count and wait times."""
+    with _lock:
+        queued = {p: 0 for p in PRIORITY_NAMES}
+        for _, _, w in _queue:
+            if not w.abandoned:
+                queued[w.priority] += 1
+        return {
+            "limit": _limit(),
+            "classes": {
+                PRIORITY_NAMES[p]: dict(
+                    _stats[p], queued=queued[p], running=_running[p]
+                )
+                for p in PRIORITY_NAMES
+            },
+        }
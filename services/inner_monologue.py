@@ -7,13 +7,14 @@ Returns structured JSON that guides the response generator.
 
 import json
 from services import ollama_service
+from services.inference_scheduler import SchedulerBusy
 
 MONOLOGUE_SYSTEM_PROMPT = """\
 You are the inner thought process of a chatbot character. You do NOT produce the \
 visible reply — you only think and plan. Analyze the conversation and output a \
 JSON object with these fields:
 
-{
+{{
   "user_emotion": "the user's current emotional state (e.g. happy, frustrated, curious, sad, playful, neutral)",
   "emotional_shift": "how the user's emotion changed from the previous message (e.g. stable, escalating, calming, shifted)",
   "response_strategy": "how to respond (e.g. match energy, be supportive, be playful, ask follow-up, go deep, keep brief)",
@@ -28,7 +29,7 @@ JSON object with these fields:
   "needs_web_search": false,
   "search_query": null,
   "inner_thoughts": "free-form reasoning about the character's feelings, memories, and what they would naturally think before replying"
-}
+}}
 
 Rules:
 - message_count should be 1-3, driven by emotional energy:
@@ -57,22 +58,75 @@ or when the conversation naturally calls for it — not as a default filler.
 """
 
 
-def think(conversation_history, persona_context, emotion_history="",
-          image_frequency="only when a visual would genuinely add value",
-          image_prompt_instructions=""):
-    """Run the inner monologue. Returns a dict with thinking results."""
+def build_system_prompt(persona_context,
+                        image_frequency="only when a visual would genuinely add value",
+                        image_prompt_instructions=""):
+    """Build the static part of the monologue's system prompt. It only
+    depends on the profile, so callers can compile it once and reuse it."""
     # Build a focused prompt with just enough context
     prompt = MONOLOGUE_SYSTEM_PROMPT.format(
         image_frequency=image_frequency,
         image_prompt_instructions=image_prompt_instructions,
     )
-    system = f"{prompt}\n\nCharacter context:\n{persona_context}"
+    return f"{prompt}\n\nCharacter context:\n{persona_context}"
+
+
+def think(conversation_history, persona_context=None, emotion_history="",
+          image_frequency="only when a visual would genuinely add value",
+          image_prompt_instructions="", cancel_event=None, session_key=None,
+          system_prompt=None):
+    """Run the inner monologue. Returns a dict with thinking results.
+
+    Pass a precompiled `system_prompt` from build_system_prompt() to skip
+    rebuilding it; persona_context and the image settings are then unused.
+    If the inference queue is full the turn goes ahead on default_plan().
+    """
+    system = _full_system_prompt(
+        system_prompt, persona_context, image_frequency,
+        image_prompt_instructions, emotion_history,
+    )
+    try:
+        response = ollama_service.chat(
+            conversation_history, system_prompt=system, cancel_event=cancel_event,
+            role="monologue", session_key=session_key,
+        )
+    except SchedulerBusy:
+        return default_plan()  # shed the planning, not the user's reply
+    return parse_plan(response)
+
+
+async def athink(conversation_history, persona_context=None, emotion_history="",
+                 image_frequency="only when a visual would genuinely add value",
+                 image_prompt_instructions="", cancel_event=None,
+                 session_key=None, system_prompt=None):
+    """Async twin of think() for the ASGI server."""
+    system = _full_system_prompt(
+        system_prompt, persona_context, image_frequency,
+        image_prompt_instructions, emotion_history,
+    )
+    try:
+        response = await ollama_service.achat(
+            conversation_history, system_prompt=system, cancel_event=cancel_event,
+            role="monologue", session_key=session_key,
+        )
+    except SchedulerBusy:
+        return default_plan()  # shed the planning, not the user's reply
+    return parse_plan(response)
+
+
+def _full_system_prompt(system_prompt, persona_context, image_frequency,
+                        image_prompt_instructions, emotion_history):
+    system = system_prompt or build_system_prompt(
+        persona_context, image_frequency, image_prompt_instructions
+    )
     if emotion_history:
         system += f"\n\nRecent emotional trajectory:\n{emotion_history}"
+    return system
 
-    response = ollama_service.chat(conversation_history, system_prompt=system)
 
-    # Parse JSON from response, handling potential markdown wrapping
+def parse_plan(response):
+    """Parse the monologue's JSON, falling back to default_plan()."""
+    # Handle potential markdown wrapping
     text = response.strip()
     if text.startswith("```"):
         lines = text.split("\n")
@@ -82,19 +136,24 @@ def think(conversation_history, persona_context, emotion_history="",
         return json.loads(text)
     except json.JSONDecodeError:
         # Fallback if model doesn't produce valid JSON
-        return {
-            "user_emotion": "neutral",
-            "emotional_shift": "stable",
-            "response_strategy": "be natural and conversational",
-            "message_style": "single short message",
-            "message_count": 1,
-            "tone": "warm and casual",
-            "key_points": [],
-            "should_generate_image": False,
-            "image_prompt": None,
-            "needs_memory_lookup": False,
-            "should_store_memory": False,
-            "needs_web_search": False,
-            "search_query": None,
-            "inner_thoughts": "",
-        }
+        return default_plan()
+
+
+def default_plan():
+    """A neutral plan: one warm, casual message and no optional stages."""
+    return {
+        "user_emotion": "neutral",
+        "emotional_shift": "stable",
+        "response_strategy": "be natural and conversational",
+        "message_style": "single short message",
+        "message_count": 1,
+        "tone": "warm and casual",
+        "key_points": [],
+        "should_generate_image": False,
+        "image_prompt": None,
+        "needs_memory_lookup": False,
+        "should_store_memory": False,
+        "needs_web_search": False,
+        "search_query": None,
+        "inner_thoughts": "",
+    }
@@ -0,0 +1,176 @@
+"""Leader election for background work that must run in only one process.
+
+Every process (each gunicorn worker, or the single dev server) competes
+for a lease in the shared database and renews it while it is alive. The
+holder runs the proactive ping scheduler and drains the memory
+consolidation queue. If it dies, another process takes over once the
+lease expires after LEADER_LEASE_SECONDS.
+
+The leader learns about users from the session activity table. For
+writing pings it keeps, per active session, only the last few messages
+and a count of user messages, read from the conversation log."""
+
+import os
+import socket
+import sqlite3
+import threading
+import time
+
+from config import Config
+from services import conversation_log, memory_service, ping_service, shared_state
+from services.inference_scheduler import SchedulerBusy
+
+_LEASE = "background"
+# How often the leader picks up activity recorded by other workers
+_SYNC_SECONDS = 1.0
+# Sessions idle longer than this are no longer scheduled for pings
+_TRACK_SECONDS = 7 * 24 * 3600
+# How long the consolidation loop waits when idle or refused by Ollama
+_MEMORY_POLL_SECONDS = 5
+_MEMORY_RETRY_SECONDS = 30
+
+_holder = f"{socket.gethostname()}:{os.getpid()}"
+_is_leader = threading.Event()
+_lock = threading.Lock()
+_started = False
+_tracked = {}   # session id -> {"recent", "user_turns", "seq", "active"}
+
+
+def start():
+    """Join the election. Safe to call more than once per process."""
+    global _started
+    with _lock:
+        if _started:
+            return
+        _started = True
+    threading.Thread(target=_run, name="leader-election", daemon=True).start()
+    threading.Thread(
+        target=_consolidate, name="memory-consolidation", daemon=True
+    ).start()
+
+
+def stop():
+    """Hand the lease back so another process can take over at once."""
+    if _is_leader.is_set():
+        _step_down()
+        try:
+            shared_state.release_lease(_LEASE, _holder)
+        except sqlite3.Error:
+            pass
+
+
+def is_leader():
+    return _is_leader.is_set()
+
+
+def status():
+    """This process's identity and the current lease holder."""
+    try:
+        current = shared_state.lease_holder(_LEASE)
+    except sqlite3.Error:
+        current = None
+    return {"process": _holder, "leader": is_leader(), "lease_holder": current}
+
+
+def _run():
+    last_renewal = 0.0
+    since = 0.0
+    while True:
+        now = time.time()
+        if now - last_renewal >= Config.LEADER_LEASE_SECONDS / 3:
+            last_renewal = now
+            try:
+                won = shared_state.acquire_lease(
+                    _LEASE, _holder, Config.LEADER_LEASE_SECONDS
+                )
+            except sqlite3.Error:
+                won = False
+            if won and not _is_leader.is_set():
+                since = now - _TRACK_SECONDS
+                _is_leader.set()
+            elif not won and _is_leader.is_set():
+                _step_down()
+
+        if _is_leader.is_set():
+            try:
+                since = _sync_sessions(since)
+            except sqlite3.Error:
+                pass
+        time.sleep(_SYNC_SECONDS)
+
+
+def _step_down():
+    _is_leader.clear()
+    for session_id in list(_tracked):
+        ping_service.unregister(session_id)
+    _tracked.clear()
+
+
+def _sync_sessions(since):
+    """Register sessions with new activity with the ping scheduler and
+    drop ones that have been idle too long. Returns the new watermark."""
+    newest = since
+    # Re-read a little behind the watermark: a touch can commit after a
+    # later-stamped one; per-session timestamps skip what we've seen
+    for session_id, last_active in shared_state.active_since(since - _SYNC_SECONDS):
+        newest = max(newest, last_active)
+        _track(session_id, last_active)
+
+    cutoff = time.time() - _TRACK_SECONDS
+    for session_id, entry in list(_tracked.items()):
+        if entry["active"] < cutoff:
+            del _tracked[session_id]
+            ping_service.unregister(session_id)
+    return newest
+
+
+def _track(session_id, last_active):
+    entry = _tracked.get(session_id)
+    if entry is None:
+        messages, _, seq, _ = conversation_log.load(session_id)
+        entry = _tracked[session_id] = {
+            "recent": [], "user_turns": 0, "seq": seq, "active": 0.0,
+        }
+        _note_messages(entry, messages)
+    elif last_active <= entry["active"]:
+        return
+    else:
+        if conversation_log.last_seq(session_id) < entry["seq"]:
+            # The session was forgotten
+            entry.update(recent=[], user_turns=0, seq=0)
+        for seq, message in conversation_log.messages_after(session_id, entry["seq"]):
+            _note_messages(entry, [message])
+            entry["seq"] = seq
+    entry["active"] = last_active
+    # Registering counts as activity: the next ping is pushed out
+    ping_service.register(session_id, entry["recent"], entry["user_turns"])
+
+
+def _note_messages(entry, messages):
+    """Keep only what ping scheduling needs: the last few messages and a
+    count of user messages (delivered pings don't make drafts stale)."""
+    entry["user_turns"] += sum(1 for m in messages if m.get("role") == "user")
+    entry["recent"] = (entry["recent"] + list(messages))[-ping_service.CONTEXT_MESSAGES:]
+
+
+def _consolidate():
+    """Store queued memory batches in Cognee, one at a time, while leader."""
+    while True:
+        _is_leader.wait()
+        try:
+            job = shared_state.next_memory_job()
+        except sqlite3.Error:
+            job = None
+        if job is None:
+            time.sleep(_MEMORY_POLL_SECONDS)
+            continue
+
+        job_id, session_id, text = job
+        try:
+            memory_service.batch_remember(text, session_id)
+        except SchedulerBusy:
+            time.sleep(_MEMORY_RETRY_SECONDS)  # Ollama is saturated; retry later
+            continue
+        except Exception:
+            pass
+        shared_state.finish_memory_job(job_id)
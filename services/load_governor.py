@@ -0,0 +1,162 @@
+"""Graceful degradation when the GPU can't keep up.
+
+Each chat turn records how long its pipeline took, from the end of the
+debounce to the end of the reply. The turn is served at the current
+degradation level, and each level switches off one more optional stage:
+
+    0 full          everything runs
+    1 no_images     the monologue may not ask for an image
+    2 no_search     ... nor a web search
+    3 no_recall     ... nor a memory recall (forced recalls included)
+    4 no_monologue  the monologue is replaced by default_plan()
+
+The level rises one step when recent turns take longer than
+LOAD_TARGET_SECONDS (90th percentile) or when more than LOAD_MAX_QUEUE
+user-facing calls per slot are waiting in the inference scheduler. It falls
+one step once turns are comfortably inside the target and nothing is
+queued, or once no turn has finished for several hold periods and nothing
+is queued. Until a level has seen enough turns to judge it, it holds. After each change the level holds for LOAD_HOLD_SECONDS and only
+turns served at the new level are considered, so a step is judged on its
+own effect. Each process governs itself, like the scheduler.
+"""
+
+import threading
+import time
+
+from config import Config
+from services import inference_scheduler
+
+FULL = 0
+NO_IMAGES = 1
+NO_SEARCH = 2
+NO_RECALL = 3
+NO_MONOLOGUE = 4
+
+LEVEL_NAMES = {
+    FULL: "full",
+    NO_IMAGES: "no_images",
+    NO_SEARCH: "no_search",
+    NO_RECALL: "no_recall",
+    NO_MONOLOGUE: "no_monologue",
+}
+
+# The level from which each optional stage is switched off
+_OFF_FROM = {
+    "image": NO_IMAGES,
+    "web_search": NO_SEARCH,
+    "recall": NO_RECALL,
+    "monologue": NO_MONOLOGUE,
+}
+
+# Scheduler classes a waiting user is blocked on
+_USER_FACING = ("interactive", "monologue", "recall")
+
+# Recent turns considered, and how many a level needs before its latency
+# counts
+_WINDOW = 20
+_MIN_SAMPLES = 3
+
+# Step back down only once turns take less than this share of the target
+_RELAX_RATIO = 0.7
+
+# ... or once no turn has finished for this many hold periods
+_IDLE_HOLDS = 4
+
+_lock = threading.Lock()
+_level = FULL
+_changed_at = 0.0
+_observed_at = 0.0  # when the last turn finished
+_samples = []   # pipeline seconds of recent turns served at _level
+_history = []   # (time, level) of every change, most recent last
+
+
+def enabled():
+    return Config.LOAD_TARGET_SECONDS > 0
+
+
+def level():
+    """The level to serve a turn starting now at."""
+    if not enabled():
+        return FULL
+    pressure = _pressure()
+    with _lock:
+        _update_locked(time.time(), pressure)
+        return _level
+
+
+def allows(level, stage):
+    """Whether an optional stage ("image", "web_search", "recall" or
+    "monologue") runs at this level."""
+    return level < _OFF_FROM[stage]
+
+
+def observe(level, seconds):
+    """Record how long a turn served at `level` took to reach its reply."""
+    global _observed_at
+    with _lock:
+        _observed_at = time.time()
+        if level != _level:
+            return  # served before the last change; says nothing about now
+        _samples.append(seconds)
+        del _samples[:-_WINDOW]
+
+
+def _pressure():
+    """User-facing calls waiting per inference slot."""
+    stats = inference_scheduler.stats()
+    queued = sum(stats["classes"][name]["queued"] for name in _USER_FACING)
+    return queued / max(stats["limit"], 1)
+
+
+def _update_locked(now, pressure):
+    global _level, _changed_at
+    if now - _changed_at < Config.LOAD_HOLD_SECONDS:
+        return
+    latency = _recent_latency_locked()
+    target = Config.LOAD_TARGET_SECONDS
+    overloaded = pressure > Config.LOAD_MAX_QUEUE or (
+        latency is not None and latency > target
+    )
+    # Too few turns at this level to judge it: hold, unless nothing has
+    # been asked of it for a while
+    quiet = now - max(_changed_at, _observed_at) >= Config.LOAD_HOLD_SECONDS * _IDLE_HOLDS
+    relaxed = pressure == 0 and (
+        (latency is not None and latency < target * _RELAX_RATIO)
+        or (latency is None and quiet)
+    )
+    if overloaded and _level < NO_MONOLOGUE:
+        _level += 1
+    elif relaxed and _level > FULL:
+        _level -= 1
+    else:
+        return
+    _changed_at = now
+    _samples.clear()
+    _history.append((now, _level))
+    del _history[:-_WINDOW]
+
+
+def _recent_latency_locked():
+    """90th percentile of recent turns, or None with too few of them."""
+    if len(_samples) < _MIN_SAMPLES:
+        return None
+    ordered = sorted(_samples)
+    return ordered[min(int(len(ordered) * 0.9), len(ordered) - 1)]
+
+
+def status():
+    """Current level, the latency it is judged on and recent changes."""
+    with _lock:
+        latency = _recent_latency_locked()
+        return {
+            "enabled": enabled(),
+            "level": _level,
+            "name": LEVEL_NAMES[_level],
+            "since": _changed_at or None,
+            "target_seconds": Config.LOAD_TARGET_SECONDS,
+            "recent_p90_seconds": None if latency is None else round(latency, 3),
+            "recent_turns": len(_samples),
+            "changes": [
+                {"at": at, "level": LEVEL_NAMES[lvl]} for at, lvl in _history
+            ],
+        }
@@ -1,20 +1,56 @@
 import os
 import asyncio
-import cognee
+import threading
 from config import Config
+from services import inference_scheduler, replay
+from services.inference_scheduler import CONSOLIDATION, RECALL
+
+# Each session's memories live in a Cognee dataset of their own (see
+# dataset()), so one visitor's recall never surfaces another's facts and
+# forgetting only wipes the caller's memories.
+
+# Cognee takes seconds to import, so it is loaded on first use (or by the
+# startup warmup) rather than when this module is imported.
+_cognee = None
+_import_lock = threading.Lock()
+
+
+def _get_cognee():
+    """Import Cognee on first use, after its environment is configured."""
+    global _cognee
+    if _cognee is None:
+        with _import_lock:
+            if _cognee is None:
+                init_memory()
+                import cognee
+                _cognee = cognee
+    return _cognee
+
+
+def preload():
+    """Import Cognee now so the first recall doesn't pay for it."""
+    _get_cognee()
+
+
+def embedding_model():
+    """Name of the Ollama embedding model Cognee is configured to use."""
+    init_memory()
+    return os.environ["EMBEDDING_MODEL"]
 
 
 def init_memory():
-    """Configure Cognee for local Ollama usage. Call once at startup."""
-    # Point Cognee's LLM + embeddings at the same Ollama instance used for chat
+    """Configure Cognee for local Ollama usage. Safe to call repeatedly."""
+    # Point Cognee's LLM + embeddings at the first Ollama backend. Cognee
+    # keeps its own client, so it isn't balanced across the backend pool.
+    base_url = Config.OLLAMA_BACKENDS[0]
     os.environ.setdefault("LLM_PROVIDER", "ollama")
-    os.environ.setdefault("LLM_MODEL", Config.OLLAMA_MODEL)
-    os.environ.setdefault("LLM_ENDPOINT", f"{Config.OLLAMA_BASE_URL}/v1")
+    os.environ.setdefault("LLM_MODEL", Config.OLLAMA_MEMORY_MODEL)
+    os.environ.setdefault("LLM_ENDPOINT", f"{base_url}/v1")
     os.environ.setdefault("LLM_API_KEY", "ollama")
     os.environ.setdefault("EMBEDDING_PROVIDER", "ollama")
     os.environ.setdefault("EMBEDDING_MODEL", "nomic-embed-text")
     os.environ.setdefault(
-        "EMBEDDING_ENDPOINT", f"{Config.OLLAMA_BASE_URL}/api/embeddings"
+        "EMBEDDING_ENDPOINT", f"{base_url}/api/embeddings"
     )
     os.environ.setdefault("EMBEDDING_DIMENSIONS", "768")
     os.environ.setdefault(
@@ -22,62 +58,112 @@ def init_memory():
     )
 
 
-async def _recall(user_message):
-    """Search Cognee for relevant past context."""
+def dataset(session_id):
+    """Name of the Cognee dataset holding a session's memories."""
+    return f"session_{session_id}"
+
+
+async def _recall(user_message, session_id):
+    """Search the session's memories for relevant past context."""
     try:
-        results = await cognee.search(query_text=user_message)
-        if not results:
-            return ""
-        fragments = []
-        for r in results:
-            text = str(r) if not isinstance(r, str) else r
-            if text.strip():
-                fragments.append(text.strip())
-        return "\n".join(fragments) if fragments else ""
+        return await replay.acall(
+            "memory", "recall", {"query": user_message},
+            lambda: _search(user_message, dataset(session_id)),
+        )
     except Exception:
+        return ""  # includes a session with nothing stored yet
+
+
+async def _search(user_message, name):
+    results = await _get_cognee().search(query_text=user_message, datasets=[name])
+    if not results:
         return ""
+    fragments = []
+    for r in results:
+        text = str(r) if not isinstance(r, str) else r
+        if text.strip():
+            fragments.append(text.strip())
+    return "\n".join(fragments) if fragments else ""
 
 
-async def _remember(user_message, bot_response):
+async def _remember(user_message, bot_response, session_id):
     """Store a conversation exchange and rebuild the knowledge graph."""
     exchange = f"User: {user_message}\nAssistant: {bot_response}"
     try:
-        await cognee.add(exchange)
-        await cognee.cognify()
+        await replay.acall(
+            "memory", "remember", {"text": exchange},
+            lambda: _store(exchange, dataset(session_id)),
+        )
     except Exception:
         pass
 
 
-async def _batch_remember(combined_text):
+async def _batch_remember(combined_text, session_id):
     """Store a pre-formatted block of exchanges and rebuild the knowledge graph.
     Used for batched memory storage (multiple exchanges at once)."""
     try:
-        await cognee.add(combined_text)
-        await cognee.cognify()
+        await replay.acall(
+            "memory", "remember", {"text": combined_text},
+            lambda: _store(combined_text, dataset(session_id)),
+        )
     except Exception:
         pass
 
 
-async def _forget():
-    """Reset all stored memory."""
-    await cognee.prune.prune_data()
+async def _store(text, name):
+    cognee = _get_cognee()
+    await cognee.add(text, dataset_name=name)
+    await cognee.cognify(datasets=[name])
 
 
-def recall(user_message):
+async def _forget(session_id):
+    """Delete everything stored for the session."""
+    try:
+        await _get_cognee().forget(dataset=dataset(session_id))
+    except Exception:
+        pass  # nothing was ever stored for it
+
+
+# Cognee makes its own LLM and embedding calls, so each operation holds a
+# single inference slot for its whole duration.
+
+def recall(user_message, session_id, cancel_event=None):
     """Sync wrapper for recall."""
-    return asyncio.run(_recall(user_message))
+    try:
+        with inference_scheduler.slot(RECALL, cancel_event) as acquired:
+            if not acquired:
+                return ""
+            return asyncio.run(_recall(user_message, session_id))
+    except inference_scheduler.SchedulerBusy:
+        return ""
+
+
+async def arecall(user_message, session_id, cancel_event=None):
+    """recall() for coroutines: queues for the slot without a thread, then
+    runs the search in one (Cognee gets its own loop, as in recall())."""
+    try:
+        if not await inference_scheduler.acquire_async(RECALL, cancel_event):
+            return ""
+    except inference_scheduler.SchedulerBusy:
+        return ""
+    try:
+        return await asyncio.to_thread(asyncio.run, _recall(user_message, session_id))
+    finally:
+        inference_scheduler.release(RECALL)
 
 
-def remember(user_message, bot_response):
-    """Sync wrapper for remember."""
-    asyncio.run(_remember(user_message, bot_response))
+def remember(user_message, bot_response, session_id):
+    """Sync wrapper for remember. Raises SchedulerBusy if refused."""
+    with inference_scheduler.slot(CONSOLIDATION):
+        asyncio.run(_remember(user_message, bot_response, session_id))
 
 
-def batch_remember(combined_text):
-    """Sync wrapper for batch_remember."""
-    asyncio.run(_batch_remember(combined_text))
+def batch_remember(combined_text, session_id):
+    """Sync wrapper for batch_remember. Raises SchedulerBusy if refused."""
+    with inference_scheduler.slot(CONSOLIDATION):
+        asyncio.run(_batch_remember(combined_text, session_id))
 
 
-def forget():
-    """Sync wrapper for forget."""
-    asyncio.run(_forget())
+def forget(session_id):
+    """Sync wrapper for forget: only the session's own memories."""
+    asyncio.run(_forget(session_id))
@@ -0,0 +1,442 @@
+"""Latency and throughput metrics in Prometheus text format, plus optional
+per-request trace logs.
+
+The chat pipeline times each stage with stage(); Ollama's own token counts
+and timings are read from the final chunk of every stream. Queue depths
+and similar current values are gauges read at scrape time. Every sample
+carries a `worker` label (the process id). Each worker publishes its
+samples to the shared database every few seconds (start_publishing()), and
+a scrape of any worker returns its own samples plus the other live
+workers' last published ones. A cluster gauge reads a value every worker
+shares, such as a queue in the database: it is read at scrape time by the
+worker that answers, with no `worker` label, and never published.
+
+A request wrapped in trace() also collects its stage timings and Ollama
+calls, and is written as one JSON line to TRACE_LOG_PATH when that is set.
+While it runs on a thread of its own, the profiler can find it through
+active_traces().
+"""
+
+import asyncio
+import json
+import os
+import sqlite3
+import threading
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+from config import Config
+from services import shared_state
+
+# Seconds; wide enough for a cold model load or a slow image
+_SECONDS_BUCKETS = (0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 120)
+_RATE_BUCKETS = (1, 2, 5, 10, 20, 30, 50, 75, 100, 150, 200)
+
+# How often each worker publishes its samples, how long a silent worker's
+# samples are still served, and how long before they are deleted
+_PUBLISH_SECONDS = 5
+_FRESH_SECONDS = 3 * _PUBLISH_SECONDS
+_KEEP_SECONDS = 3600
+
+_lock = threading.Lock()
+_trace_lock = threading.Lock()
+_registry = []    # every metric, in registration order
+_current = ContextVar("vessel_trace", default=None)
+_threads = {}     # thread ident -> Trace it is serving
+_publishing = False
+
+
+class Counter:
+    kind = "counter"
+
+    def __init__(self, name, help):
+        self.name = name
+        self.help = help
+        self._values = {}   # sorted label pairs -> value
+
+    def inc(self, amount=1, **labels):
+        key = _label_key(labels)
+        with _lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def samples(self):
+        with _lock:
+            return [(self.name, key, value) for key, value in self._values.items()]
+
+
+class Histogram:
+    kind = "histogram"
+
+    def __init__(self, name, help, buckets=_SECONDS_BUCKETS):
+        self.name = name
+        self.help = help
+        self.buckets = buckets
+        self._values = {}   # sorted label pairs -> [per-bucket counts, sum, count]
+
+    def observe(self, value, **labels):
+        key = _label_key(labels)
+        with _lock:
+            entry = self._values.get(key)
+            if entry is None:
+                entry = self._values[key] = [[0] * len(self.buckets), 0.0, 0]
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    entry[0][i] += 1
+            entry[1] += value
+            entry[2] += 1
+
+    def samples(self):
+        out = []
+        with _lock:
+            for key, (counts, total, count) in self._values.items():
+                for bound, n in zip(self.buckets, counts):
+                    out.append((f"{self.name}_bucket", key + (("le", _number(bound)),), n))
+                out.append((f"{self.name}_bucket", key + (("le", "+Inf"),), count))
+                out.append((f"{self.name}_sum", key, total))
+                out.append((f"{self.name}_count", key, count))
+        return out
+
+
+class Gauge:
+    """A value read when scraped. `collect` returns (labels dict, value)
+    pairs. A `cluster` gauge's value is the same from every worker."""
+    kind = "gauge"
+
+    def __init__(self, name, help, collect, cluster=False):
+        self.name = name
+        self.help = help
+        self.collect = collect
+        self.cluster = cluster
+
+    def samples(self):
+        try:
+            values = list(self.collect())
+        except Exception:
+            return []  # a failing source shouldn't break the whole scrape
+        return [(self.name, _label_key(labels), value) for labels, value in values]
+
+
+def counter(name, help):
+    return _register(Counter(name, help))
+
+
+def histogram(name, help, buckets=_SECONDS_BUCKETS):
+    return _register(Histogram(name, help, buckets))
+
+
+def gauge(name, help, collect, cluster=False):
+    return _register(Gauge(name, help, collect, cluster))
+
+
+def _register(metric):
+    with _lock:
+        _registry.append(metric)
+    return metric
+
+
+STAGE_SECONDS = histogram(
+    "vessel_stage_seconds", "Time spent in each stage of a request."
+)
+REQUEST_SECONDS = histogram(
+    "vessel_request_seconds", "Whole traced requests, by kind and outcome."
+)
+INFERENCE_WAIT_SECONDS = histogram(
+    "vessel_inference_wait_seconds",
+    "Time Ollama calls waited for an inference slot, by priority class.",
+)
+FIRST_TOKEN_SECONDS = histogram(
+    "vessel_ollama_first_token_seconds",
+    "From sending a request to Ollama to its first token, by call role.",
+)
+TOKENS_PER_SECOND = histogram(
+    "vessel_ollama_tokens_per_second",
+    "Generation speed reported by Ollama, by call role.",
+    _RATE_BUCKETS,
+)
+PROMPT_EVAL_SECONDS = histogram(
+    "vessel_ollama_prompt_eval_seconds",
+    "Prompt processing time reported by Ollama, by call role.",
+)
+LOAD_SECONDS = histogram(
+    "vessel_ollama_load_seconds",
+    "Model load time reported by Ollama (near zero when already loaded).",
+)
+EVAL_TOKENS = counter(
+    "vessel_ollama_eval_tokens_total", "Tokens generated by Ollama, by call role."
+)
+PROMPT_TOKENS = counter(
+    "vessel_ollama_prompt_tokens_total",
+    "Prompt tokens evaluated by Ollama (cached prefix excluded), by call role.",
+)
+CACHE_REQUESTS = counter(
+    "vessel_cache_requests_total", "Cache lookups by cache and result (hit or miss)."
+)
+TURNS = counter(
+    "vessel_turns_total", "Chat turns by the degradation level that served them."
+)
+
+
+@contextmanager
+def stage(name):
+    """Time a block as one stage of the current request."""
+    current = _current.get()
+    previous = current.stage if current is not None else None
+    if current is not None:
+        current.stage = name
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        if current is not None:
+            current.stage = previous
+        observe_stage(name, time.perf_counter() - started)
+
+
+def observe_stage(name, seconds):
+    """Record a stage timed by the caller (for stages spanning yields)."""
+    STAGE_SECONDS.observe(seconds, stage=name)
+    current = _current.get()
+    if current is not None:
+        current.stages[name] = current.stages.get(name, 0.0) + seconds
+
+
+def cache(name, hit):
+    """Count one lookup in the named cache."""
+    CACHE_REQUESTS.inc(cache=name, result="hit" if hit else "miss")
+
+
+def record_ollama(role, model, waited, first_token, final):
+    """Record one finished Ollama call from the stats in its final chunk.
+    `waited` is the time queued for a slot, `first_token` the time from
+    sending the request to the first token (None if none came)."""
+    eval_count = final.get("eval_count", 0)
+    eval_seconds = final.get("eval_duration", 0) / 1e9
+    prompt_count = final.get("prompt_eval_count", 0)
+    prompt_seconds = final.get("prompt_eval_duration", 0) / 1e9
+    load_seconds = final.get("load_duration", 0) / 1e9
+    tokens_per_second = eval_count / eval_seconds if eval_seconds > 0 else None
+
+    EVAL_TOKENS.inc(eval_count, role=role)
+    PROMPT_TOKENS.inc(prompt_count, role=role)
+    PROMPT_EVAL_SECONDS.observe(prompt_seconds, role=role)
+    LOAD_SECONDS.observe(load_seconds, role=role)
+    if first_token is not None:
+        FIRST_TOKEN_SECONDS.observe(first_token, role=role)
+    if tokens_per_second is not None:
+        TOKENS_PER_SECOND.observe(tokens_per_second, role=role)
+
+    current = _current.get()
+    if current is not None:
+        current.calls.append({
+            "role": role,
+            "model": model,
+            "wait": round(waited, 4),
+            "first_token": None if first_token is None else round(first_token, 4),
+            "eval_count": eval_count,
+            "tokens_per_second": None if tokens_per_second is None
+            else round(tokens_per_second, 1),
+            "prompt_eval_count": prompt_count,
+            "prompt_eval_seconds": round(prompt_seconds, 4),
+            "load_seconds": round(load_seconds, 4),
+        })
+
+
+class Trace:
+    def __init__(self, kind, fields):
+        self.kind = kind
+        self.fields = fields
+        self.started = time.time()
+        self.stages = {}     # stage -> seconds
+        self.calls = []      # one entry per Ollama call
+        self.outcome = None
+        self.stage = None    # the stage() block running now
+        self.seconds = None  # set when finished
+
+
+@contextmanager
+def trace(kind, **fields):
+    """Collect stage timings and Ollama calls for one request. On exit its
+    duration is recorded and, with TRACE_LOG_PATH set, it is logged."""
+    current = Trace(kind, fields)
+    token = _current.set(current)
+    # Coroutines share their thread, so only threaded requests claim one
+    thread = None if _in_event_loop() else threading.get_ident()
+    if thread is not None:
+        with _lock:
+            _threads[thread] = current
+    try:
+        yield current
+    except GeneratorExit:
+        current.outcome = current.outcome or "disconnected"
+        raise
+    except BaseException:
+        current.outcome = current.outcome or "error"
+        raise
+    finally:
+        try:
+            _current.reset(token)
+        except ValueError:
+            pass  # a generator finalized from another context
+        if thread is not None:
+            with _lock:
+                if _threads.get(thread) is current:
+                    del _threads[thread]
+        _finish(current)
+
+
+def traced(kind, frames, **fields):
+    """Wrap a streamed response's generator in trace()."""
+    with trace(kind, **fields):
+        yield from frames
+
+
+def annotate(**fields):
+    """Add fields to the current request's trace line."""
+    current = _current.get()
+    if current is not None:
+        current.fields.update(fields)
+
+
+def set_outcome(outcome):
+    """Say how the current request ended, unless that is already known."""
+    current = _current.get()
+    if current is not None and current.outcome is None:
+        current.outcome = outcome
+
+
+def active_traces():
+    """Thread ident -> the Trace of the request that thread is serving."""
+    with _lock:
+        return dict(_threads)
+
+
+def _in_event_loop():
+    try:
+        asyncio.get_running_loop()
+    except RuntimeError:
+        return False
+    return True
+
+
+def _finish(current):
+    elapsed = time.time() - current.started
+    current.seconds = elapsed
+    outcome = current.outcome or "done"
+    REQUEST_SECONDS.observe(elapsed, kind=current.kind, outcome=outcome)
+    if not Config.TRACE_LOG_PATH:
+        return
+    record = dict(
+        current.fields,
+        kind=current.kind,
+        started=current.started,
+        seconds=round(elapsed, 4),
+        outcome=outcome,
+        stages={name: round(s, 4) for name, s in current.stages.items()},
+        ollama=current.calls,
+    )
+    line = json.dumps(record) + "\n"
+    try:
+        with _trace_lock, open(Config.TRACE_LOG_PATH, "a") as f:
+            f.write(line)
+    except OSError:
+        pass
+
+
+def render():
+    """Every metric in the Prometheus text exposition format, for this
+    worker and every other live one."""
+    with _lock:
+        metrics = list(_registry)
+    samples = _snapshot(metrics)
+    for name, rows in _published():
+        samples.setdefault(name, []).extend(rows)
+    for metric in metrics:
+        if _is_cluster(metric):
+            samples[metric.name] = metric.samples()
+    lines = []
+    for metric in metrics:
+        lines.append(f"# HELP {metric.name} {metric.help}")
+        lines.append(f"# TYPE {metric.name} {metric.kind}")
+        for name, key, value in samples.get(metric.name, ()):
+            lines.append(f"{name}{_format_labels(key)} {_number(value)}")
+    return "\n".join(lines) + "\n"
+
+
+def start_publishing():
+    """Publish this process's samples for the other workers' scrapes every
+    _PUBLISH_SECONDS. Safe to call more than once per process."""
+    global _publishing
+    with _lock:
+        if _publishing:
+            return
+        _publishing = True
+    threading.Thread(target=_publish, name="metrics-publish", daemon=True).start()
+
+
+def _publish():
+    while True:
+        with _lock:
+            metrics = list(_registry)
+        try:
+            shared_state.publish_metrics(
+                _worker(), json.dumps(_snapshot(metrics)), _KEEP_SECONDS
+            )
+        except sqlite3.Error:
+            pass
+        time.sleep(_PUBLISH_SECONDS)
+
+
+def _worker():
+    return str(os.getpid())
+
+
+def _snapshot(metrics):
+    """metric name -> this worker's samples of it, labelled with the worker.
+    Cluster gauges are left out."""
+    worker = (("worker", _worker()),)
+    return {
+        metric.name: [(name, worker + key, value) for name, key, value in metric.samples()]
+        for metric in metrics if not _is_cluster(metric)
+    }
+
+
+def _is_cluster(metric):
+    return getattr(metric, "cluster", False)
+
+
+def _published():
+    """(metric name, samples) published by the other live workers."""
+    try:
+        rows = shared_state.worker_metrics(_FRESH_SECONDS)
+    except sqlite3.Error:
+        return []
+    out = []
+    for worker, samples in rows:
+        if worker == _worker():
+            continue  # our own samples are read fresh
+        out.extend(json.loads(samples).items())
+    return out
+
+
+def _label_key(labels):
+    return tuple(sorted((k, str(v)) for k, v in labels.items()))
+
+
+def _format_labels(key):
+    if not key:
+        return ""
+    pairs = ",".join(f'{k}="{_escape(v)}"' for k, v in key)
+    return "{" + pairs + "}"
+
+
+def _escape(value):
+    return value.replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _number(value):
+    if isinstance(value, bool):
+        return "1" if value else "0"
+    if isinstance(value, float) and value.is_integer():
+        return str(int(value))
+    return str(value)
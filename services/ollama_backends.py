@@ -0,0 +1,159 @@
+"""Pool of Ollama backends with health checks, least-loaded selection and
+session affinity.
+
+Each request goes to the healthy backend with the fewest calls in flight
+that has the requested model. A session keeps returning to the backend it
+used last (so that host's prompt cache stays warm) unless that backend is
+down or noticeably busier than the alternatives.
+"""
+
+import random
+import threading
+import time
+from collections import OrderedDict
+from contextlib import contextmanager
+
+import requests
+from config import Config
+from services import metrics
+
+# Extra in-flight calls tolerated on a session's preferred backend before
+# it is abandoned for a less-loaded one
+_AFFINITY_SLACK = 1
+
+# Sessions whose preferred backend is remembered; the least recently used
+# ones are forgotten first
+_AFFINITY_MAX = 10000
+
+
+class Backend:
+    def __init__(self, url):
+        self.url = url
+        self.healthy = True
+        self.models = None      # set of model names, None until first check
+        self.inflight = 0
+        self.last_checked = 0.0
+        self.last_error = ""
+
+    def has_model(self, model):
+        return self.models is None or _normalize(model) in self.models
+
+    def to_dict(self):
+        return {
+            "url": self.url,
+            "healthy": self.healthy,
+            "inflight": self.inflight,
+            "models": sorted(self.models) if self.models is not None else None,
+            "last_checked": self.last_checked,
+            "last_error": self.last_error,
+        }
+
+
+_lock = threading.Lock()
+_backends = [Backend(url) for url in Config.OLLAMA_BACKENDS]
+_affinity = OrderedDict()  # (session key, model) -> backend url, oldest first
+_health_thread = None
+
+
+def _normalize(model):
+    """Ollama treats "name" and "name:latest" as the same model."""
+    return model if ":" in model else f"{model}:latest"
+
+
+def healthy_count():
+    with _lock:
+        return sum(1 for b in _backends if b.healthy)
+
+
+def _pick_locked(model, session_key, exclude=()):
+    """Choose a backend for the model. Caller holds _lock."""
+    pool = [b for b in _backends if b.url not in exclude] or list(_backends)
+    candidates = [b for b in pool if b.healthy and b.has_model(model)]
+    if not candidates:
+        candidates = [b for b in pool if b.healthy] or pool
+
+    least = min(b.inflight for b in candidates)
+    if session_key is not None:
+        preferred = _affinity.get((session_key, model))
+        for b in candidates:
+            if b.url == preferred and b.inflight <= least + _AFFINITY_SLACK:
+                metrics.cache("backend_affinity", True)
+                _affinity.move_to_end((session_key, model))
+                return b
+        metrics.cache("backend_affinity", False)
+
+    backend = random.choice([b for b in candidates if b.inflight == least])
+    if session_key is not None:
+        _affinity[(session_key, model)] = backend.url
+        _affinity.move_to_end((session_key, model))
+        while len(_affinity) > _AFFINITY_MAX:
+            _affinity.popitem(last=False)
+    return backend
+
+
+@contextmanager
+def lease(model, session_key=None, exclude=()):
+    """Hold a backend for the duration of one call. Yields the Backend."""
+    _ensure_health_checks()
+    with _lock:
+        backend = _pick_locked(model, session_key, exclude)
+        backend.inflight += 1
+    try:
+        yield backend
+    finally:
+        with _lock:
+            backend.inflight -= 1
+
+
+def mark_failed(backend, error):
+    """Take a backend out of rotation until the next successful check.
+    Callers report refused connections, timeouts and 5xx responses."""
+    with _lock:
+        backend.healthy = False
+        backend.last_error = str(error)
+
+
+def check_health():
+    """Probe every backend's /api/tags and refresh its model list."""
+    for backend in list(_backends):
+        try:
+            resp = requests.get(f"{backend.url}/api/tags", timeout=5)
+            resp.raise_for_status()
+            models = {
+                _normalize(m.get("name") or m.get("model", ""))
+                for m in resp.json().get("models", [])
+            }
+            with _lock:
+                backend.healthy = True
+                backend.models = models
+                backend.last_error = ""
+        except Exception as e:
+            with _lock:
+                backend.healthy = False
+                backend.last_error = str(e)
+        finally:
+            backend.last_checked = time.time()
+
+
+def _health_loop():
+    while True:
+        check_health()
+        time.sleep(Config.OLLAMA_HEALTH_INTERVAL)
+
+
+def _ensure_health_checks():
+    global _health_thread
+    if _health_thread is not None:
+        return
+    with _lock:
+        if _health_thread is None:
+            _health_thread = threading.Thread(
+                target=_health_loop, name="ollama-health", daemon=True
+            )
+            _health_thread.start()
+
+
+def status():
+    """Health, load and model list for every backend."""
+    with _lock:
+        return [b.to_dict() for b in _backends]
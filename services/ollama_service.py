@@ -1,38 +1,265 @@
 import json
+import time
+
 import requests
 from config import Config
+from services import async_http, inference_scheduler, metrics, ollama_backends, replay
+from services.inference_scheduler import INTERACTIVE, MONOLOGUE, PING
+
+# Call roles: which model serves each one, and its scheduling priority
+ROLE_MODELS = {
+    "reply": lambda: Config.OLLAMA_MODEL,
+    "monologue": lambda: Config.OLLAMA_MONOLOGUE_MODEL,
+    "ping": lambda: Config.OLLAMA_PING_MODEL,
+}
+ROLE_PRIORITIES = {
+    "reply": INTERACTIVE,
+    "monologue": MONOLOGUE,
+    "ping": PING,
+}
+
+
+class BackendError(RuntimeError):
+    """Raised when a backend answers a call with a server error (5xx)."""
+
+
+def stream_chat(messages, system_prompt=None, cancel_event=None, role="reply",
+                session_key=None):
+    """Generator that yields text chunks from Ollama's streaming response.
+
+    The role picks the model and the scheduling priority; the call waits
+    for an inference slot, then runs on the least-loaded healthy backend
+    (preferring the one this session used before). If cancel_event is set
+    (while queued or mid-stream), or the generator is closed early, the
+    HTTP response is closed so Ollama stops generating.
+    """
+    model, priority, payload = _request(messages, system_prompt, role)
+
+    queued_at = time.perf_counter()
+    if not inference_scheduler.acquire(priority, cancel_event):
+        return
+    waited = time.perf_counter() - queued_at
+    try:
+        if replay.replaying():
+            sent_at = time.perf_counter()
+            yield from _consume(
+                replay.stream("ollama", role, payload, None, sent_at, cancel_event),
+                role, model, waited, sent_at, cancel_event,
+            )
+            return
+        tried = []
+        while True:
+            with ollama_backends.lease(model, session_key, exclude=tried) as backend:
+                sent_at = time.perf_counter()
+                try:
+                    response = requests.post(
+                        f"{backend.url}/api/chat",
+                        json=payload,
+                        stream=True,
+                        timeout=120,
+                    )
+                except (requests.ConnectionError, requests.Timeout) as e:
+                    # Nothing was generated yet, so another backend can retry
+                    if _retry_elsewhere(backend, e, tried):
+                        continue
+                    raise
+                if response.status_code >= 500:
+                    response.close()
+                    error = BackendError(f"{backend.url} answered {response.status_code}")
+                    if _retry_elsewhere(backend, error, tried):
+                        continue
+                    raise error
+                try:
+                    response.raise_for_status()
+                    lines = replay.stream(
+                        "ollama", role, payload, response.iter_lines(), sent_at
+                    )
+                    yield from _consume(
+                        lines, role, model, waited, sent_at, cancel_event
+                    )
+                    return
+                except (requests.ConnectionError, requests.Timeout) as e:
+                    # Stalled or dropped mid-reply: too late to retry
+                    ollama_backends.mark_failed(backend, e)
+                    raise
+                finally:
+                    # Dropping the connection is how Ollama learns to abort generation
+                    response.close()
+    finally:
+        inference_scheduler.release(priority)
+
+
+def chat(messages, system_prompt=None, cancel_event=None, role="reply",
+         session_key=None):
+    """Non-streaming variant. Returns the complete response string."""
+    return "".join(
+        stream_chat(messages, system_prompt, cancel_event, role, session_key)
+    )
+
 
+async def astream_chat(messages, system_prompt=None, cancel_event=None,
+                       role="reply", session_key=None):
+    """Async twin of stream_chat() for the ASGI server: the same scheduling,
+    backend choice, retry and cancellation, without holding a thread."""
+    model, priority, payload = _request(messages, system_prompt, role)
 
-def stream_chat(messages, system_prompt=None):
-    """Generator that yields text chunks from Ollama's streaming response."""
+    queued_at = time.perf_counter()
+    if not await inference_scheduler.acquire_async(priority, cancel_event):
+        return
+    waited = time.perf_counter() - queued_at
+    try:
+        if replay.replaying():
+            sent_at = time.perf_counter()
+            lines = replay.astream("ollama", role, payload, None, sent_at, cancel_event)
+            consumer = _aconsume(lines, role, model, waited, sent_at, cancel_event)
+            try:
+                async for content in consumer:
+                    yield content
+            finally:
+                await consumer.aclose()
+            return
+        client = async_http.client()
+        tried = []
+        while True:
+            with ollama_backends.lease(model, session_key, exclude=tried) as backend:
+                request = client.build_request(
+                    "POST", f"{backend.url}/api/chat", json=payload
+                )
+                sent_at = time.perf_counter()
+                try:
+                    response = await client.send(request, stream=True)
+                except async_http.transport_errors() as e:
+                    if _retry_elsewhere(backend, e, tried):
+                        continue
+                    raise
+                if response.status_code >= 500:
+                    await response.aclose()
+                    error = BackendError(f"{backend.url} answered {response.status_code}")
+                    if _retry_elsewhere(backend, error, tried):
+                        continue
+                    raise error
+                consumer = None
+                try:
+                    response.raise_for_status()
+                    lines = replay.astream(
+                        "ollama", role, payload, response.aiter_lines(), sent_at
+                    )
+                    consumer = _aconsume(
+                        lines, role, model, waited, sent_at, cancel_event
+                    )
+                    async for content in consumer:
+                        yield content
+                    return
+                except async_http.transport_errors() as e:
+                    ollama_backends.mark_failed(backend, e)
+                    raise
+                finally:
+                    if consumer is not None:
+                        await consumer.aclose()
+                    await response.aclose()
+    finally:
+        inference_scheduler.release(priority)
+
+
+async def achat(messages, system_prompt=None, cancel_event=None, role="reply",
+                session_key=None):
+    """Async non-streaming variant."""
+    stream = astream_chat(messages, system_prompt, cancel_event, role, session_key)
+    try:
+        return "".join([chunk async for chunk in stream])
+    finally:
+        await stream.aclose()
+
+
+def _retry_elsewhere(backend, error, tried):
+    """Take a backend that failed before replying out of rotation. Returns
+    True if another backend is left to retry the call on."""
+    ollama_backends.mark_failed(backend, error)
+    tried.append(backend.url)
+    return len(tried) < len(Config.OLLAMA_BACKENDS)
+
+
+def _request(messages, system_prompt, role):
+    """(model, priority, payload) for a chat call."""
     all_messages = list(messages)
     if system_prompt:
         all_messages = [{"role": "system", "content": system_prompt}] + all_messages
 
+    model = ROLE_MODELS[role]()
     payload = {
-        "model": Config.OLLAMA_MODEL,
+        "model": model,
         "messages": all_messages,
         "stream": True,
+        "keep_alive": Config.OLLAMA_KEEP_ALIVE,
     }
+    return model, ROLE_PRIORITIES[role], payload
 
-    response = requests.post(
-        f"{Config.OLLAMA_BASE_URL}/api/chat",
-        json=payload,
-        stream=True,
-        timeout=120,
-    )
-    response.raise_for_status()
 
-    for line in response.iter_lines():
-        if line:
-            data = json.loads(line)
-            content = data.get("message", {}).get("content", "")
-            if content:
-                yield content
-            if data.get("done", False):
-                break
+def _consume(lines, role, model, waited, sent_at, cancel_event):
+    """Yield the text in a stream's NDJSON lines and record the stats in
+    its final line."""
+    first_token = None
+    try:
+        for line in lines:
+            if cancel_event is not None and cancel_event.is_set():
+                return
+            if line:
+                content, data = _parse_line(line)
+                if content:
+                    if first_token is None:
+                        first_token = time.perf_counter() - sent_at
+                    yield content
+                if data.get("done"):
+                    metrics.record_ollama(role, model, waited, first_token, data)
+                    return
+    finally:
+        if hasattr(lines, "close"):
+            lines.close()  # lets a recording wrapper write what it saw
 
 
-def chat(messages, system_prompt=None):
-    """Non-streaming variant. Returns the complete response string."""
-    return "".join(stream_chat(messages, system_prompt))
+async def _aconsume(lines, role, model, waited, sent_at, cancel_event):
+    """_consume() for an async iterator of lines."""
+    first_token = None
+    try:
+        async for line in lines:
+            if cancel_event is not None and cancel_event.is_set():
+                return
+            if line:
+                content, data = _parse_line(line)
+                if content:
+                    if first_token is None:
+                        first_token = time.perf_counter() - sent_at
+                    yield content
+                if data.get("done"):
+                    metrics.record_ollama(role, model, waited, first_token, data)
+                    return
+    finally:
+        if hasattr(lines, "aclose"):
+            await lines.aclose()
+
+
+def _parse_line(line):
+    """(content, parsed line) from one line of Ollama's NDJSON stream. The
+    final line has done=true and the call's token counts and timings."""
+    data = json.loads(line)
+    return data.get("message", {}).get("content", ""), data
+
+
+def preload(model, embedding=False):
+    """Load a model into memory on every backend that has it, so the first
+    real call doesn't pay Ollama's cold load. Returns the URLs that failed."""
+    failed = []
+    for url in Config.OLLAMA_BACKENDS:
+        if embedding:
+            endpoint = f"{url}/api/embed"
+            payload = {"model": model, "input": "",
+                       "keep_alive": Config.OLLAMA_KEEP_ALIVE}
+        else:
+            # A generate request without a prompt just loads the model
+            endpoint = f"{url}/api/generate"
+            payload = {"model": model, "keep_alive": Config.OLLAMA_KEEP_ALIVE}
+        try:
+            requests.post(endpoint, json=payload, timeout=300).raise_for_status()
+        except Exception:
+            failed.append(url)
+    return failed
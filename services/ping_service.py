@@ -1,65 +1,412 @@
-"""Proactive ping service — background timer that occasionally generates
-unsolicited messages from the chatbot, like a real friend texting."""
+"""Proactive ping service — background scheduler that occasionally generates
+unsolicited messages from the chatbot, like a real friend texting.
 
+One scheduler thread serves every session. Each session has a single entry
+in a heap of next-fire times; the fire time is sampled directly from the
+time-of-day rate model (a Poisson process whose rate follows `time_weights`
+and drops to zero during `quiet_hours`), so the thread only wakes up when a
+ping is actually due. User activity pushes the session's next ping out.
+
+Ping text is pregenerated: while Ollama has been idle for a while, the
+same thread fills each session's pool of candidates with one batched call.
+A candidate is discarded once the user has said anything since it was
+written, so firing a ping never needs an inference call of its own.
+
+Only the elected leader process (services/leader.py) registers sessions
+and runs the scheduler. Pings are left in the shared mailbox
+(services/shared_state.py), so whichever worker holds the user's stream
+delivers them. Listeners don't poll the mailbox themselves: one thread per
+process checks it for every session with a local listener and wakes the
+listeners of those that have a ping."""
+
+import asyncio
+import heapq
+import itertools
+import json
 import random
+import sqlite3
 import threading
-from collections import deque
-from datetime import datetime
+import time
+from datetime import datetime, timedelta
+
+from services import inference_scheduler, metrics, ollama_service, shared_state
+
+DEFAULT_SESSION = "default"
 
-from services import ollama_service
+# How far ahead to look for a non-zero rate before giving up on a session
+_HORIZON_HOURS = 24 * 7
+# How often to re-check Ollama idleness while some pool needs a refill
+_REFILL_POLL_SECONDS = 15
+# Recent messages a session's ping drafts are written against
+CONTEXT_MESSAGES = 6
+# How often the mailbox is checked for pings queued by another process
+_MAILBOX_POLL_SECONDS = 2
 
 # Module-level state
-_ping_queue = deque(maxlen=1)
-_timer = None
-_config = None
-_persona_context = ""
-_conversation_history = None  # reference to the global list in app.py
+_get_profile = None                  # path -> profiles.CompiledProfile
+_sessions = {}                       # session key -> _Session
+_heap = []                           # (fire_at, seq, session key, token)
+_needs_refill = set()                # session keys whose pool is short
+_seq = itertools.count()
+_lock = threading.Lock()
+_schedule_changed = threading.Condition(_lock)
+_ping_ready = threading.Condition()  # notified when a listened session has a ping
+_listening = {}                      # session key -> local listeners waiting on it
+_wakeups = {}                        # session key -> times its listeners were woken
+_async_listeners = {}                # session key -> {(loop, future)} in await_pending()
+_mailbox_thread = None
+_thread = None
+_running = False
 
 
-def start(profile_config, persona_context, conversation_history_ref):
-    """Start the recurring ping timer. Call once at app startup."""
-    global _config, _persona_context, _conversation_history
-    _config = profile_config or {}
-    _persona_context = persona_context
-    _conversation_history = conversation_history_ref
+class _Session:
+    def __init__(self, key, recent, user_turns, profile_path=None):
+        self.key = key
+        self.recent = recent          # the last CONTEXT_MESSAGES messages
+        self.user_turns = user_turns  # user messages so far; drafts go stale when it moves
+        self.profile_path = profile_path
+        self.token = 0  # bumped on reschedule; stale heap entries are skipped
+        self.pool = []  # (text, user turns when written, created_at)
 
-    if not _config.get("enabled", False):
-        return
+    def profile(self):
+        return _get_profile(self.profile_path)
+
+    def config(self):
+        """The profile's proactive_messaging block (hot-reloaded)."""
+        return self.profile().proactive
+
+
+def start(get_profile):
+    """Configure the scheduler. Call once at app startup, before sessions
+    register. `get_profile(path)` returns a compiled profile; it is
+    consulted on every decision, so profile edits apply without a restart."""
+    global _get_profile
+    _get_profile = get_profile
 
-    _schedule_next()
+
+def register(session_key, recent, user_turns, profile_path=None):
+    """Add a session to the scheduler (or update what it knows of the
+    conversation): its last few messages and how many user messages it has
+    had. `profile_path` selects the session's persona (default profile if
+    None)."""
+    with _lock:
+        session = _sessions.get(session_key)
+        if session is None:
+            session = _sessions[session_key] = _Session(
+                session_key, recent, user_turns, profile_path
+            )
+        session.recent = list(recent[-CONTEXT_MESSAGES:])
+        session.user_turns = user_turns
+        session.profile_path = profile_path
+        _reschedule_locked(session)
+
+
+def unregister(session_key):
+    """Drop a session; its heap entry becomes stale and is skipped."""
+    with _lock:
+        _sessions.pop(session_key, None)
+        _needs_refill.discard(session_key)
 
 
 def stop():
-    """Cancel the timer for clean shutdown."""
-    global _timer
-    if _timer is not None:
-        _timer.cancel()
-        _timer = None
+    """Stop the scheduler thread for clean shutdown."""
+    global _running
+    with _lock:
+        _running = False
+        _schedule_changed.notify_all()
+
+
+def reset(session_key=DEFAULT_SESSION):
+    """Clear the session's pending ping and restart its schedule."""
+    shared_state.clear_ping(session_key)
+    note_activity(session_key)
 
 
-def reset():
-    """Clear pending pings and restart the timer."""
-    _ping_queue.clear()
-    stop()
-    if _config and _config.get("enabled", False):
-        _schedule_next()
+def note_activity(session_key=DEFAULT_SESSION):
+    """Record that the user just did something; no ping is sent until
+    they have been idle for at least one check interval."""
+    with _lock:
+        session = _sessions.get(session_key)
+        if session is not None:
+            _reschedule_locked(session)
 
 
-def get_pending():
+def get_pending(session_key=DEFAULT_SESSION):
     """Pop and return the next pending ping message, or None."""
-    try:
-        return _ping_queue.popleft()
-    except IndexError:
+    if not shared_state.has_ping(session_key):
         return None
+    return shared_state.take_ping(session_key)
+
+
+def wait_for_pending(timeout, session_key=DEFAULT_SESSION):
+    """Block until a ping is queued, then pop and return it.
+
+    Returns None if nothing arrived within `timeout` seconds (or another
+    listener took the ping first).
+    """
+    deadline = time.time() + timeout
+    _listen(session_key)
+    try:
+        while True:
+            with _ping_ready:
+                seen = _wakeups.get(session_key, 0)
+            msg = get_pending(session_key)
+            remaining = deadline - time.time()
+            if msg or remaining <= 0:
+                return msg
+            with _ping_ready:
+                _ping_ready.wait_for(
+                    lambda: _wakeups.get(session_key, 0) != seen, remaining
+                )
+    finally:
+        _unlisten(session_key)
+
+
+async def await_pending(timeout, session_key=DEFAULT_SESSION):
+    """wait_for_pending() for coroutines (the ASGI ping stream). The
+    mailbox is read in a worker thread, off the event loop."""
+    loop = asyncio.get_running_loop()
+    deadline = time.time() + timeout
+    _listen(session_key)
+    try:
+        while True:
+            listener = (loop, loop.create_future())
+            with _ping_ready:
+                _async_listeners.setdefault(session_key, set()).add(listener)
+            try:
+                msg = await asyncio.to_thread(get_pending, session_key)
+                remaining = deadline - time.time()
+                if msg or remaining <= 0:
+                    return msg
+                try:
+                    await asyncio.wait_for(listener[1], remaining)
+                except asyncio.TimeoutError:
+                    pass
+            finally:
+                with _ping_ready:
+                    _async_listeners.get(session_key, set()).discard(listener)
+    finally:
+        _unlisten(session_key)
+
+
+def requeue(msg, session_key=DEFAULT_SESSION):
+    """Put back a ping that could not be delivered, unless a newer one is
+    already waiting."""
+    shared_state.put_ping(session_key, msg, replace=False)
+    _wake([session_key])
+
+
+def _listen(session_key):
+    """Count a local listener on the session, starting the mailbox thread
+    with the first one."""
+    global _mailbox_thread
+    with _ping_ready:
+        _listening[session_key] = _listening.get(session_key, 0) + 1
+        if _mailbox_thread is None:
+            _mailbox_thread = threading.Thread(
+                target=_watch_mailbox, name="ping-mailbox", daemon=True
+            )
+            _mailbox_thread.start()
+
+
+def _unlisten(session_key):
+    with _ping_ready:
+        _listening[session_key] -= 1
+        if not _listening[session_key]:
+            del _listening[session_key]
+            _wakeups.pop(session_key, None)
+            _async_listeners.pop(session_key, None)
+
+
+def _watch_mailbox():
+    """Check the mailbox for every session with a local listener, and wake
+    those that have a ping (queued here or by another process)."""
+    while True:
+        time.sleep(_MAILBOX_POLL_SECONDS)
+        with _ping_ready:
+            keys = list(_listening)
+        if not keys:
+            continue
+        try:
+            waiting = shared_state.sessions_with_pings(keys)
+        except sqlite3.Error:
+            continue
+        if waiting:
+            _wake(waiting)
+
+
+def _wake(session_keys):
+    """Wake the session's local listeners, threaded or async, to check
+    the mailbox."""
+    with _ping_ready:
+        listeners = []
+        for key in session_keys:
+            if key in _listening:
+                _wakeups[key] = _wakeups.get(key, 0) + 1
+                listeners.extend(_async_listeners.get(key, ()))
+        _ping_ready.notify_all()
+    for loop, future in listeners:
+        loop.call_soon_threadsafe(
+            lambda f=future: f.done() or f.set_result(None)
+        )
+
+
+def _reschedule_locked(session):
+    """Schedule the session as if the user was just active. Caller holds
+    _lock."""
+    config = session.config()
+    if not config.get("enabled", False):
+        _schedule_locked(session, None)
+        return
+    # The conversation is moving on, so the pool will go stale
+    _needs_refill.add(session.key)
+    _schedule_locked(session, _first_fire_after(config, time.time()))
+
 
+def _schedule_locked(session, fire_at):
+    """Replace the session's heap entry. Caller holds _lock."""
+    global _thread, _running
+    session.token += 1
+    if fire_at is not None:
+        heapq.heappush(_heap, (fire_at, next(_seq), session.key, session.token))
+        if not _running:
+            _running = True
+            _thread = threading.Thread(
+                target=_run, name="ping-scheduler", daemon=True
+            )
+            _thread.start()
+    _schedule_changed.notify_all()
 
-def _schedule_next():
-    """Schedule the next check."""
-    global _timer
-    interval = _config.get("check_interval_seconds", 300)
-    _timer = threading.Timer(interval, _check_and_ping)
-    _timer.daemon = True
-    _timer.start()
+
+def _run():
+    """Scheduler loop: sleep until the earliest fire time or until Ollama
+    is quiet enough to refill a pool, then do that job."""
+    while True:
+        with _lock:
+            job = None
+            while _running and job is None:
+                job = _next_job_locked()
+                if job is None:
+                    _schedule_changed.wait(_wait_timeout_locked())
+            if not _running:
+                return
+
+        kind, session_key, session, token = job
+        if kind == "refill":
+            _refill(session)
+            continue
+
+        _fire(session)
+
+        with _lock:
+            if _sessions.get(session_key) is session and session.token == token:
+                config = session.config()
+                fire_at = None
+                if config.get("enabled", False):
+                    fire_at = _sample_fire_time(config, time.time())
+                _schedule_locked(session, fire_at)
+
+
+def _next_job_locked():
+    """Pop the next due job, or return None. Caller holds _lock."""
+    while _heap and _heap[0][0] <= time.time():
+        _, _, session_key, token = heapq.heappop(_heap)
+        session = _sessions.get(session_key)
+        if session is not None and session.token == token:
+            return ("fire", session_key, session, token)
+
+    for session_key in list(_needs_refill):
+        session = _sessions.get(session_key)
+        if session is None:
+            _needs_refill.discard(session_key)
+        elif _ollama_is_quiet(session.config()):
+            _needs_refill.discard(session_key)
+            return ("refill", session_key, session, None)
+    return None
+
+
+def _wait_timeout_locked():
+    """How long the scheduler may sleep. Caller holds _lock."""
+    timeouts = []
+    if _heap:
+        timeouts.append(max(_heap[0][0] - time.time(), 0))
+    if _needs_refill:
+        timeouts.append(_REFILL_POLL_SECONDS)
+    return min(timeouts) if timeouts else None
+
+
+def _ollama_is_quiet(config):
+    # Other workers' inference isn't visible here; their users' activity is
+    idle = min(
+        inference_scheduler.idle_for(),
+        time.time() - shared_state.last_activity(),
+    )
+    return idle >= config.get("pregenerate_idle_seconds", 60)
+
+
+def _fire(session):
+    """Queue a fresh pregenerated ping unless one is still undelivered."""
+    config = session.config()
+    if not config.get("enabled", False) or shared_state.has_ping(session.key):
+        return
+    msg = _take_candidate(session)
+    metrics.cache("ping_pool", msg is not None)
+    if msg is None and _ollama_is_quiet(config):
+        # Pool ran dry, but nothing interactive is waiting on the GPU
+        _refill(session)
+        msg = _take_candidate(session)
+    if msg is None:
+        return  # skip this ping rather than compete with chat
+    shared_state.put_ping(session.key, msg)
+    _wake([session.key])
+
+
+def _take_candidate(session):
+    """Pop the next candidate that is still current, dropping stale ones."""
+    with _lock:
+        fresh = _fresh_candidates_locked(session)
+        msg = fresh.pop(0)[0] if fresh else None
+        session.pool = fresh
+        if len(fresh) < _pool_size(session.config()) and session.key in _sessions:
+            _needs_refill.add(session.key)
+        return msg
+
+
+def _fresh_candidates_locked(session):
+    """Candidates written against the current conversation and not too old.
+    Caller holds _lock."""
+    max_age = session.config().get("candidate_max_age_seconds", 6 * 3600)
+    version = session.user_turns
+    now = time.time()
+    return [
+        c for c in session.pool
+        if c[1] == version and now - c[2] <= max_age
+    ]
+
+
+def _pool_size(config):
+    return max(int(config.get("pregenerate_pool_size", 3)), 1)
+
+
+def _refill(session):
+    """Generate a batch of candidates for the session's pool."""
+    pool_size = _pool_size(session.config())
+    with _lock:
+        session.pool = _fresh_candidates_locked(session)
+        if len(session.pool) >= pool_size:
+            return
+    with _lock:
+        recent, version = list(session.recent), session.user_turns
+    try:
+        candidates = _generate_candidates(session, recent, pool_size)
+    except Exception:
+        return
+    created = time.time()
+    with _lock:
+        # Keep only earlier candidates that still match the conversation
+        session.pool = [c for c in session.pool if c[1] == version]
+        session.pool.extend((text, version, created) for text in candidates)
+        del session.pool[pool_size:]
 
 
 def _get_time_block(hour):
@@ -74,66 +421,101 @@ def _get_time_block(hour):
         return "evening"
 
 
-def _check_and_ping():
-    """Timer callback: decide whether to send a ping, then reschedule."""
-    # Always reschedule first so the loop continues
-    _schedule_next()
+def _in_quiet_hours(config, hour):
+    quiet = config.get("quiet_hours", [0, 7])
+    if len(quiet) != 2:
+        return False
+    start, end = quiet
+    if start <= end:
+        return start <= hour < end
+    return hour >= start or hour < end  # window wraps past midnight
 
-    now = datetime.now()
-    hour = now.hour
 
-    # Respect quiet hours
-    quiet = _config.get("quiet_hours", [0, 7])
-    if len(quiet) == 2 and quiet[0] <= hour < quiet[1]:
-        return
+def _rate_at(config, hour):
+    """Expected pings per second during the given hour.
 
-    # Don't queue if there's already an undelivered ping
-    if _ping_queue:
-        return
+    Matches the old per-check model: a check every `check_interval_seconds`
+    succeeding with probability `base_probability * time_weights[block]`.
+    """
+    if _in_quiet_hours(config, hour):
+        return 0.0
+    interval = config.get("check_interval_seconds", 300)
+    base_prob = config.get("base_probability", 0.3)
+    weight = config.get("time_weights", {}).get(_get_time_block(hour), 0.5)
+    return max(base_prob * weight, 0.0) / interval
 
-    # Probability check weighted by time of day
-    base_prob = _config.get("base_probability", 0.3)
-    time_weights = _config.get("time_weights", {})
-    block = _get_time_block(hour)
-    weight = time_weights.get(block, 0.5)
 
-    if random.random() >= base_prob * weight:
-        return
+def _first_fire_after(config, now):
+    """Next fire time for a session that was just active."""
+    idle = config.get("check_interval_seconds", 300)
+    return _sample_fire_time(config, now + idle)
 
-    # Generate and queue a ping
-    try:
-        msg = _generate_ping()
-        if msg and msg.strip():
-            _ping_queue.append(msg.strip())
-    except Exception:
-        pass
+
+def _sample_fire_time(config, after):
+    """Sample the next event of the piecewise-constant (hourly) Poisson
+    process starting at `after`. Returns a timestamp, or None if the rate
+    is zero for the whole horizon."""
+    remaining = random.expovariate(1.0)
+    t = datetime.fromtimestamp(after)
+    for _ in range(_HORIZON_HOURS):
+        boundary = t.replace(minute=0, second=0, microsecond=0) + timedelta(hours=1)
+        span = (boundary - t).total_seconds()
+        rate = _rate_at(config, t.hour)
+        if rate > 0 and rate * span >= remaining:
+            return t.timestamp() + remaining / rate
+        remaining -= rate * span
+        t = boundary
+    return None
 
 
-def _generate_ping():
-    """Use Ollama to generate a short unprompted message."""
-    topics = _config.get("topics", ["share a thought"])
-    topic = random.choice(topics)
+def _generate_candidates(session, conversation_history, count):
+    """Use one Ollama call to write `count` short unprompted messages, each
+    from a different topic angle. Returns a list of strings."""
+    profile = session.profile()
+    topics = profile.proactive.get("topics", ["share a thought"])
+    angles = random.sample(topics, min(count, len(topics)))
+    while len(angles) < count:
+        angles.append(random.choice(topics))
+    angle_list = "\n".join(f"- {a}" for a in angles)
 
     system = (
-        f"{_persona_context}\n\n"
-        f"You're reaching out to the user unprompted, like a real friend texting. "
-        f"Send a short, natural message. Your angle: {topic}. "
-        f"Keep it to 1-2 short sentences max. Be casual and genuine. "
+        f"{profile.persona_context}\n\n"
+        f"Later on you'll reach out to the user unprompted, like a real friend texting. "
+        f"Write {count} alternative messages you could send, one per angle:\n"
+        f"{angle_list}\n"
+        f"Keep each to 1-2 short sentences max. Be casual and genuine. "
         f"Do NOT ask multiple questions. Do NOT be overly enthusiastic. "
-        f"Do NOT mention that you were prompted or programmed to message."
+        f"Do NOT mention that you were prompted or programmed to message. "
+        f"Output ONLY a JSON array of {count} strings, no other text."
     )
 
     # Give the LLM recent conversation context if available
-    context_messages = []
-    if _conversation_history:
-        recent = list(_conversation_history[-6:])
-        if recent:
-            context_messages = recent
+    context_messages = list(conversation_history[-CONTEXT_MESSAGES:])
 
     # Add a nudge as the "user" message to trigger generation
     context_messages.append({
         "role": "user",
-        "content": "(The user hasn't messaged in a while. Reach out naturally.)",
+        "content": "(The user hasn't messaged in a while. Draft your messages.)",
     })
 
-    return ollama_service.chat(context_messages, system_prompt=system)
+    response = ollama_service.chat(
+        context_messages, system_prompt=system, role="ping",
+        session_key=session.key,
+    )
+    return _parse_candidates(response)[:count]
+
+
+def _parse_candidates(text):
+    """Parse the model's JSON array, tolerating markdown fences."""
+    text = text.strip()
+    if text.startswith("```"):
+        lines = text.split("\n")
+        text = "\n".join(lines[1:-1]) if len(lines) > 2 else text
+    try:
+        items = json.loads(text)
+    except json.JSONDecodeError:
+        # Fallback: one candidate per non-empty line
+        items = [line.strip("-*• \t\"") for line in text.splitlines()]
+    if not isinstance(items, list):
+        items = [items]
+    return [str(i).strip() for i in items if str(i).strip()]
@@ -0,0 +1,213 @@
+"""On-demand sampling profiler for a running process.
+
+While a profile runs, the thread that asked for it reads every other
+thread's Python stack with sys._current_frames() every PROFILE_INTERVAL_MS.
+Nothing is traced or instrumented, so a process pays nothing while no
+profile runs and little while one does. Stacks are returned in collapsed
+form ("a;b;c 12" per line) for flamegraph.pl, speedscope or inferno.
+
+Each stack starts with the pipeline stage it was taken in. The stage is the
+innermost stage marker on the stack (prompt building, message splitting,
+SSE encoding and batching, search and memory wrappers, Ollama stream
+parsing). Failing
+that, it is the stage() block the thread's request is in, or the thread's
+name for threads serving no request. Samples of a thread that used no CPU
+since the previous sample (read from its per-thread CPU clock, where the
+platform has one) or whose innermost frame is a known blocking wait are
+idle time, and are dropped unless asked for.
+
+With a request kind, only threads serving a traced request of that kind
+are sampled, and the result also breaks the stacks down per request.
+Coroutines under the ASGI server share one thread, so their samples carry a
+stage but can't be told apart per request.
+"""
+
+import os
+import sys
+import threading
+import time
+from collections import Counter
+
+from config import Config
+from services import metrics
+
+MAX_SECONDS = 300
+
+# (module, bare function name) -> stage; the innermost match on a stack wins
+_STAGE_MARKERS = {
+    ("services.chat_turn", "build_response_system_prompt"): "prompt",
+    ("app", "_sse"): "sse_encode",
+    ("services.delivery_service", "split_response"): "split",
+    ("services.inner_monologue", "parse_plan"): "monologue_parse",
+    ("services.web_search_service", "search"): "web_search",
+    ("services.web_search_service", "search_news"): "web_search",
+    ("services.memory_service", "recall"): "recall",
+    ("services.memory_service", "arecall"): "recall",
+    ("services.ollama_service", "_consume"): "ollama_stream",
+    ("services.ollama_service", "_aconsume"): "ollama_stream",
+    ("services.image_trigger", "check_response"): "image_tag",
+    ("services.image_trigger", "clean_response"): "image_tag",
+    ("services.image_trigger", "feed"): "image_tag",
+    ("services.delivery_service", "add"): "batch",
+}
+
+# Innermost frames of a thread blocked outside Python (bare function names)
+_IDLE_LEAVES = {
+    ("threading", "wait"),
+    ("threading", "_wait_for_tstate_lock"),
+    ("selectors", "select"),
+    ("socket", "readinto"),
+    ("socket", "accept"),
+    ("ssl", "read"),
+    ("ssl", "recv_into"),
+    ("socketserver", "serve_forever"),
+}
+
+_lock = threading.Lock()
+_running = False
+
+
+class ProfilerBusy(Exception):
+    """Raised when a profile is requested while another one runs."""
+
+
+class _Session:
+    def __init__(self, kind, include_idle):
+        self.kind = kind
+        self.include_idle = include_idle
+        self.idle = 0
+        self.cpu = {}                  # thread ident -> CPU ns at last sample
+        self.stacks = Counter()        # collapsed stack -> samples
+        self.by_trace = {}             # Trace -> Counter of its stacks
+        self.labels = {}               # code object -> (module, function)
+
+
+def profile(seconds, kind=None, min_seconds=0.0, include_idle=False):
+    """Sample this process for `seconds` and return the result as a dict.
+
+    With `kind` ("chat" or "imagine"), only requests of that kind that ran
+    for at least `min_seconds` are kept. Raises ProfilerBusy if a profile
+    is already running.
+    """
+    global _running
+    seconds = min(max(float(seconds), 0.1), MAX_SECONDS)
+    with _lock:
+        if _running:
+            raise ProfilerBusy("A profile is already running")
+        _running = True
+    try:
+        session = _Session(kind, include_idle)
+        interval = max(Config.PROFILE_INTERVAL_MS, 1) / 1000.0
+        started = time.time()
+        deadline = time.perf_counter() + seconds
+        me = threading.get_ident()
+        while time.perf_counter() < deadline:
+            _sample(session, me)
+            time.sleep(interval)
+        return _report(session, time.time() - started, interval, min_seconds)
+    finally:
+        with _lock:
+            _running = False
+
+
+def _sample(session, me):
+    traces = metrics.active_traces()
+    names = {t.ident: t.name for t in threading.enumerate()}
+    for ident, frame in sys._current_frames().items():
+        if ident == me:
+            continue
+        trace = traces.get(ident)
+        if session.kind is not None and (trace is None or trace.kind != session.kind):
+            continue
+        frames = _frames(session, frame)
+        if not session.include_idle and _idle(session, ident, frames):
+            session.idle += 1
+            continue
+        root = _stage(frames, trace, names.get(ident, ident))
+        collapsed = ";".join([root] + [f"{m}:{f}" for m, f in frames])
+        if trace is not None and session.kind is not None:
+            session.by_trace.setdefault(trace, Counter())[collapsed] += 1
+        else:
+            session.stacks[collapsed] += 1
+
+
+def _idle(session, ident, frames):
+    """Whether a thread is waiting rather than running Python."""
+    try:
+        cpu = time.clock_gettime_ns(time.pthread_getcpuclockid(ident))
+    except (AttributeError, OSError):
+        cpu = None  # no per-thread clocks here, or the thread just ended
+    previous = session.cpu.get(ident)
+    session.cpu[ident] = cpu
+    if frames and _short(frames[-1]) in _IDLE_LEAVES:
+        return True
+    return cpu is not None and cpu == previous
+
+
+def _frames(session, frame):
+    """(module, function) per frame, outermost first."""
+    frames = []
+    while frame is not None:
+        code = frame.f_code
+        label = session.labels.get(code)
+        if label is None:
+            module = frame.f_globals.get("__name__", "?")
+            if module == "__main__":  # app.py run as a script
+                module = os.path.splitext(os.path.basename(code.co_filename))[0]
+            label = session.labels[code] = (
+                module, getattr(code, "co_qualname", code.co_name)
+            )
+        frames.append(label)
+        frame = frame.f_back
+    frames.reverse()
+    return frames
+
+
+def _short(label):
+    """(module, qualname) -> (module, bare function name)."""
+    module, function = label
+    return module, function.rsplit(".", 1)[-1]
+
+
+def _stage(frames, trace, thread_name):
+    for label in reversed(frames):
+        marker = _STAGE_MARKERS.get(_short(label))
+        if marker is not None:
+            return marker
+    if trace is not None:
+        return trace.stage or trace.kind
+    return f"thread:{thread_name}"
+
+
+def _report(session, elapsed, interval, min_seconds):
+    requests = []
+    for trace, stacks in session.by_trace.items():
+        seconds = trace.seconds if trace.seconds is not None else time.time() - trace.started
+        if seconds < min_seconds:
+            continue
+        session.stacks.update(stacks)
+        requests.append(dict(
+            trace.fields,
+            kind=trace.kind,
+            started=trace.started,
+            seconds=round(seconds, 4),
+            outcome=trace.outcome,
+            samples=sum(stacks.values()),
+            stacks=dict(stacks.most_common()),
+        ))
+    requests.sort(key=lambda r: r["seconds"], reverse=True)
+    return {
+        "seconds": round(elapsed, 3),
+        "interval_ms": round(interval * 1000, 3),
+        "kind": session.kind,
+        "min_seconds": min_seconds,
+        "samples": sum(session.stacks.values()),
+        "idle_samples": session.idle,
+        "stacks": dict(session.stacks.most_common()),
+        "requests": requests,
+    }
+
+
+def collapsed(stacks):
+    """Collapsed-stack text for a stacks dict from profile()."""
+    return "".join(f"{stack} {count}\n" for stack, count in stacks.items())
@@ -0,0 +1,130 @@
+"""Persona profile compiler with hot reload.
+
+A profile JSON is compiled once per version into every static prompt
+piece the pipeline needs — the persona block, the inner monologue's
+formatted system prompt, the image settings — and cached by path, so
+several personas can be loaded side by side. Editing a profile file takes
+effect on the next request: get() notices the new mtime and recompiles.
+"""
+
+import json
+import os
+import threading
+import time
+
+from config import Config
+from services import inner_monologue, metrics
+
+# How often get() may stat a profile file to check for edits
+_RELOAD_CHECK_SECONDS = 1.0
+
+_DEFAULT_IMAGE_FREQUENCY = "only when a visual would genuinely add value"
+
+# (field, label) pairs rendered as "Label: value." in the persona block;
+# list values are comma-joined, a None label inserts the value verbatim
+_PERSONA_FIELDS = [
+    ("backstory", None),
+    ("personality_traits", "Personality traits"),
+    ("speaking_style", "Speaking style"),
+    ("tone", "Tone"),
+    ("interests", "Interests"),
+    ("expertise", "Areas of expertise"),
+    ("quirks", "Quirks"),
+    ("emoji_usage", "Emoji usage"),
+    ("response_length", "Response length"),
+    ("relationship_to_user", "Relationship to user"),
+    ("boundaries", "Boundaries"),
+    ("texting_style", "Texting style"),
+    ("emotional_range", "Emotional range"),
+    ("custom_instructions", None),
+]
+
+
+class CompiledProfile:
+    """Everything derived from one version of a profile file."""
+
+    def __init__(self, path, raw, mtime=None):
+        self.path = path
+        self.raw = raw
+        self.mtime = mtime
+        self.name = raw.get("name", "Vessel")
+        self.persona_context = build_persona_context(raw)
+        self.image_settings = {
+            "negative_prompt": raw.get("image_negative_prompt", ""),
+            "prompt_prefix": raw.get("image_prompt_prefix", ""),
+            "prompt_suffix": raw.get("image_prompt_suffix", ""),
+        }
+        self.monologue_prompt = inner_monologue.build_system_prompt(
+            self.persona_context,
+            image_frequency=raw.get(
+                "image_generation_frequency", _DEFAULT_IMAGE_FREQUENCY
+            ),
+            image_prompt_instructions=raw.get("image_prompt_instructions", ""),
+        )
+        self.proactive = raw.get("proactive_messaging", {}) or {}
+        self.delivery = raw.get("delivery", "typed")
+
+
+def build_persona_context(profile):
+    """Join the profile's persona fields into the system prompt block."""
+    if not profile:
+        return "You are a helpful assistant."
+
+    parts = [f"You are {profile.get('name', 'an AI assistant')}."]
+    for field, label in _PERSONA_FIELDS:
+        value = profile.get(field)
+        if not value:
+            continue
+        if isinstance(value, list):
+            value = ", ".join(value)
+        parts.append(value if label is None else f"{label}: {value}.")
+    return " ".join(parts)
+
+
+_lock = threading.Lock()
+_cache = {}           # path -> CompiledProfile
+_last_checked = {}    # path -> time of the last mtime check
+
+
+def get(path=None):
+    """Return the compiled profile at `path` (default PROFILE_PATH),
+    recompiling it if the file changed since it was last compiled."""
+    path = path or Config.PROFILE_PATH
+    now = time.time()
+    with _lock:
+        compiled = _cache.get(path)
+        if compiled is not None and now - _last_checked.get(path, 0) < _RELOAD_CHECK_SECONDS:
+            metrics.cache("profile", True)
+            return compiled
+        _last_checked[path] = now
+
+    try:
+        mtime = os.path.getmtime(path)
+    except OSError:
+        mtime = None
+    if compiled is not None and compiled.mtime == mtime:
+        metrics.cache("profile", True)
+        return compiled
+    metrics.cache("profile", False)
+
+    if mtime is None:
+        compiled = CompiledProfile(path, {})
+    else:
+        try:
+            with open(path, "r") as f:
+                raw = json.load(f)
+        except (OSError, json.JSONDecodeError):
+            if compiled is not None:
+                return compiled  # mid-edit or unreadable; keep the last good one
+            raise
+        compiled = CompiledProfile(path, raw, mtime)
+
+    with _lock:
+        _cache[path] = compiled
+    return compiled
+
+
+def loaded():
+    """Paths and versions of every profile currently compiled."""
+    with _lock:
+        return {path: p.mtime for path, p in _cache.items()}
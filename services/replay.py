@@ -0,0 +1,290 @@
+"""Record and replay of external calls, for repeatable benchmarks.
+
+With REPLAY_MODE=record, every call to Ollama, web search, Cognee and
+ComfyUI is appended to REPLAY_PATH as one JSON line: the request, the
+response (or each streamed line with its offset) and how long it took.
+With REPLAY_MODE=replay those calls are served from the file instead and
+take their recorded time divided by REPLAY_SPEED (0 = no waiting), so a
+pipeline change can be measured against a fixed workload without the
+model's run-to-run variance. Inference calls still queue in the scheduler.
+
+A replayed call gets the unused recording of the identical request if
+there is one, otherwise the next unused recording of the same service and
+kind: prompts drift as the code under test changes. Once a kind's
+recordings are used up they are served again from the start.
+"""
+
+import asyncio
+import base64
+import hashlib
+import json
+import os
+import threading
+import time
+
+from config import Config
+from services import metrics
+
+# How often a replayed stream waiting out a delay checks for cancellation
+_CANCEL_POLL_SECONDS = 0.1
+
+_lock = threading.Lock()
+_loaded = False
+_by_key = {}     # request digest -> [entry], in recorded order
+_by_kind = {}    # (service, kind) -> [entry], in recorded order
+_used = set()    # id() of entries already served this pass
+_polls = {}      # request digest -> entry chosen for a polled request
+_written = set() # polled request digests already recorded
+
+
+class ReplayMiss(RuntimeError):
+    """Raised when nothing was recorded for a call of this kind."""
+
+
+class ReplayedError(RuntimeError):
+    """A recorded call that failed, failing again on replay."""
+
+
+def recording():
+    return Config.REPLAY_MODE == "record"
+
+
+def replaying():
+    return Config.REPLAY_MODE == "replay"
+
+
+def call(service, kind, request, fn):
+    """Run fn(), recording its result, or serve the recorded result."""
+    if replaying():
+        entry = _lookup(service, kind, request)
+        _sleep(entry["seconds"])
+        return _result(entry)
+    if not recording():
+        return fn()
+    started = time.perf_counter()
+    try:
+        result = fn()
+    except Exception as e:
+        _write(service, kind, request, time.perf_counter() - started, error=str(e))
+        raise
+    _write(service, kind, request, time.perf_counter() - started, result=result)
+    return result
+
+
+async def acall(service, kind, request, fn):
+    """call() for coroutines: fn() returns an awaitable."""
+    if replaying():
+        entry = _lookup(service, kind, request)
+        await asyncio.sleep(_scaled(entry["seconds"]))
+        return _result(entry)
+    if not recording():
+        return await fn()
+    started = time.perf_counter()
+    try:
+        result = await fn()
+    except Exception as e:
+        _write(service, kind, request, time.perf_counter() - started, error=str(e))
+        raise
+    _write(service, kind, request, time.perf_counter() - started, result=result)
+    return result
+
+
+def stream(service, kind, request, lines, sent_at, cancel_event=None):
+    """Pass a response's lines through, recording each with its offset from
+    `sent_at` (a perf_counter() time), or replay recorded lines at their
+    recorded pace. `lines` is unused when replaying."""
+    if replaying():
+        return _play(_lookup(service, kind, request), sent_at, cancel_event)
+    if not recording():
+        return lines
+    return _record(service, kind, request, lines, sent_at)
+
+
+def astream(service, kind, request, lines, sent_at, cancel_event=None):
+    """stream() for async iterators of lines."""
+    if replaying():
+        return _aplay(_lookup(service, kind, request), sent_at, cancel_event)
+    if not recording():
+        return lines
+    return _arecord(service, kind, request, lines, sent_at)
+
+
+def poll(service, kind, request, fn, since):
+    """A polled call that returns None until a job finishes (ComfyUI's
+    /history). The first non-None result is recorded with its time after
+    `since`; replay returns None until that much scaled time has passed."""
+    if replaying():
+        key = _digest(service, kind, request)
+        with _lock:
+            entry = _polls.get(key)
+        if entry is None:
+            entry = _lookup(service, kind, request)
+            with _lock:
+                _polls[key] = entry
+        if time.time() - since < _scaled(entry["seconds"]):
+            return None
+        return _result(entry)
+    result = fn()
+    if recording() and result is not None:
+        _write_once(service, kind, request, time.time() - since, result)
+    return result
+
+
+async def apoll(service, kind, request, fn, since):
+    """poll() for coroutines: fn() returns an awaitable."""
+    if replaying():
+        return poll(service, kind, request, None, since)
+    result = await fn()
+    if recording() and result is not None:
+        _write_once(service, kind, request, time.time() - since, result)
+    return result
+
+
+def _record(service, kind, request, lines, sent_at):
+    recorded = []
+    try:
+        for line in lines:
+            recorded.append([round(time.perf_counter() - sent_at, 4), _text(line)])
+            yield line
+    finally:
+        # Also reached when the consumer stops early (cancelled turns)
+        if recorded:
+            _write(service, kind, request, time.perf_counter() - sent_at, lines=recorded)
+
+
+async def _arecord(service, kind, request, lines, sent_at):
+    recorded = []
+    try:
+        async for line in lines:
+            recorded.append([round(time.perf_counter() - sent_at, 4), _text(line)])
+            yield line
+    finally:
+        if recorded:
+            _write(service, kind, request, time.perf_counter() - sent_at, lines=recorded)
+
+
+def _play(entry, sent_at, cancel_event):
+    for offset, line in entry["lines"]:
+        delay = _scaled(offset) - (time.perf_counter() - sent_at)
+        if delay > 0:
+            if cancel_event is None:
+                time.sleep(delay)
+            elif cancel_event.wait(delay):
+                return
+        yield line
+
+
+async def _aplay(entry, sent_at, cancel_event):
+    for offset, line in entry["lines"]:
+        while True:
+            delay = _scaled(offset) - (time.perf_counter() - sent_at)
+            if delay <= 0:
+                break
+            if cancel_event is not None and cancel_event.is_set():
+                return
+            await asyncio.sleep(min(delay, _CANCEL_POLL_SECONDS))
+        yield line
+
+
+def _scaled(seconds):
+    speed = Config.REPLAY_SPEED
+    return seconds / speed if speed > 0 else 0.0
+
+
+def _sleep(seconds):
+    delay = _scaled(seconds)
+    if delay > 0:
+        time.sleep(delay)
+
+
+def _result(entry):
+    if "error" in entry:
+        raise ReplayedError(entry["error"])
+    if "result_b64" in entry:
+        return base64.b64decode(entry["result_b64"])
+    return entry.get("result")
+
+
+def _text(line):
+    return line.decode("utf-8") if isinstance(line, bytes) else line
+
+
+def _digest(service, kind, request):
+    canonical = json.dumps([service, kind, request], sort_keys=True, default=str)
+    return hashlib.sha1(canonical.encode("utf-8")).hexdigest()
+
+
+def _write(service, kind, request, seconds, **response):
+    entry = {
+        "service": service,
+        "kind": kind,
+        "key": _digest(service, kind, request),
+        "request": request,
+        "recorded_at": time.time(),
+        "seconds": round(seconds, 4),
+    }
+    result = response.pop("result", None)
+    if isinstance(result, bytes):
+        entry["result_b64"] = base64.b64encode(result).decode("ascii")
+    elif result is not None:
+        entry["result"] = result
+    entry.update(response)
+    data = (json.dumps(entry, default=str) + "\n").encode("utf-8")
+    os.makedirs(os.path.dirname(os.path.abspath(Config.REPLAY_PATH)), exist_ok=True)
+    # One write() on an O_APPEND descriptor lands whole at the end of the
+    # file, so lines from several worker processes can't interleave
+    fd = os.open(Config.REPLAY_PATH, os.O_WRONLY | os.O_APPEND | os.O_CREAT, 0o644)
+    try:
+        os.write(fd, data)
+    finally:
+        os.close(fd)
+
+
+def _write_once(service, kind, request, seconds, result):
+    key = _digest(service, kind, request)
+    with _lock:
+        if key in _written:
+            return
+        _written.add(key)
+    _write(service, kind, request, seconds, result=result)
+
+
+def _load_locked():
+    global _loaded
+    if _loaded:
+        return
+    _loaded = True
+    try:
+        with open(Config.REPLAY_PATH) as f:
+            for line in f:
+                if not line.strip():
+                    continue
+                entry = json.loads(line)
+                _by_key.setdefault(entry["key"], []).append(entry)
+                _by_kind.setdefault((entry["service"], entry["kind"]), []).append(entry)
+    except FileNotFoundError:
+        pass
+
+
+def _lookup(service, kind, request):
+    """The recording to serve for this call (see the module docstring)."""
+    key = _digest(service, kind, request)
+    with _lock:
+        _load_locked()
+        for entry in _by_key.get(key, []):
+            if id(entry) not in _used:
+                _used.add(id(entry))
+                metrics.cache("replay", True)
+                return entry
+
+        same_kind = _by_kind.get((service, kind))
+        if not same_kind:
+            raise ReplayMiss(f"no recorded {service} {kind} calls in {Config.REPLAY_PATH}")
+        metrics.cache("replay", False)
+        unused = [e for e in same_kind if id(e) not in _used]
+        if not unused:
+            # Start the kind over
+            _used.difference_update(id(e) for e in same_kind)
+            unused = same_kind
+        _used.add(id(unused[0]))
+        return unused[0]
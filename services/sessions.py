@@ -0,0 +1,175 @@
+"""Per-user conversation sessions, restored lazily from the conversation log.
+
+A session holds everything the chat pipeline keeps between turns: recent
+history, emotion trajectory, burst state, the unflushed memory batch and
+the forced-recall counter. A session is loaded from the log on its first
+request after a restart, and dropped from memory again once it has had no
+request and no open ping stream for CONVERSATION_IDLE_SECONDS.
+
+With several worker processes the log is the source of truth: a worker
+whose copy of a session is behind the log (because another worker served
+that user) reloads it on the next request, and one that appends after
+another worker wrote folds the messages it missed into its history.
+Snapshots are built from the log rather than from a worker's copy."""
+
+import threading
+import time
+import uuid
+from contextlib import contextmanager
+
+from config import Config
+from services import conversation_log, ping_service, shared_state
+from services.emotion_state import EmotionTracker
+from services.turn_state import TurnState
+
+# How often get() looks for idle sessions to drop
+_EVICT_CHECK_SECONDS = 60
+
+
+class Session:
+    def __init__(self, session_id):
+        self.id = session_id
+        self.history = []
+        self.emotion = EmotionTracker()
+        self.turns = TurnState()
+        self.pending_memory = []    # (user message, bot response) not yet stored
+        self.message_counter = 0    # counts messages for periodic forced recall
+        self.last_seen = time.time()
+        self.listeners = 0          # open ping streams
+        self._lock = threading.Lock()
+        self._last_seq = 0
+        self._snapshot_seq = 0
+
+    def add_message(self, role, content):
+        """Append a message to the history and the log."""
+        message = {"role": role, "content": content}
+        with self._lock:
+            self.history.append(message)
+            self._append_locked("message", message)
+
+    def save_state(self):
+        """Log the current emotion, memory batch and recall counter."""
+        with self._lock:
+            self._append_locked("state", self._state())
+
+    def _state(self):
+        return {
+            "emotion": self.emotion.to_dict(),
+            "pending_memory": [list(e) for e in self.pending_memory],
+            "message_counter": self.message_counter,
+        }
+
+    def _restore(self, messages, state, last_seq, snapshot_seq):
+        self.history[:] = messages
+        self.emotion.restore(state.get("emotion", {}))
+        self.pending_memory = [tuple(e) for e in state.get("pending_memory", [])]
+        self.message_counter = state.get("message_counter", 0)
+        self._last_seq = last_seq
+        self._snapshot_seq = snapshot_seq
+
+    def _refresh(self):
+        """Reload from the log if another process has written to it."""
+        if self.turns.pending():
+            return  # a turn is in flight here; this copy is the newest
+        with self._lock:
+            if conversation_log.last_seq(self.id) != self._last_seq:
+                self._restore(*conversation_log.load(self.id))
+
+    def _append_locked(self, kind, data):
+        seq = conversation_log.append(self.id, kind, data)
+        if seq != self._last_seq + 1:
+            # Another process wrote to the log since this copy last saw it
+            # (say, a ping delivered by the worker holding the stream); put
+            # its messages in ahead of this one
+            missed = [
+                message for s, message
+                in conversation_log.messages_after(self.id, self._last_seq)
+                if s < seq
+            ]
+            at = len(self.history) - 1 if kind == "message" else len(self.history)
+            self.history[at:at] = missed
+        self._last_seq = seq
+        if seq - self._snapshot_seq >= Config.CONVERSATION_SNAPSHOT_EVERY:
+            conversation_log.save_snapshot(self.id, seq)
+            self._snapshot_seq = seq
+
+
+_lock = threading.Lock()
+_sessions = {}          # session id -> Session
+_last_sweep = 0.0
+
+
+def new_id():
+    return uuid.uuid4().hex
+
+
+def get(session_id):
+    """Return the live session, restoring it from the log on first use."""
+    with _lock:
+        session = _sessions.get(session_id)
+        loaded = session is None
+        if loaded:
+            session = _sessions[session_id] = Session(session_id)
+            session._restore(*conversation_log.load(session_id))
+        session.last_seen = time.time()
+    if loaded:
+        shared_state.touch(session.id)  # lets the ping leader pick it up
+    else:
+        session._refresh()
+    _evict_idle()
+    return session
+
+
+def note_activity(session):
+    """Record user activity; the ping leader (possibly another process)
+    pushes the session's next ping out."""
+    shared_state.touch(session.id)
+    ping_service.note_activity(session.id)
+
+
+def live():
+    """Every session currently held in memory."""
+    with _lock:
+        return list(_sessions.values())
+
+
+@contextmanager
+def listening(session):
+    """Keep the session in memory while a ping stream is open."""
+    with _lock:
+        session.listeners += 1
+    try:
+        yield session
+    finally:
+        with _lock:
+            session.listeners -= 1
+            session.last_seen = time.time()
+
+
+def forget(session):
+    """Cancel the session's turn and erase its history and state."""
+    session.turns.cancel()
+    with session._lock:
+        conversation_log.forget(session.id)
+        session._restore([], {}, 0, 0)
+    ping_service.reset(session.id)
+    shared_state.touch(session.id)
+
+
+def _evict_idle():
+    """Drop sessions with no recent request, open stream or pending turn.
+    Their state is already in the log."""
+    global _last_sweep
+    now = time.time()
+    with _lock:
+        if now - _last_sweep < _EVICT_CHECK_SECONDS:
+            return
+        _last_sweep = now
+        idle = [
+            s for s in _sessions.values()
+            if s.listeners == 0
+            and not s.turns.pending()
+            and now - s.last_seen > Config.CONVERSATION_IDLE_SECONDS
+        ]
+        for s in idle:
+            del _sessions[s.id]
@@ -0,0 +1,229 @@
+"""Cross-process coordination through the shared database.
+
+Worker processes record session activity, collect pings and queue memory
+batches here; the elected leader (services/leader.py) reads the activity,
+fills the ping mailbox and drains the memory queue. With a single process
+the same process plays both parts. Each worker also publishes its metrics
+here, so that scraping any one of them reports all of them."""
+
+import time
+
+from services import db
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS leases (
+    name TEXT PRIMARY KEY,
+    holder TEXT NOT NULL,
+    expires_at REAL NOT NULL
+);
+CREATE TABLE IF NOT EXISTS session_activity (
+    session_id TEXT PRIMARY KEY,
+    last_active REAL NOT NULL
+);
+CREATE TABLE IF NOT EXISTS pending_pings (
+    session_id TEXT PRIMARY KEY,  -- at most one undelivered ping per session
+    message TEXT NOT NULL,
+    created_at REAL NOT NULL
+);
+-- Memory batches, each stored in its session's own Cognee dataset
+CREATE TABLE IF NOT EXISTS memory_jobs (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    session_id TEXT NOT NULL,
+    text TEXT NOT NULL,
+    created_at REAL NOT NULL
+);
+CREATE TABLE IF NOT EXISTS worker_metrics (
+    worker TEXT PRIMARY KEY,
+    samples TEXT NOT NULL,  -- JSON, see services/metrics.py
+    updated_at REAL NOT NULL
+);
+"""
+
+
+# Leases
+
+def acquire_lease(name, holder, ttl):
+    """Take or renew the named lease. Returns True if `holder` owns it for
+    the next `ttl` seconds."""
+    now = time.time()
+    with db.write(_SCHEMA) as conn:
+        row = conn.execute(
+            "SELECT holder, expires_at FROM leases WHERE name = ?", (name,)
+        ).fetchone()
+        if row is not None and row[0] != holder and row[1] > now:
+            return False
+        conn.execute(
+            "INSERT OR REPLACE INTO leases (name, holder, expires_at) VALUES (?, ?, ?)",
+            (name, holder, now + ttl),
+        )
+    return True
+
+
+def release_lease(name, holder):
+    """Give up the lease early if `holder` still owns it."""
+    with db.write(_SCHEMA) as conn:
+        conn.execute(
+            "DELETE FROM leases WHERE name = ? AND holder = ?", (name, holder)
+        )
+
+
+def lease_holder(name):
+    """Current holder of the lease, or None if it is free or expired."""
+    row = db.connect(_SCHEMA).execute(
+        "SELECT holder FROM leases WHERE name = ? AND expires_at > ?",
+        (name, time.time()),
+    ).fetchone()
+    return row[0] if row else None
+
+
+# Session activity
+
+def touch(session_id):
+    """Record that the session's user just did something."""
+    with db.write(_SCHEMA) as conn:
+        conn.execute(
+            "INSERT OR REPLACE INTO session_activity (session_id, last_active) "
+            "VALUES (?, ?)",
+            (session_id, time.time()),
+        )
+
+
+def active_since(since):
+    """(session id, last active) for sessions active after `since`."""
+    return db.connect(_SCHEMA).execute(
+        "SELECT session_id, last_active FROM session_activity WHERE last_active > ?",
+        (since,),
+    ).fetchall()
+
+
+def last_activity():
+    """When any user last did anything (0 if never)."""
+    row = db.connect(_SCHEMA).execute(
+        "SELECT COALESCE(MAX(last_active), 0) FROM session_activity"
+    ).fetchone()
+    return row[0]
+
+
+# Ping mailbox
+
+def put_ping(session_id, message, replace=True):
+    """Leave a ping for the session. With replace=False an undelivered
+    ping already waiting is kept instead."""
+    verb = "INSERT OR REPLACE" if replace else "INSERT OR IGNORE"
+    with db.write(_SCHEMA) as conn:
+        conn.execute(
+            f"{verb} INTO pending_pings (session_id, message, created_at) "
+            "VALUES (?, ?, ?)",
+            (session_id, message, time.time()),
+        )
+
+
+def take_ping(session_id):
+    """Remove and return the session's pending ping, or None."""
+    with db.write(_SCHEMA) as conn:
+        row = conn.execute(
+            "SELECT message FROM pending_pings WHERE session_id = ?",
+            (session_id,),
+        ).fetchone()
+        if row is None:
+            return None
+        conn.execute(
+            "DELETE FROM pending_pings WHERE session_id = ?", (session_id,)
+        )
+    return row[0]
+
+
+def has_ping(session_id):
+    row = db.connect(_SCHEMA).execute(
+        "SELECT 1 FROM pending_pings WHERE session_id = ?", (session_id,)
+    ).fetchone()
+    return row is not None
+
+
+def sessions_with_pings(session_ids):
+    """The ones among `session_ids` that have a pending ping."""
+    session_ids = list(session_ids)
+    found = []
+    conn = db.connect(_SCHEMA)
+    # Stay under SQLite's limit on bound parameters
+    for start in range(0, len(session_ids), 500):
+        chunk = session_ids[start:start + 500]
+        marks = ",".join("?" * len(chunk))
+        found.extend(row[0] for row in conn.execute(
+            f"SELECT session_id FROM pending_pings WHERE session_id IN ({marks})",
+            chunk,
+        ))
+    return found
+
+
+def clear_ping(session_id):
+    with db.write(_SCHEMA) as conn:
+        conn.execute(
+            "DELETE FROM pending_pings WHERE session_id = ?", (session_id,)
+        )
+
+
+# Memory consolidation queue
+
+def enqueue_memory(session_id, text):
+    """Queue a batch of the session's exchanges for the leader to store in
+    Cognee."""
+    with db.write(_SCHEMA) as conn:
+        conn.execute(
+            "INSERT INTO memory_jobs (session_id, text, created_at) "
+            "VALUES (?, ?, ?)",
+            (session_id, text, time.time()),
+        )
+
+
+def next_memory_job():
+    """Oldest queued batch as (id, session id, text), or None. The job stays
+    queued until finish_memory_job()."""
+    return db.connect(_SCHEMA).execute(
+        "SELECT id, session_id, text FROM memory_jobs ORDER BY id LIMIT 1"
+    ).fetchone()
+
+
+def memory_jobs_queued():
+    row = db.connect(_SCHEMA).execute(
+        "SELECT COUNT(*) FROM memory_jobs"
+    ).fetchone()
+    return row[0]
+
+
+def finish_memory_job(job_id):
+    with db.write(_SCHEMA) as conn:
+        conn.execute("DELETE FROM memory_jobs WHERE id = ?", (job_id,))
+
+
+def clear_memory_jobs(session_id):
+    """Drop the session's queued batches (other sessions' stay queued)."""
+    with db.write(_SCHEMA) as conn:
+        conn.execute(
+            "DELETE FROM memory_jobs WHERE session_id = ?", (session_id,)
+        )
+
+
+# Per-worker metrics
+
+def publish_metrics(worker, samples, keep_seconds):
+    """Replace the worker's published samples, dropping those of workers
+    silent for longer than `keep_seconds`."""
+    now = time.time()
+    with db.write(_SCHEMA) as conn:
+        conn.execute(
+            "INSERT OR REPLACE INTO worker_metrics (worker, samples, updated_at) "
+            "VALUES (?, ?, ?)",
+            (worker, samples, now),
+        )
+        conn.execute(
+            "DELETE FROM worker_metrics WHERE updated_at < ?", (now - keep_seconds,)
+        )
+
+
+def worker_metrics(fresh_seconds):
+    """(worker, samples) of every worker that published recently."""
+    return db.connect(_SCHEMA).execute(
+        "SELECT worker, samples FROM worker_metrics WHERE updated_at > ?",
+        (time.time() - fresh_seconds,),
+    ).fetchall()
@@ -0,0 +1,69 @@
+"""Burst coalescing for incoming user messages. No LLM calls — just
+tracks which user messages are still waiting for a reply and which
+turn is allowed to answer them.
+
+People text in bursts ("wait", "actually", "what about X"). Every
+message is queued here and supersedes the turn that was in flight;
+only the newest turn survives the debounce window, and it answers all
+unanswered messages at once.
+
+A burst left unanswered because its turn ended early (the client went
+away) is merged into the next message only if that comes within
+CHAT_PENDING_TTL_SECONDS; older ones are dropped."""
+
+import threading
+import time
+
+from config import Config
+
+
+class TurnState:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._pending = []    # (received at, message) not yet answered, oldest first
+        self._active = None   # cancel event of the newest turn
+
+    def submit(self, message):
+        """Queue a user message and start a new turn for it.
+
+        Cancels the previous turn (its messages stay pending and are
+        merged into this one). Returns the new turn's cancel event.
+        """
+        with self._lock:
+            self._expire_locked()
+            self._pending.append((time.time(), message))
+            if self._active is not None:
+                self._active.set()
+            self._active = threading.Event()
+            return self._active
+
+    def pending(self):
+        """Return a snapshot of the unanswered user messages."""
+        with self._lock:
+            self._expire_locked()
+            return [message for _, message in self._pending]
+
+    def commit(self, count):
+        """Mark the oldest `count` pending messages as answered."""
+        with self._lock:
+            del self._pending[:count]
+
+    def _expire_locked(self):
+        """Drop a stale burst, but only while no turn is answering it."""
+        if self._active is not None and not self._active.is_set():
+            return
+        cutoff = time.time() - Config.CHAT_PENDING_TTL_SECONDS
+        while self._pending and self._pending[0][0] < cutoff:
+            self._pending.pop(0)
+
+    def cancel(self):
+        """Cancel the in-flight turn and drop all pending messages."""
+        with self._lock:
+            if self._active is not None:
+                self._active.set()
+            self._pending.clear()
+
+
+def merge_messages(messages):
+    """Join a burst of user messages into the content of one turn."""
+    return "\n".join(messages)
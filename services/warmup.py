@@ -0,0 +1,115 @@
+"""Startup warmup. Loads the heavy imports, Ollama models and caches in
+background threads so the process serves requests immediately and the
+first chat doesn't pay for cold starts. Progress is reported through
+status() for the readiness endpoint."""
+
+import threading
+import time
+
+from config import Config
+from services import (
+    comfyui_service,
+    memory_service,
+    ollama_service,
+    replay,
+    web_search_service,
+)
+
+_lock = threading.Lock()
+_steps = {}       # step name -> {"status", "seconds", "error"}
+_started = False
+
+
+class _Skipped(Exception):
+    """Raised by a step that doesn't apply to this deployment."""
+
+
+def _preload_model(model, embedding=False):
+    if replay.replaying():
+        raise _Skipped("replaying recorded calls")
+    failed = ollama_service.preload(model, embedding=embedding)
+    if failed:
+        raise RuntimeError(f"could not load on {', '.join(failed)}")
+
+
+def _load_workflow():
+    try:
+        comfyui_service.load_workflow()
+    except FileNotFoundError:
+        raise _Skipped(f"{Config.WORKFLOW_PATH} not found")
+
+
+def _ollama_steps():
+    """Model loads, run in their own lane since they wait on the GPU host."""
+    chat_models = sorted({
+        Config.OLLAMA_MODEL,
+        Config.OLLAMA_MONOLOGUE_MODEL,
+        Config.OLLAMA_PING_MODEL,
+    })
+    steps = [
+        (f"model:{m}", lambda m=m: _preload_model(m)) for m in chat_models
+    ]
+    steps.append((
+        "model:embedding",
+        lambda: _preload_model(memory_service.embedding_model(), embedding=True),
+    ))
+    return steps
+
+
+def _local_steps():
+    """Imports and caches that only cost local CPU."""
+    return [
+        ("workflow", _load_workflow),
+        ("import:duckduckgo_search", web_search_service.preload),
+        ("import:cognee", memory_service.preload),
+    ]
+
+
+def _run(steps):
+    for name, fn in steps:
+        with _lock:
+            _steps[name]["status"] = "running"
+        start = time.time()
+        try:
+            fn()
+            status, error = "ok", ""
+        except _Skipped as e:
+            status, error = "skipped", str(e)
+        except Exception as e:
+            status, error = "failed", str(e)
+        with _lock:
+            _steps[name].update(
+                status=status, error=error, seconds=round(time.time() - start, 3)
+            )
+
+
+def start(extra_steps=()):
+    """Kick off warmup once. `extra_steps` are (name, callable) pairs run
+    first in the local lane, e.g. priming the app's profile cache."""
+    global _started
+    with _lock:
+        if _started:
+            return
+        _started = True
+        lanes = [list(extra_steps) + _local_steps(), _ollama_steps()]
+        for lane in lanes:
+            for name, _ in lane:
+                _steps[name] = {"status": "pending", "seconds": None, "error": ""}
+
+    for i, lane in enumerate(lanes):
+        threading.Thread(
+            target=_run, args=(lane,), name=f"warmup-{i}", daemon=True
+        ).start()
+
+
+def is_ready():
+    """True once every step has finished, whatever its outcome."""
+    with _lock:
+        return _started and all(
+            s["status"] not in ("pending", "running") for s in _steps.values()
+        )
+
+
+def status():
+    with _lock:
+        return {name: dict(step) for name, step in _steps.items()}
@@ -1,16 +1,50 @@
-"""Web search service using DuckDuckGo. Returns formatted snippets
-for injection into the response system prompt."""
+"""Web search service using DuckDuckGo, or a SearxNG-compatible JSON API
+when WEB_SEARCH_URL is set. Returns formatted snippets for injection into
+the response system prompt."""
 
-from duckduckgo_search import DDGS
+import requests
 from config import Config
+from services import replay
+
+_DDGS = None
+
+
+def _client_class():
+    """Import the DuckDuckGo client on first use."""
+    global _DDGS
+    if _DDGS is None:
+        from duckduckgo_search import DDGS
+        _DDGS = DDGS
+    return _DDGS
+
+
+def _ddgs():
+    return _client_class()()
+
+
+def preload():
+    """Import the search client now so the first search doesn't pay for it."""
+    if not Config.WEB_SEARCH_URL:
+        _client_class()
+
+
+def _searxng(query, max_results, category=None):
+    params = {"q": query, "format": "json"}
+    if category:
+        params["categories"] = category
+    resp = requests.get(f"{Config.WEB_SEARCH_URL}/search", params=params, timeout=15)
+    resp.raise_for_status()
+    return resp.json().get("results", [])[:max_results]
 
 
 def search(query, max_results=None):
     """Run a general web search. Returns a formatted string of results."""
     max_results = max_results or Config.WEB_SEARCH_MAX_RESULTS
     try:
-        with DDGS() as ddgs:
-            results = list(ddgs.text(query, max_results=max_results))
+        results = replay.call(
+            "web_search", "text", {"query": query, "max_results": max_results},
+            lambda: _text(query, max_results),
+        )
     except Exception:
         return ""
 
@@ -24,8 +58,10 @@ def search_news(query, max_results=None):
     """Search recent news articles."""
     max_results = max_results or Config.WEB_SEARCH_MAX_RESULTS
     try:
-        with DDGS() as ddgs:
-            results = list(ddgs.news(query, max_results=max_results))
+        results = replay.call(
+            "web_search", "news", {"query": query, "max_results": max_results},
+            lambda: _news(query, max_results),
+        )
     except Exception:
         return ""
 
@@ -35,12 +71,26 @@ def search_news(query, max_results=None):
     return _format_results(results)
 
 
+def _text(query, max_results):
+    if Config.WEB_SEARCH_URL:
+        return _searxng(query, max_results)
+    with _ddgs() as ddgs:
+        return list(ddgs.text(query, max_results=max_results))
+
+
+def _news(query, max_results):
+    if Config.WEB_SEARCH_URL:
+        return _searxng(query, max_results, category="news")
+    with _ddgs() as ddgs:
+        return list(ddgs.news(query, max_results=max_results))
+
+
 def _format_results(results):
     """Format search results into a readable block for the LLM."""
     lines = []
     for r in results:
         title = r.get("title", "")
-        body = r.get("body") or r.get("description") or ""
+        body = r.get("body") or r.get("description") or r.get("content") or ""
         url = r.get("href") or r.get("url") or ""
         lines.append(f"- {title}: {body} ({url})")
     return "\n".join(lines)
@@ -5,6 +5,10 @@ const settingsBtn = document.getElementById("settings-button");
 const settingsPanel = document.getElementById("settings-panel");
 const clearMemoryBtn = document.getElementById("clear-memory-btn");
 
+// The chat stream currently in flight. Sending another message aborts it;
+// the server merges the unanswered messages into the new turn.
+let activeChat = null;
+
 // Settings panel toggle
 settingsBtn.addEventListener("click", () => {
     settingsPanel.classList.toggle("hidden");
@@ -31,23 +35,41 @@ clearMemoryBtn.addEventListener("click", async () => {
     clearMemoryBtn.textContent = "Clear All Memory";
 });
 
-// Poll for proactive pings from the chatbot
-setInterval(async () => {
-    // Skip if we're mid-conversation (input disabled means streaming)
-    if (input.disabled) return;
+// Proactive pings are pushed over SSE; EventSource reconnects on its own
+// if the connection drops. Pings that arrive mid-conversation wait until
+// the current reply has finished.
+const deferredPings = [];
+
+function showPing(message) {
+    showTypingIndicator();
+    const delay = Math.random() * 1000 + 500;
+    setTimeout(() => {
+        removeTypingIndicator();
+        appendMessage("assistant", message);
+    }, delay);
+}
+
+function flushDeferredPings() {
+    while (deferredPings.length && !activeChat && !input.disabled) {
+        showPing(deferredPings.shift());
+    }
+}
+
+const pingStream = new EventSource("/api/pings/stream");
+pingStream.onmessage = (event) => {
+    let data;
     try {
-        const resp = await fetch("/api/pings");
-        const data = await resp.json();
-        if (data.message) {
-            showTypingIndicator();
-            const delay = Math.random() * 1000 + 500;
-            setTimeout(() => {
-                removeTypingIndicator();
-                appendMessage("assistant", data.message);
-            }, delay);
-        }
-    } catch {}
-}, 30000);
+        data = JSON.parse(event.data);
+    } catch {
+        return;
+    }
+    if (data.type !== "ping" || !data.message) return;
+    if (activeChat || input.disabled) {
+        deferredPings.push(data.message);
+    } else {
+        showPing(data.message);
+    }
+};
 
 // Send on Enter (Shift+Enter for newline)
 input.addEventListener("keydown", (e) => {
@@ -123,24 +145,32 @@ function removeTypingIndicator() {
 
 // Multi-message chat with typing indicators and realistic timing
 async function streamChat(message) {
-    setInputEnabled(false);
+    if (activeChat) activeChat.abort();
+    const controller = new AbortController();
+    activeChat = controller;
     showTypingIndicator();
 
     // Track the last assistant bubble for image attachment
     let lastBubble = null;
+    // Instant delivery: the bubble the reply streams into
+    let liveBubble = null;
 
     try {
         const response = await fetch("/api/chat", {
             method: "POST",
             headers: { "Content-Type": "application/json" },
             body: JSON.stringify({ message }),
+            signal: controller.signal,
         });
 
         if (!response.ok) {
             removeTypingIndicator();
             const errBubble = appendMessage("assistant", `Error: ${response.statusText}`);
             errBubble.classList.add("error");
-            setInputEnabled(true);
+            if (activeChat === controller) {
+                activeChat = null;
+                flushDeferredPings();
+            }
             return;
         }
 
@@ -179,6 +209,27 @@ async function streamChat(message) {
                         lastBubble = appendMessage("assistant", data.content);
                         break;
 
+                    case "delta":
+                        // Instant delivery: reply text as it is generated
+                        if (!liveBubble) {
+                            removeTypingIndicator();
+                            liveBubble = appendMessage("assistant", "");
+                        }
+                        liveBubble.textContent += data.content;
+                        lastBubble = liveBubble;
+                        scrollToBottom();
+                        break;
+
+                    case "messages":
+                        // The finished reply, split into messages
+                        if (liveBubble) liveBubble.remove();
+                        liveBubble = null;
+                        removeTypingIndicator();
+                        for (const content of data.messages) {
+                            lastBubble = appendMessage("assistant", content);
+                        }
+                        break;
+
                     case "image_generating":
                         removeTypingIndicator();
                         showLoader("Generating image...");
@@ -202,19 +253,28 @@ async function streamChat(message) {
                         errDiv.classList.add("error");
                         break;
 
+                    case "superseded":
+                        // A newer message took over this turn
+                        break;
+
                     case "done":
-                        removeTypingIndicator();
+                        if (activeChat === controller) removeTypingIndicator();
                         break;
                 }
             }
         }
     } catch (err) {
-        removeTypingIndicator();
-        const errBubble = appendMessage("assistant", `Connection error: ${err.message}`);
-        errBubble.classList.add("error");
+        if (err.name !== "AbortError") {
+            removeTypingIndicator();
+            const errBubble = appendMessage("assistant", `Connection error: ${err.message}`);
+            errBubble.classList.add("error");
+        }
     }
 
-    setInputEnabled(true);
+    if (activeChat === controller) {
+        activeChat = null;
+        flushDeferredPings();
+    }
 }
 
 // Explicit /imagine command
@@ -255,6 +315,7 @@ async function requestImage(prompt) {
     }
 
     setInputEnabled(true);
+    flushDeferredPings();
 }
 
 function showLoader(text) {
@@ -0,0 +1,9 @@
+import os
+import sys
+import tempfile
+
+# Point the shared database at a scratch file before config is imported
+os.environ["CONVERSATION_DB_PATH"] = os.path.join(
+    tempfile.mkdtemp(prefix="vessel-tests-"), "conversations.db"
+)
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
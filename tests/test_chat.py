@@ -0,0 +1,53 @@
+import asyncio
+import json
+
+import pytest
+
+import app as vessel
+from config import Config
+from services import inner_monologue, inference_scheduler, ollama_service
+
+
+@pytest.fixture
+def full_queue(monkeypatch):
+    """An inference queue that refuses every non-interactive call."""
+    monkeypatch.setattr(Config, "OLLAMA_MAX_QUEUE", 0)
+    monkeypatch.setattr(Config, "CHAT_DEBOUNCE_MS", 0)
+    real_stream_chat = ollama_service.stream_chat
+
+    def stream_chat(messages, system_prompt=None, cancel_event=None,
+                    role="reply", session_key=None):
+        if role != "reply":  # the monologue still goes through the scheduler
+            yield from real_stream_chat(
+                messages, system_prompt, cancel_event, role, session_key
+            )
+            return
+        yield "hey there"
+
+    monkeypatch.setattr(ollama_service, "stream_chat", stream_chat)
+
+
+def _events(body):
+    return [
+        json.loads(line[len("data: "):])
+        for line in body.splitlines() if line.startswith("data: ")
+    ]
+
+
+def test_chat_turn_with_full_queue_falls_back_to_default_plan(full_queue):
+    client = vessel.app.test_client()
+    response = client.post(
+        "/api/chat", json={"message": "hi", "delivery": "instant"}
+    )
+    assert response.status_code == 200
+    events = _events(response.get_data(as_text=True))
+    assert {"type": "messages", "messages": ["hey there"]} in events
+    assert events[-1] == {"type": "done"}
+
+
+def test_monologue_refused_by_scheduler_returns_default_plan(full_queue):
+    history = [{"role": "user", "content": "hi"}]
+    with pytest.raises(inference_scheduler.SchedulerBusy):
+        inference_scheduler.acquire(inference_scheduler.MONOLOGUE)
+    assert inner_monologue.think(history) == inner_monologue.default_plan()
+    assert asyncio.run(inner_monologue.athink(history)) == inner_monologue.default_plan()
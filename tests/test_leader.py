@@ -0,0 +1,25 @@
+from services import conversation_log, leader, ping_service
+
+
+def test_tracking_keeps_only_recent_messages(monkeypatch):
+    registered = {}
+    monkeypatch.setattr(
+        ping_service, "register",
+        lambda key, recent, user_turns: registered.update(
+            {key: (list(recent), user_turns)}
+        ),
+    )
+    monkeypatch.setattr(leader, "_tracked", {})
+    conversation_log.forget("t1")
+    for i in range(10):
+        conversation_log.append("t1", "message", {"role": "user", "content": f"u{i}"})
+        conversation_log.append("t1", "message", {"role": "assistant", "content": f"a{i}"})
+    leader._track("t1", 1.0)
+    for i in range(10, 15):
+        conversation_log.append("t1", "message", {"role": "user", "content": f"u{i}"})
+    leader._track("t1", 2.0)
+
+    recent, user_turns = registered["t1"]
+    assert user_turns == 15
+    assert [m["content"] for m in recent] == ["a9", "u10", "u11", "u12", "u13", "u14"]
+    assert len(leader._tracked["t1"]["recent"]) == ping_service.CONTEXT_MESSAGES
@@ -0,0 +1,22 @@
+import json
+
+from services import metrics, shared_state
+
+
+def test_cluster_gauge_is_not_per_worker(monkeypatch):
+    registry = []
+    monkeypatch.setattr(metrics, "_registry", registry)
+    metrics.gauge("t_local", "Per worker.", lambda: [({}, 1)])
+    metrics.gauge("t_shared", "Cluster wide.", lambda: [({}, 7)], cluster=True)
+
+    # Another worker publishes what _publish() would
+    monkeypatch.setattr(metrics, "_worker", lambda: "other")
+    snapshot = metrics._snapshot(registry)
+    assert "t_shared" not in snapshot
+    shared_state.publish_metrics("other", json.dumps(snapshot), 60)
+
+    monkeypatch.setattr(metrics, "_worker", lambda: "self")
+    lines = metrics.render().splitlines()
+    assert 't_local{worker="self"} 1' in lines
+    assert 't_local{worker="other"} 1' in lines
+    assert [line for line in lines if line.startswith("t_shared")] == ["t_shared 7"]
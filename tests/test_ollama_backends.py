@@ -0,0 +1,65 @@
+import json
+import threading
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import pytest
+
+from config import Config
+from services import ollama_backends, ollama_service
+
+
+def _server(status):
+    """A stand-in Ollama that answers /api/chat with `status`."""
+
+    class Handler(BaseHTTPRequestHandler):
+        def do_POST(self):
+            self.rfile.read(int(self.headers["Content-Length"]))
+            self.send_response(status)
+            self.end_headers()
+            if status == 200:
+                for line in ({"message": {"content": "hello"}, "done": False},
+                             {"message": {"content": ""}, "done": True}):
+                    self.wfile.write(json.dumps(line).encode() + b"\n")
+
+        def log_message(self, *args):
+            pass
+
+    server = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return server, f"http://127.0.0.1:{server.server_address[1]}"
+
+
+@pytest.fixture
+def backends(monkeypatch):
+    """A pool of one backend answering 500 and one that works."""
+    failing, failing_url = _server(500)
+    working, working_url = _server(200)
+    urls = [failing_url, working_url]
+    pool = [ollama_backends.Backend(url) for url in urls]
+    monkeypatch.setattr(Config, "OLLAMA_BACKENDS", urls)
+    monkeypatch.setattr(ollama_backends, "_backends", pool)
+    monkeypatch.setattr(ollama_backends, "_ensure_health_checks", lambda: None)
+    # Send the first attempt to the failing backend
+    monkeypatch.setitem(ollama_backends._affinity, ("s1", Config.OLLAMA_MODEL), failing_url)
+    yield pool
+    failing.shutdown()
+    working.shutdown()
+
+
+def test_server_error_takes_backend_out_and_retries(backends):
+    failing, working = backends
+    reply = ollama_service.chat([{"role": "user", "content": "hi"}], session_key="s1")
+    assert reply == "hello"
+    assert not failing.healthy
+    assert "500" in failing.last_error
+    assert working.healthy
+
+
+def test_affinity_is_bounded(monkeypatch):
+    monkeypatch.setattr(ollama_backends, "_affinity", ollama_backends.OrderedDict())
+    monkeypatch.setattr(ollama_backends, "_AFFINITY_MAX", 3)
+    monkeypatch.setattr(ollama_backends, "_ensure_health_checks", lambda: None)
+    for i in range(5):
+        with ollama_backends.lease("m", session_key=f"s{i}"):
+            pass
+    assert list(ollama_backends._affinity) == [("s2", "m"), ("s3", "m"), ("s4", "m")]
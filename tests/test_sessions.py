@@ -0,0 +1,41 @@
+from config import Config
+from services import conversation_log
+from services.sessions import Session
+
+
+def _contents(messages):
+    return [m["content"] for m in messages]
+
+
+def test_interleaved_writers_keep_each_others_messages(monkeypatch):
+    monkeypatch.setattr(Config, "CONVERSATION_SNAPSHOT_EVERY", 4)
+    conversation_log.forget("s1")
+    a = Session("s1")  # the worker running the turn
+    b = Session("s1")  # the worker holding the ping stream
+
+    a.add_message("user", "hi")
+    b.add_message("assistant", "PING from worker B")
+    a.add_message("assistant", "hello")
+    a.save_state()  # the fourth event: a snapshot is taken here
+    a.add_message("user", "how are you")
+
+    expected = ["hi", "PING from worker B", "hello", "how are you"]
+    assert _contents(a.history) == expected
+    messages, _, last_seq, snapshot_seq = conversation_log.load("s1")
+    assert _contents(messages) == expected
+    assert (last_seq, snapshot_seq) == (5, 4)
+
+
+def test_snapshot_is_built_from_the_log(monkeypatch):
+    monkeypatch.setattr(Config, "CONVERSATION_SNAPSHOT_EVERY", 2)
+    conversation_log.forget("s2")
+    a = Session("s2")
+    a.add_message("user", "one")
+    # Written behind this copy's back, and missing from its history
+    conversation_log.append("s2", "message", {"role": "assistant", "content": "two"})
+    a.history.clear()  # whatever this copy holds, snapshots come from the log
+    a.add_message("user", "three")
+
+    messages, _, _, snapshot_seq = conversation_log.load("s2")
+    assert snapshot_seq == 3
+    assert _contents(messages) == ["one", "two", "three"]